@@ -0,0 +1,91 @@
+# bounded command-queue: a ring of capacity preallocated slots (timestamp, command, arg-bytes in one shared
+# bytearray) between the mqtt-callback (push) and main.check_msgs (pop).
+# a flood of control-messages can not grow the heap: when full, new commands are dropped and counted per command;
+# idempotent commands (e.g. reboot) that are already queued with the same arg are coalesced instead of queued again
+
+
+class CommandQueue:
+    def __init__(self, capacity: int = 16, arg_bytes: int = 64, max_kinds: int = 8):
+        """ arg_bytes: max length of an argument (longer ones are dropped)
+        max_kinds: number of distinct commands counted in dropped - everything beyond that is counted as "other"
+        """
+        self.capacity = capacity
+        self.arg_bytes = arg_bytes
+        self.max_kinds = max_kinds
+
+        self._ts: list[int] = [0] * capacity
+        self._cmd: list[str | None] = [None] * capacity
+        self._arglen: list[int] = [-1] * capacity  # -1: no arg
+        self._args: bytearray = bytearray(capacity * arg_bytes)
+        self._head: int = 0
+        self._count: int = 0
+
+        self.dropped: dict[str, int] = {}
+        self.coalesced: int = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def count_drop(self, cmd: str) -> None:
+        """ counts a command that was not queued (also for the ones rejected before push) """
+        k: str = cmd if cmd in self.dropped or len(self.dropped) < self.max_kinds else "other"
+        self.dropped[k] = self.dropped.get(k, 0) + 1
+
+    def _same_arg(self, slot: int, msg, start: int, end: int) -> bool:
+        n: int = self._arglen[slot]
+        if n != (end - start if start < end else -1):
+            return False
+        base: int = slot * self.arg_bytes
+        for i in range(n if n > 0 else 0):
+            if self._args[base + i] != msg[start + i]:
+                return False
+        return True
+
+    def push(self, ts: int, cmd: str, msg=None, start: int = 0, end: int = 0, coalesce: bool = False) -> bool:
+        """ arg: msg[start:end] (bytes/memoryview - copied into the slot), none if start >= end
+        -> False if dropped (or coalesced)
+        """
+        if start < end and end - start > self.arg_bytes:
+            self.count_drop(cmd)
+            return False
+
+        if coalesce:
+            for k in range(self._count):
+                slot: int = (self._head + k) % self.capacity
+                if self._cmd[slot] == cmd and self._same_arg(slot, msg, start, end):
+                    self.coalesced += 1
+                    return False
+
+        if self._count >= self.capacity:
+            self.count_drop(cmd)
+            return False
+
+        slot = (self._head + self._count) % self.capacity
+        self._ts[slot] = ts
+        self._cmd[slot] = cmd
+        if start < end:
+            base: int = slot * self.arg_bytes
+            self._args[base:base + end - start] = msg[start:end]
+            self._arglen[slot] = end - start
+        else:
+            self._arglen[slot] = -1
+        self._count += 1
+        return True
+
+    def pop(self) -> tuple[int, str, str | None] | None:
+        """ -> (ts, cmd, arg) of the oldest command - None if empty """
+        if self._count == 0:
+            return None
+
+        slot: int = self._head
+        n: int = self._arglen[slot]
+        arg: str | None = None
+        if n >= 0:
+            base: int = slot * self.arg_bytes
+            arg = bytes(self._args[base:base + n]).decode("utf-8")
+
+        ret: tuple = (self._ts[slot], self._cmd[slot], arg)
+        self._cmd[slot] = None
+        self._head = (slot + 1) % self.capacity
+        self._count -= 1
+        return ret
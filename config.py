@@ -1,8 +1,11 @@
 import network
 import os
+import sys
 import ubinascii
 import logging
 
+import configschema
+
 try:
     import ujson
 except Exception as ex:
@@ -19,7 +22,7 @@ REPLACE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS: bool = True
 
 logger.debug(f"{UPDATE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS=} {REPLACE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS=}")
 
-data: dict | None = None
+data: dict | configschema.Section | None = None  # a configschema.Config once loaded
 data_local: dict | None = None
 
 def save_config():
@@ -50,36 +53,38 @@ def file_exists(filename):
         return False
 
 def update_deep(base: dict, u: dict|list|object):
+    # dicts are merged, everything else (lists included) replaces the value in base
     for k, v in u.items():
-        if isinstance(v, dict) or isinstance(v, list):
+        if isinstance(v, dict):
             base[k] = update_deep(base.get(k, {}), v)
         else:
             base[k] = v
     return base
 
 
-try:
-    with open("esp32config.json") as fp:
-        data = ujson.load(fp)
-except Exception as ex:
-    import sys
-    import io
-
-    _out = io.StringIO()
-    sys.print_exception(ex)
-    sys.print_exception(ex, _out)
+mac = ubinascii.hexlify(network.WLAN(network.STA_IF).config('mac'), ':').decode()
+mac_no_colon: str = mac.replace(':', '')
+logger.debug(f"{mac_no_colon=}")
 
-    logger.error(_out.getvalue())
+# pre-merged by tools/compile_config.py at build time (.py or .mpy): no json to parse, no overlays to merge
+# and nothing of the other devices in RAM - falls back to the json if missing or built for another MAC
+_compiled = None
+try:
+    import esp32config_compiled as _compiled
+except ImportError:
+    pass
+
+if _compiled is not None and _compiled.MAC == mac_no_colon:
+    data = _compiled.data
+    sys.modules.pop("esp32config_compiled")  # its data is built into the Config below, nothing else needs it
+    logger.info(f"{mac_no_colon=} config from esp32config_compiled")
+else:
+    if _compiled is not None:
+        logger.warning(f"esp32config_compiled is for {_compiled.MAC}, not for {mac_no_colon=} -> json")
 
-if file_exists("esp32config.local.json"):
     try:
-        with open("esp32config.local.json") as fp:
-            data_local = ujson.load(fp)
-
-            if REPLACE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS:
-                data = data_local
-            elif UPDATE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS:
-                update_deep(data, data_local)
+        with open("esp32config.json") as fp:
+            data = ujson.load(fp)
     except Exception as ex:
         import sys
         import io
@@ -90,29 +95,64 @@ if file_exists("esp32config.local.json"):
 
         logger.error(_out.getvalue())
 
-mac = ubinascii.hexlify(network.WLAN(network.STA_IF).config('mac'), ':').decode()
-mac_no_colon: str = mac.replace(':', '')
-logger.debug(f"{mac_no_colon=}")
-
-# mpremote connect /dev/ttyUSB0 mip install pprint
-# import mip
-# mip.install("pprint")
-
-
-
-if mac_no_colon in data:
-    logger.info(f"{mac_no_colon=} FOUND in config-data")
-    ndata: dict = data[mac_no_colon]
-    logger.debug("**************\n" + _pprint_format(data) + "\n***")
-
-    update_deep(data, ndata)
-
-    logger.debug("***\n"+_pprint_format(data)+"\n**************")
-else:
-    logger.info(f"{mac_no_colon=} not found in config-data")
-    logger.debug("**************\n" + _pprint_format(data) + "\n**************")
-
-if "disable_inet" in data and data["disable_inet"]:
+    if file_exists("esp32config.local.json"):
+        try:
+            with open("esp32config.local.json") as fp:
+                data_local = ujson.load(fp)
+
+                if REPLACE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS:
+                    data = data_local
+                elif UPDATE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS:
+                    update_deep(data, data_local)
+        except Exception as ex:
+            import sys
+            import io
+
+            _out = io.StringIO()
+            sys.print_exception(ex)
+            sys.print_exception(ex, _out)
+
+            logger.error(_out.getvalue())
+
+    # mpremote connect /dev/ttyUSB0 mip install pprint
+    # import mip
+    # mip.install("pprint")
+
+    if mac_no_colon in data:
+        logger.info(f"{mac_no_colon=} FOUND in config-data")
+        ndata: dict = data[mac_no_colon]
+        logger.debug("**************\n" + _pprint_format(data) + "\n***")
+
+        update_deep(data, ndata)
+
+        logger.debug("***\n"+_pprint_format(data)+"\n**************")
+    else:
+        logger.info(f"{mac_no_colon=} not found in config-data")
+        logger.debug("**************\n" + _pprint_format(data) + "\n**************")
+
+
+def apply(overlay: dict) -> None:
+    """ merges overlay into the config (like the overlay of this MAC at boot) and validates it again - for tools/
+    (a section that was dropped as not enabled comes back with just what overlay holds)
+    """
+    global data, DISABLE_INET
+    problems: list[str] = []
+    data = configschema.build(update_deep(data.to_dict(), overlay), problems)
+    for p in problems:
+        logger.warning(f"config: {p}")
+    DISABLE_INET = data.disable_inet
+
+
+# validated once, from here on only what this device runs with is kept - the json-tree is garbage now
+_problems: list[str] = []
+data = configschema.build(data, _problems)
+data_local = None
+_compiled = None
+for _p in _problems:
+    logger.warning(f"config: {_p}")
+del _problems
+
+if data.disable_inet:
     DISABLE_INET = True
 
 
@@ -0,0 +1,311 @@
+# the schema of esp32config.json: config.py checks the merged data (base + this MAC's overlay) against it once at
+# boot and keeps only what the device runs with - one Section object (__slots__, attribute access) per section:
+#
+#   config.data.mosquitto.max_inflight                  instead of config.data["mosquitto"].get("max_inflight", 8)
+#   config.data["mosquitto"].get("max_inflight", 8)     still works (dict-api of Section)
+#
+# left out: the overlays of the other MACs, unknown keys (with a warning) and the sections of hardware that is not
+# enabled (TOGGLED, with its pins and secrets) - these are all the same DISABLED section, config.data.uart.enabled is
+# False. missing keys get the default the code used to pass to .get(), keys with OPTIONAL stay unset ("x" in section).
+# micropython ignores __slots__ (the attributes live in a small map per object, still no string-keyed dict per lookup)
+
+REQUIRED = object()
+OPTIONAL = object()
+
+_WIFI: tuple = (
+    ("SSID", str, REQUIRED),
+    ("password", str, REQUIRED),
+    ("retries", int, 10),
+    ("priority", int, 0),
+    ("timeout_ms", int, OPTIONAL),
+)
+
+_DISPLAY: tuple = (
+    ("enabled", bool, False),
+    ("address", int, 60),
+    ("width", int, 128),
+    ("height", int, 64),
+    ("flip_en", bool, False),
+)
+
+# top-level keys that are not sections
+SCALARS: tuple = (
+    ("hostname", str, OPTIONAL),
+    ("hostnameprefix", str, OPTIONAL),
+    ("boot_ssd", bool, False),
+    ("disable_inet", bool, False),
+    ("get_time_per_uart", bool, False),
+    ("forcerestart_after_running_seconds", int, 0),
+)
+
+SECTIONS: dict = {
+    "webrepl": (
+        ("password", str, REQUIRED),
+    ),
+    "wifi1": _WIFI,
+    "wifi2": _WIFI,
+    "wifi3": _WIFI,
+    "wifi_cache": (
+        ("enabled", bool, False),
+        ("static_ip", bool, False),
+        ("timeout_ms", int, 3_000),
+    ),
+    "wifi_scan": (
+        ("cache_size", int, 16),
+        ("ttl_s", int, 300),
+        ("refresh_s", int, 0),
+        ("in_status", bool, False),
+    ),
+    "wifi_roaming": (
+        ("enabled", bool, False),
+        ("sample_ms", int, 2_000),
+        ("ema_alpha", float, 0.2),
+        ("roam_below_dbm", int, -75),
+        ("roam_margin_db", int, 8),
+        ("roam_hold_s", int, 30),
+        ("roam_min_interval_s", int, 300),
+    ),
+    "link_stats": (
+        ("ring_size", int, 120),
+        ("sample_every", int, 5),
+    ),
+    "mosquitto": (
+        ("MOSQUITTO_HOST", str, REQUIRED),
+        ("MOSQUITTO_PORT", int, 1883),
+        ("MOSQUITTO_USERNAME", str, OPTIONAL),
+        ("MOSQUITTO_PASSWORD", str, OPTIONAL),
+        ("max_inflight", int, 8),
+        ("rx_buffer_size", int, 512),
+        ("tx_buffer_size", int, 256),
+        ("encoding", dict, {}),
+        ("status_keyframe_every", int, 10),
+        ("persistent_session", bool, False),
+        ("protocol", int, 4),
+        ("session_expiry_s", int, 86_400),
+        ("topic_alias", list, []),
+        ("message_expiry_s", dict, {}),
+        ("retain_handling", int, 0),
+        ("command_queue_size", int, 16),
+        ("command_arg_bytes", int, 64),
+        ("lwtfeed", str, OPTIONAL),
+        ("statusfeed", str, OPTIONAL),
+        ("controlfeed", str, OPTIONAL),
+        ("loggingfeed", str, OPTIONAL),
+        ("lightswitchfeed", str, OPTIONAL),
+        ("replyfeed", str, OPTIONAL),
+        ("broadcastfeed", str, OPTIONAL),
+        ("groupfeed", str, OPTIONAL),
+        ("groups", list, []),
+        ("broadcast_max_window_s", int, 3_600),
+        ("broadcast_max_scheduled", int, 4),
+        ("light_confirm", bool, False),
+        ("rpc_timeout_ms", int, 5_000),
+        ("lat_loc1", float, OPTIONAL),
+        ("lon_loc1", float, OPTIONAL),
+        ("ele_loc1", float, OPTIONAL),
+        ("lat_loc2", float, OPTIONAL),
+        ("lon_loc2", float, OPTIONAL),
+        ("ele_loc2", float, OPTIONAL),
+    ),
+    "stagger": (
+        ("enabled", bool, False),
+        ("restart_spread_s", int, 0),
+        ("reconnect_spread_ms", int, 0),
+    ),
+    "reconnect": (
+        ("base_ms", int, 1_000),
+        ("max_ms", int, 120_000),
+        ("jitter", float, 0.5),
+        ("reset_after_s", int, 3_600),
+    ),
+    "spool": (
+        ("enabled", bool, False),
+        ("directory", str, "spool"),
+        ("segment_bytes", int, 4096),
+        ("max_segments", int, 8),
+        ("batch_bytes", int, 512),
+        ("flush_ms", int, 5_000),
+        ("default_ttl_s", int, 0),
+    ),
+    "i2c": (
+        ("enabled", bool, False),
+        ("sda_pin", int, REQUIRED),
+        ("scl_pin", int, REQUIRED),
+    ),
+    "smbus": (
+        ("enabled", bool, False),
+        ("sda", int, REQUIRED),
+        ("scl", int, REQUIRED),
+    ),
+    "ina226": (
+        ("enabled", bool, False),
+        ("shunt_ohms", float, REQUIRED),
+        ("max_expected_amps", float, REQUIRED),
+    ),
+    "adc": (
+        ("enabled", bool, False),
+        ("input_pin", int, REQUIRED),
+    ),
+    # not TOGGLED: main.run() starts rotary_loop() on its host whatever enabled says
+    "rotary": (
+        ("enabled", bool, False),
+        ("clk_pin", int, REQUIRED),
+        ("dt_pin", int, REQUIRED),
+        ("sw_pin", int, REQUIRED),
+    ),
+    "digital_output": (
+        ("enabled", bool, False),
+        ("output_pin", int, REQUIRED),
+    ),
+    "digital_input": (
+        ("enabled", bool, False),
+        ("input_pin", int, REQUIRED),
+    ),
+    # not TOGGLED: main.rotary_loop() sets up the wake-up pin before the deepsleep either way
+    "wakeup_deepsleep_pin": (
+        ("enabled", bool, False),
+        ("input_pin", int, OPTIONAL),
+        ("trigger", int, OPTIONAL),
+        ("disable_handler", bool, OPTIONAL),
+    ),
+    "pwm": (
+        ("enabled", bool, False),
+        ("output_pin", int, REQUIRED),
+    ),
+    "uart": (
+        ("enabled", bool, False),
+        ("rx_pin", int, REQUIRED),
+        ("tx_pin", int, REQUIRED),
+    ),
+    "ssd1306": _DISPLAY,
+    "sh1106": _DISPLAY,
+    "get_time_per_espnow": (
+        ("enabled", bool, False),
+    ),
+    "espnow": (
+        ("channel", int, REQUIRED),
+        ("pmk", str, REQUIRED),
+        ("peers", dict, {}),
+    ),
+}
+
+# section -> the section whose "enabled" decides whether it is kept (missing: not enabled)
+TOGGLED: dict = {
+    "spool": "spool",
+    "i2c": "i2c",
+    "smbus": "smbus",
+    "ina226": "ina226",
+    "adc": "adc",
+    "digital_output": "digital_output",
+    "digital_input": "digital_input",
+    "pwm": "pwm",
+    "uart": "uart",
+    "ssd1306": "ssd1306",
+    "sh1106": "sh1106",
+    "get_time_per_espnow": "get_time_per_espnow",
+    "espnow": "get_time_per_espnow",
+}
+
+
+class Section:
+    """ attribute access + the (read-mostly) dict-api the code was written against """
+    __slots__ = ()
+
+    # only the fields: "get" in section would otherwise find the method (a class attribute)
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key: str, value) -> None:
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self) -> list[str]:
+        return [k for k in self.__slots__ if hasattr(self, k)]
+
+    def items(self) -> list[tuple]:
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    def to_dict(self) -> dict:
+        return {k: v.to_dict() if isinstance(v, Section) else v for k, v in self.items()}
+
+
+def _class(name: str, fields: tuple) -> type:
+    return type(name, (Section,), {"__slots__": tuple([f[0] for f in fields])})
+
+
+_classes: dict = {}  # id(fields) -> class (the wifiN / display sections share theirs)
+for _name, _fields in SECTIONS.items():
+    if id(_fields) not in _classes:
+        _classes[id(_fields)] = _class(_name, _fields)
+
+Config: type = _class("Config", SCALARS + tuple([(n, Section, OPTIONAL) for n in SECTIONS]))
+
+DISABLED: Section = _class("disabled", (("enabled", bool, False),))()
+DISABLED.enabled = False
+
+
+def is_mac(key: str) -> bool:
+    """ same as tools/compile_config.is_mac() """
+    return len(key) >= 12 and all([c in "0123456789abcdef" for c in key])
+
+
+def _is(v, t: type) -> bool:
+    return isinstance(v, t) or (t is float and isinstance(v, int))
+
+
+def _fill(s: Section, fields: tuple, d: dict, path: str, problems: list[str]) -> Section:
+    names: list[str] = []
+    for name, t, default in fields:
+        names.append(name)
+        v = d.get(name, default)
+        if v is not default and not _is(v, t):
+            problems.append(f"{path}{name}: {v!r} is not {t.__name__} -> ignored")
+            v = default
+        if v is REQUIRED:
+            problems.append(f"{path}{name} is missing")
+        elif v is not OPTIONAL:
+            setattr(s, name, v)
+
+    for k in d:
+        if k not in names and not (path == "" and is_mac(k)):
+            problems.append(f"{path}{k} is unknown -> ignored")
+    return s
+
+
+def _enabled(data: dict, section: str) -> bool:
+    d = data.get(section)
+    return isinstance(d, dict) and d.get("enabled", False) is True
+
+
+def build(data: dict, problems: list[str]) -> Section:
+    """ the merged config -> Config (what it found wrong is appended to problems) """
+    root: Section = _fill(Config(), SCALARS, {k: v for k, v in data.items() if k not in SECTIONS}, "", problems)
+
+    for name, fields in SECTIONS.items():
+        d = data.get(name)
+        if d is not None and not isinstance(d, dict):
+            problems.append(f"{name}: {d!r} is not a section -> ignored")
+            d = None
+
+        if name in TOGGLED and not _enabled(data, TOGGLED[name]):
+            setattr(root, name, DISABLED)
+        elif d is not None:
+            setattr(root, name, _fill(_classes[id(fields)](), fields, d, name + ".", problems))
+        elif REQUIRED not in [f[2] for f in fields]:
+            # defaults only: config.data.wifi_cache.enabled etc. work without the section in the json
+            setattr(root, name, _fill(_classes[id(fields)](), fields, {}, name + ".", problems))
+
+    return root
@@ -0,0 +1,194 @@
+# store-and-forward for publishes while the broker is not reachable: an append-only, size-bounded ring of
+# segment-files on the flash filesystem (<directory>/<segment-no>.q). records are collected in RAM and written in
+# batches (one open/append/close per segment and batch) and drained oldest-first after the next connect.
+# a segment-file is only removed after all of its qos1-records were acked -> at-least-once.
+#
+# record: magic(1) flags(1: bit0 qos, bit1 retain) topic_len(2) msg_len(2) expires_at(4, unix-epoch, 0 = never)
+#         topic msg
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+import os
+import time
+
+import mqttcodec
+
+_MAGIC: int = 0xA5
+_HEADER: str = "!BBHHI"
+_HEADER_SIZE: int = struct.calcsize(_HEADER)
+
+
+def _dir_exists(path: str) -> bool:
+    try:
+        return (os.stat(path)[0] & 0x4000) != 0
+    except OSError:
+        return False
+
+
+def _clock_ok() -> bool:
+    # before ntp the clock of the esp32 starts in 2000 - expiry-dates computed from that would be meaningless
+    f = getattr(time, "get_had_proper_time_set", None)
+    return f is None or f()
+
+
+class FlashQueue:
+    def __init__(self, directory: str = "spool", segment_bytes: int = 4096, max_segments: int = 8,
+                 batch_bytes: int = 512, flush_ms: int = 5_000):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.batch_bytes = batch_bytes
+        self.flush_ms = flush_ms
+
+        self._batch: list[bytes] = []
+        self._batch_size: int = 0
+        self._batch_since: int = 0
+
+        self.draining: bool = False
+        self._reading: int | None = None
+
+        self.appended: int = 0
+        self.drained: int = 0
+        self.expired: int = 0
+        self.dropped: int = 0  # too big for a segment / lost with an overwritten segment (counted per segment)
+        self.corrupt: int = 0
+
+        if not _dir_exists(directory):
+            os.mkdir(directory)
+
+        self._segs: list[int] = sorted([int(n[:-2]) for n in os.listdir(directory) if n.endswith(".q")])
+        self._wsize: int = os.stat(self._path(self._segs[-1]))[6] if self._segs else 0
+
+    def _path(self, seg: int) -> str:
+        return f"{self.directory}/{seg:08d}.q"
+
+    def pending(self) -> bool:
+        return bool(self._batch) or bool(self._segs)
+
+    def append(self, topic: str | bytes, msg: str | bytes | bytearray | memoryview, qos: int = 1,
+               retain: bool = False, ttl_s: int = 0) -> bool:
+        t: bytes = topic.encode() if isinstance(topic, str) else bytes(topic)
+        m: bytes = msg.encode() if isinstance(msg, str) else bytes(msg)  # msg may be a view into a reused buffer
+
+        n: int = _HEADER_SIZE + len(t) + len(m)
+        if n > self.segment_bytes:
+            self.dropped += 1
+            return False
+
+        expires_at: int = mqttcodec.unix_time() + ttl_s if ttl_s > 0 and _clock_ok() else 0
+        rec: bytes = struct.pack(_HEADER, _MAGIC, (qos & 1) | (0x02 if retain else 0), len(t), len(m), expires_at) + t + m
+
+        if not self._batch:
+            self._batch_since = time.ticks_ms()
+        self._batch.append(rec)
+        self._batch_size += n
+        self.appended += 1
+
+        if self._batch_size >= self.batch_bytes:
+            self.flush()
+        return True
+
+    def flush_if_due(self) -> None:
+        if self._batch and time.ticks_diff(time.ticks_ms(), self._batch_since) >= self.flush_ms:
+            self.flush()
+
+    def _roll(self) -> None:
+        self._segs.append(self._segs[-1] + 1 if self._segs else 0)
+        self._wsize = 0
+
+        while len(self._segs) > self.max_segments:
+            # overwrite the oldest - but not the one that is being drained right now
+            victim: int = self._segs[1] if self._segs[0] == self._reading else self._segs[0]
+            self._segs.remove(victim)
+            os.remove(self._path(victim))
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """ RAM-batch -> flash """
+        if not self._batch:
+            return
+
+        if not self._segs or self._segs[-1] == self._reading:
+            self._roll()
+
+        f = None
+        try:
+            for rec in self._batch:
+                if self._wsize + len(rec) > self.segment_bytes:
+                    if f is not None:
+                        f.close()
+                        f = None
+                    self._roll()
+
+                if f is None:
+                    f = open(self._path(self._segs[-1]), "ab")
+                f.write(rec)
+                self._wsize += len(rec)
+        finally:
+            if f is not None:
+                f.close()
+
+        self._batch = []
+        self._batch_size = 0
+
+    async def drain(self, client, ack_timeout_ms: int = 30_000) -> int:
+        """ publishes everything (oldest first) via client (MQTTClient) - raises if the connection goes away in between.
+        publishes arriving meanwhile should be appended (see draining) to keep the order
+        -> number of published records
+        """
+        sent: int = 0
+        self.draining = True
+        try:
+            while True:
+                self.flush()
+                if not self._segs:
+                    return sent
+
+                seg: int = self._segs[0]
+                self._reading = seg
+                sent += await self._drain_segment(client, seg)
+
+                if not await client.flush(ack_timeout_ms):
+                    return sent  # the segment stays -> sent again next time
+
+                self._segs.remove(seg)
+                os.remove(self._path(seg))
+                if not self._segs:
+                    self._wsize = 0
+        finally:
+            self._reading = None
+            self.draining = False
+
+    async def _drain_segment(self, client, seg: int) -> int:
+        sent: int = 0
+        now: int = mqttcodec.unix_time() if _clock_ok() else 0
+
+        with open(self._path(seg), "rb") as f:
+            while True:
+                hdr: bytes = f.read(_HEADER_SIZE)
+                if len(hdr) < _HEADER_SIZE:
+                    break
+
+                magic, flags, tl, ml, expires_at = struct.unpack(_HEADER, hdr)
+                if magic != _MAGIC:
+                    self.corrupt += 1
+                    break
+
+                t: bytes = f.read(tl)
+                m: bytes = f.read(ml)
+                if len(m) < ml:  # torn write (power loss)
+                    self.corrupt += 1
+                    break
+
+                if expires_at and now and expires_at < now:
+                    self.expired += 1
+                    continue
+
+                await client.publish(t, m, retain=bool(flags & 0x02), qos=flags & 0x01, wait=False)
+                sent += 1
+
+        self.drained += sent
+        return sent
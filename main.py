@@ -16,81 +16,80 @@ import time
 import math
 from time import sleep
 
-from machine import Timer
 import machine
 
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
 import mqttwrap
 import wifi
 import config
+import reconnect
 
 MEASURE_TELE_PERIOD: int = 300
 
-if not config.DISABLE_INET:
-    wifi.ensure_wifi()
-    mqttwrap.ensure_mqtt_connect()
-
-msgtimer: Timer = Timer(0)
-lightdowntimer: Timer = Timer(1)
-reboottimer: Timer = Timer(2)
-# esp32: four hardware-timers available
+CHECK_MSGS_PERIOD_MS: int = 3_000
+COUNTDOWN_PERIOD_MS: int = 1_000
 
-import _thread
+# scheduling-lag of the event-loop (how late a sleep_ms(LAG_MONITOR_PERIOD_MS) wakes up)
+LAG_MONITOR_PERIOD_MS: int = 100
+LAG_MONITOR_REPORT_MS: int = 60_000
+loop_lag_max_ms: int = 0
 
-lock = _thread.allocate_lock()
+# one asyncio-loop instead of hardware-timers + micropython.schedule + _thread-lock
+# tasks are cooperative, so there is nothing left to lock against
+_tasks: list = []
 
+_reconnect: reconnect.ReconnectController | None = None
 
-def reboot_callback(trigger):
-    micropython.schedule(reboot_trigger, None)
 
-
-def reboot_trigger(_=None):
+async def reboot_trigger(_=None):
     timestring: str = time.getisotimenow()
     logger.info(f"{timestring}::rebooting...")
-    mqttwrap.publish_one(
-        topic=mqttwrap.get_feed("loggingfeed"),
-        msg=f"rebooting at {timestring}",
-        retain=True,
-        qos=1,
-    )
-    time.sleep(1)
+    try:
+        await mqttwrap.publish_one(
+            topic=mqttwrap.feed("loggingfeed"),
+            msg=f"rebooting at {timestring}",
+            retain=True,
+            qos=1,
+        )
+    except Exception as ex:
+        logger.error(f"could not publish reboot-message: {ex!r}")
+    await asyncio.sleep(1)
+    mqttwrap.flush_spool()
     machine.reset()
 
 
-def check_msgs(_=None):
-    global lock
-
+async def check_msgs(_=None):
     if config.DISABLE_INET:
         return
 
     # logger.debug("check_msgs")
 
-    if lock.locked():
-        logger.debug("LOCKED...")
-
     try:
-        with lock:
-            wifi.ensure_wifi_catch_reset(reset_if_wifi_fails=True)
-            mqttwrap.ensure_mqtt_catch_reset(reset_if_mqtt_fails=True)
-
-            mqttwrap.check_msgs()
-
-            ts_cmd_arg: tuple[int, str, str | None] | None = None
-
-            while True:
-                ts_cmd_arg = mqttwrap.pop_cmd_received()
-                if ts_cmd_arg is None:
-                    break
-
-                cmd: str = ts_cmd_arg[1]
-                if cmd == "reboot" or cmd == "reset":
-                    logger.info("reboot command received...")
-                    reboot_trigger()
-                elif cmd == "switchap":
-                    logger.info("switchap command received...")
-                elif cmd == "rescanwifi":
-                    logger.info("rescanwifi command received...")
-                else:
-                    logger.warning(f"unknown command: {cmd} arg={ts_cmd_arg[2]}")
+        # while offline the reconnect-controller is busy - publishes are spooled in the meantime
+        mqttwrap.flush_spool_if_due()
+        if mqttwrap.is_online():
+            await mqttwrap.check_msgs()
+
+        # fleet-commands whose slot in the execution-window has come join the queue (also while offline)
+        mqttwrap.run_due_broadcasts()
+
+        ts_cmd_arg: tuple[int, str, str | None] | None = None
+
+        while True:
+            ts_cmd_arg = mqttwrap.pop_cmd_received()
+            if ts_cmd_arg is None:
+                break
+
+            cmd: str = ts_cmd_arg[1]
+            handler = mqttwrap.command_handler(cmd)
+            if handler is None:
+                logger.warning(f"unknown command: {cmd} arg={ts_cmd_arg[2]}")
+            else:
+                await handler(ts_cmd_arg[2])
     except Exception as ex:
         _out = io.StringIO()
         sys.print_exception(ex)
@@ -99,10 +98,75 @@ def check_msgs(_=None):
         logger.error(_out.getvalue())
 
 
-def check_msgs_callback(trigger):
-    # logger.debug(f"{type(trigger)=} {trigger=}")
-    # DEBUG:__main__:type(trigger)=<class 'Timer'> trigger=Timer(0, mode=PERIODIC, period=3000)
-    micropython.schedule(check_msgs, None)
+async def cmd_reboot(arg: str | None) -> None:
+    logger.info("reboot command received...")
+    await reboot_trigger()
+
+
+async def cmd_switchap(arg: str | None) -> None:
+    logger.info("switchap command received...")
+
+
+async def cmd_rescanwifi(arg: str | None) -> None:
+    logger.info("rescanwifi command received...")
+    n: int = wifi.scan_cache.refresh()
+    logger.info(f"{n} networks in range")
+    if config.data.wifi_scan.in_status:
+        await mqttwrap.send_status_to_mosquitto(include_wifi_scan=True)
+
+
+def register_commands() -> None:
+    mqttwrap.register_command("reboot", cmd_reboot, idempotent=True)
+    mqttwrap.register_command("reset", cmd_reboot, idempotent=True)
+    mqttwrap.register_command("switchap", cmd_switchap)
+    mqttwrap.register_command("rescanwifi", cmd_rescanwifi, idempotent=True)
+
+
+async def run_every(period_ms: int, func) -> None:
+    # deadline-based, so the period does not drift by the runtime of func
+    deadline: int = time.ticks_ms()
+    while True:
+        try:
+            await func()
+        except Exception as ex:
+            _out = io.StringIO()
+            sys.print_exception(ex)
+            sys.print_exception(ex, _out)
+
+            logger.error(_out.getvalue())
+
+        deadline = time.ticks_add(deadline, period_ms)
+        delay: int = time.ticks_diff(deadline, time.ticks_ms())
+        if delay < 0:
+            # overran -> do not try to catch up with a burst
+            deadline = time.ticks_ms()
+            delay = 0
+
+        await asyncio.sleep_ms(delay)
+
+
+async def reboot_after(seconds: int) -> None:
+    await asyncio.sleep(seconds)
+    await reboot_trigger()
+
+
+async def lag_monitor() -> None:
+    global loop_lag_max_ms
+
+    last_report: int = time.ticks_ms()
+    while True:
+        t0: int = time.ticks_ms()
+        await asyncio.sleep_ms(LAG_MONITOR_PERIOD_MS)
+        now: int = time.ticks_ms()
+
+        lag: int = time.ticks_diff(now, t0) - LAG_MONITOR_PERIOD_MS
+        if lag > loop_lag_max_ms:
+            loop_lag_max_ms = lag
+
+        if time.ticks_diff(now, last_report) >= LAG_MONITOR_REPORT_MS:
+            logger.debug(f"event-loop lag: max={loop_lag_max_ms}ms in the last {LAG_MONITOR_REPORT_MS}ms")
+            loop_lag_max_ms = 0
+            last_report = now
 
 
 ############################# end of boilerplate #############################
@@ -306,34 +370,48 @@ def setup_pins():
             uart2.init(timeout=5_000, timeout_char=100)
 
 
-def setup():
-    global msgtimer, lightdowntimer
+def make_reconnect_controller() -> reconnect.ReconnectController:
+    rc: dict = config.data.get("reconnect", {})
+
+    def _backoff() -> reconnect.Backoff:
+        return reconnect.Backoff(
+            base_ms=rc.get("base_ms", 1_000), max_ms=rc.get("max_ms", 120_000), jitter=rc.get("jitter", 0.5)
+        )
+
+    return reconnect.ReconnectController(
+        layers=[
+            reconnect.Layer("wifi", wifi.isconnected, wifi.connect_wifi, _backoff(), timeout_ms=60_000),
+            reconnect.Layer("mqtt", mqttwrap.is_connected, mqttwrap.connect_socket, _backoff()),
+            reconnect.Layer("session", mqttwrap.is_online, mqttwrap.setup_session, _backoff()),
+        ],
+        reset_after_s=rc.get("reset_after_s", 3_600),
+        on_give_up=reboot_trigger,  # the last resort
+        stagger_ms=mqttwrap.stagger_offset(config.data.get("stagger", {}).get("reconnect_spread_ms", 0), "reconnect"),
+    )
+
+
+async def setup():
+    global _reconnect
 
     logger.debug("main::setup()")
 
-    check_msgs()
+    if not config.DISABLE_INET:
+        register_commands()
+        _reconnect = make_reconnect_controller()
+        _tasks.append(asyncio.create_task(_reconnect.run()))
+        _tasks.append(asyncio.create_task(wifi.manager.run()))
 
     setup_pins()
 
-    msgtimer.init(
-        period=3_000, mode=machine.Timer.PERIODIC, callback=check_msgs_callback
-    )
+    if not config.DISABLE_INET:
+        _tasks.append(asyncio.create_task(run_every(CHECK_MSGS_PERIOD_MS, check_msgs)))
 
-    lightdowntimer.init(
-        period=1_000, mode=machine.Timer.PERIODIC, callback=timer_callback
-        #lambda x: logger.info("CALLED_MEASURE_TIMER_CALLBACK")
-    )
+    _tasks.append(asyncio.create_task(run_every(COUNTDOWN_PERIOD_MS, timer_tick)))
+    _tasks.append(asyncio.create_task(lag_monitor()))
 
-    if config.data["forcerestart_after_running_seconds"] > 0:
-        reboottimer.init(
-            period=config.data["forcerestart_after_running_seconds"] * 1000,
-            mode=machine.Timer.ONE_SHOT,
-            callback=reboot_callback,
-        )
-
-    # tim2 = Timer(-1)
-    # tim2.init(period=30000, mode=Timer.PERIODIC, callback=lambda t: mqttclient.ping())
-    # tim.deinit()
+    if mqttwrap.forcerestart_after_s() > 0:
+        # staggered per device - a fleet powered on together would otherwise reboot together every day
+        _tasks.append(asyncio.create_task(reboot_after(mqttwrap.forcerestart_after_s())))
 
 
 # outpin: machine.Pin = machine.Pin(16, machine.Pin.OPEN_DRAIN)  #, pull=machine.Pin.PULL_UP)
@@ -354,7 +432,7 @@ timerdeadline = None
 timerleft: int|None = None
 deepsleeptimerleft: int|None = None
 
-def timer_tick(_=None):
+async def timer_tick(_=None):
     global timerleft, timerdeadline, deepsleepdeadline, deepsleeptimerleft, ssd
     
     if timerdeadline is not None:
@@ -363,7 +441,7 @@ def timer_tick(_=None):
         logger.debug(f"td: {td}\ttimerleft: {timerleft}\tis_deepsleepdeadline=False")
         
         if timerleft <= 0:
-            send_light(0)
+            await send_light(0)
             timerleft = None
             timerdeadline = None
             
@@ -378,27 +456,52 @@ def timer_tick(_=None):
         if deepsleeptimerleft <= 0:
             rotary_simple.shutdown = True
 
-def timer_callback(trigger):
-    # logger.debug(f"{type(trigger)=} {trigger=}")
-    # DEBUG:__main__:type(trigger)=<class 'Timer'> trigger=Timer(0, mode=PERIODIC, period=3000)
-    micropython.schedule(timer_tick, None)
-    
-    
-def send_light(value: int = 33):
+
+async def send_light(value: int = 33, confirm: bool | None = None):
+    """ confirm: wait for the reply of the responder (node-red) and show it - None: mosquitto.light_confirm """
     timestring: str = time.getisotimenow()
     logger.info(f"{timestring}::send_light...")
     
-    logger.info(f"sende {value=} an: {mqttwrap.get_feed('lightswitchfeed')}")
-        
-    mqttwrap.publish_one(
-        topic=mqttwrap.get_feed("lightswitchfeed"),
-        msg=mqttwrap.value_to_mqtt_string(value),
+    f: mqttwrap.Feed = mqttwrap.feed("lightswitchfeed")
+    logger.info(f"sende {value=} an: {f.topic} ({f.encoding})")
+
+    if confirm is None:
+        confirm = config.data.mosquitto.light_confirm
+
+    if confirm and mqttwrap.is_online():
+        t0: int = time.ticks_ms()
+        try:
+            reply: dict = await mqttwrap.rpc_call(
+                f, value, method="light", retain=True,
+                timeout_ms=config.data.mosquitto.rpc_timeout_ms,
+            )
+            show_light_result(f"LIGHT {'OK' if reply.get('ok') else 'ERR'} {time.ticks_diff(time.ticks_ms(), t0)}ms")
+        except Exception as ex:
+            logger.error(f"send_light: {ex!r}")
+            show_light_result("LIGHT: NO REPLY")
+        return
+
+    await mqttwrap.publish_one(
+        topic=f,
+        msg=mqttwrap.feed_payload(f, value),
         retain=True,
         qos=1,
     )    
 
+
+def show_light_result(text: str) -> None:
+    logger.info(text)
+    if ssd is None:
+        return
+
+    x: int = 0
+    y: int = 36
+    ssd.fill_rect(x, y, ssd.width, 8, 0)
+    ssd.text(text, x, y, 1)
+    ssd.show()
+
 rotary_value: int | None = None
-def handle_rotary_click(pin: machine.Pin, threshold_ms: int = 20) -> None:
+async def handle_rotary_click(pin: machine.Pin, threshold_ms: int = 20) -> None:
     global pin_low, ssd, rotary_value, timerdeadline, timerleft, deepsleepdeadline, deepsleeptimerleft
 
     conseq: int = 0
@@ -406,7 +509,7 @@ def handle_rotary_click(pin: machine.Pin, threshold_ms: int = 20) -> None:
     last_value: int = pin.value()
     while conseq < threshold_ms:
         loopcount += 1
-        time.sleep_ms(1)
+        await asyncio.sleep_ms(1)
         cur_value: int = pin.value()
 
         if last_value == cur_value:
@@ -432,7 +535,7 @@ def handle_rotary_click(pin: machine.Pin, threshold_ms: int = 20) -> None:
             timerdeadline = time.ticks_add(time.ticks_ms(), rotary_value * 1_000 * 60)
             # timerdeadline in MINUTEN !!!
             logger.debug(f"timerdeadline set to: {timerdeadline}")
-            timer_tick()
+            await timer_tick()
     
 
 def handle_rotary_change(new_value: int, old_value: int):
@@ -490,7 +593,7 @@ def handle_rotary_loop(cur_value: int|None):
     logger.debug(f"handle_rotary_loop::{cur_value=} {lastpaint=}")
 
 
-def rotary_loop():
+async def rotary_loop():
     global pin_low, ssd, rotary_value, wakeup_deepsleep_pin
     
     from rotary_irq_esp import RotaryIRQ
@@ -511,7 +614,7 @@ def rotary_loop():
     y += 8
     ssd.show()
 
-    rotary_simple.rotary_loop(
+    await rotary_simple.rotary_loop(
         pin_num_clk=config.data["rotary"]["clk_pin"],
         pin_num_dt=config.data["rotary"]["dt_pin"],
         pin_num_sw=config.data["rotary"]["sw_pin"],
@@ -528,6 +631,11 @@ def rotary_loop():
     logger.debug("AFTER ROTARY LOOP!")
     ## TODO esp shutdown here!
     config.DISABLE_INET = True
+
+    # no reconnecting anymore - and keep the mqtt-session (RTC-memory) for the wake-up
+    for t in _tasks:
+        t.cancel()
+    await mqttwrap.prepare_deepsleep()
             
     logger.debug("DISABLING INET AND WIFI...")
     wifi.wlan.disconnect()
@@ -553,10 +661,18 @@ def rotary_loop():
 
 
 
-if __name__ == "__main__":
-    setup()
+async def run():
+    await setup()
     
     logger.info(f"HOSTNAME: {config.data['hostname']}")
 
     if config.data["hostname"] == "josolightesp32":
-        rotary_loop()
+        await rotary_loop()
+
+    # nothing in the foreground -> just keep the background-tasks running
+    while True:
+        await asyncio.sleep(3600)
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -11,17 +11,22 @@ logger.debug("STARTING main.py")
 import time
 import machine
 
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
 import mqttwrap
 import wifi
 import config
 
 MEASURE_TELE_PERIOD: int = 300
 
-if not config.DISABLE_INET:
-    wifi.ensure_wifi()
-    mqttwrap.ensure_mqtt_connect()
-    
-def sende_test():
+async def sende_test():
+    if not config.DISABLE_INET:
+        wifi.ensure_wifi()
+        await mqttwrap.ensure_mqtt_connect()
+
     timestring: str = time.getisotimenow()
     logger.info(f"{timestring}::sende_test...")
     
@@ -29,7 +34,7 @@ def sende_test():
     
     value = 33
     
-    mqttwrap.publish_one(
+    await mqttwrap.publish_one(
         topic=mqttwrap.get_feed("lightswitchfeed"),
         msg=mqttwrap.value_to_mqtt_string(value),
         retain=True,
@@ -40,4 +45,4 @@ def sende_test():
 if __name__ == "__main__":
     print("WOOHOO")
     
-    sende_test()
\ No newline at end of file
+    asyncio.run(sende_test())
\ No newline at end of file
@@ -0,0 +1,303 @@
+# compact payload encodings for the mqtt feeds (selected per feed: mosquitto.encoding in esp32config.json)
+#   json   - {"lat": .., "lon": .., "ele": .., "created_at": "<iso>", "value": ..} (see mqttwrap.PayloadTemplate)
+#   cbor   - the same document as CBOR (RFC 8949), created_at as epoch-seconds (tag 1)
+#   packed - fixed struct layouts (below), created_at as epoch-seconds, static lat/lon/ele are left out
+#
+# plain python without micropython-only imports, so the host-side decoder (tools/decode_feed.py) can use it as well.
+# all epoch-seconds are unix-epoch (1970) - the esp32 counts from 2000, see unix_time()
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+import time
+
+ENCODINGS: tuple = ("json", "cbor", "packed")
+
+# first byte of a packed payload - invalid as first byte of json ("{") and of cbor (0xfe is reserved there)
+PACKED_MAGIC: int = 0xFE
+
+PACKED_KIND_INT: int = 1
+PACKED_KIND_STATUS: int = 2
+PACKED_KIND_FLOAT: int = 3
+
+# magic, kind, created_at, value
+_PACKED_INT: str = "!BBIi"
+_PACKED_FLOAT: str = "!BBIf"
+# magic, kind, created_at, runtime_seconds, reboot_pending_in, rssi, channel, rx_dropped_oversize,
+# ip, subnet, gateway, dns, mac - followed by ssid and hostname (each: 1 byte length + utf-8)
+_PACKED_STATUS: str = "!BBIIibBH4s4s4s4s6s"
+
+_RSSI_NONE: int = -128
+
+_EPOCH_OFFSET: int = 946_684_800 if time.gmtime(0)[0] == 2000 else 0
+
+
+def unix_time() -> int:
+    return int(time.time()) + _EPOCH_OFFSET
+
+
+############################# cbor #############################
+
+def _cbor_head(out: bytearray, major: int, n: int) -> None:
+    m: int = major << 5
+    if n < 24:
+        out.append(m | n)
+    elif n < 0x100:
+        out.append(m | 24)
+        out.append(n)
+    elif n < 0x10000:
+        out.append(m | 25)
+        out += struct.pack("!H", n)
+    elif n < 0x100000000:
+        out.append(m | 26)
+        out += struct.pack("!I", n)
+    else:
+        out.append(m | 27)
+        out += struct.pack("!Q", n)
+
+
+def _cbor_encode(out: bytearray, o) -> None:
+    if o is None:
+        out.append(0xF6)
+    elif o is True:
+        out.append(0xF5)
+    elif o is False:
+        out.append(0xF4)
+    elif isinstance(o, int):
+        if o >= 0:
+            _cbor_head(out, 0, o)
+        else:
+            _cbor_head(out, 1, -1 - o)
+    elif isinstance(o, float):
+        # single precision - that is all the esp32-port of micropython has anyway
+        out.append(0xFA)
+        out += struct.pack("!f", o)
+    elif isinstance(o, str):
+        b: bytes = o.encode()
+        _cbor_head(out, 3, len(b))
+        out += b
+    elif isinstance(o, (bytes, bytearray)):
+        _cbor_head(out, 2, len(o))
+        out += o
+    elif isinstance(o, (list, tuple)):
+        _cbor_head(out, 4, len(o))
+        for i in o:
+            _cbor_encode(out, i)
+    elif isinstance(o, dict):
+        _cbor_head(out, 5, len(o))
+        for k, v in o.items():
+            _cbor_encode(out, k)
+            _cbor_encode(out, v)
+    else:
+        raise TypeError(f"cannot cbor-encode {type(o)}")
+
+
+def cbor_dumps(o) -> bytes:
+    out: bytearray = bytearray()
+    _cbor_encode(out, o)
+    return bytes(out)
+
+
+def _cbor_decode(b, pos: int) -> tuple:
+    ib: int = b[pos]
+    major: int = ib >> 5
+    info: int = ib & 0x1F
+    pos += 1
+
+    if major == 7:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info == 22 or info == 23:
+            return None, pos
+        if info == 25:
+            return _half_to_float(b[pos] << 8 | b[pos + 1]), pos + 2
+        if info == 26:
+            return struct.unpack("!f", bytes(b[pos:pos + 4]))[0], pos + 4
+        if info == 27:
+            return struct.unpack("!d", bytes(b[pos:pos + 8]))[0], pos + 8
+        raise ValueError(f"unsupported cbor simple value {info}")
+
+    if info < 24:
+        n: int = info
+    elif info == 24:
+        n = b[pos]
+        pos += 1
+    elif info == 25:
+        n = struct.unpack("!H", bytes(b[pos:pos + 2]))[0]
+        pos += 2
+    elif info == 26:
+        n = struct.unpack("!I", bytes(b[pos:pos + 4]))[0]
+        pos += 4
+    elif info == 27:
+        n = struct.unpack("!Q", bytes(b[pos:pos + 8]))[0]
+        pos += 8
+    else:
+        raise ValueError("indefinite-length cbor is not supported")
+
+    if major == 0:
+        return n, pos
+    if major == 1:
+        return -1 - n, pos
+    if major == 2:
+        return bytes(b[pos:pos + n]), pos + n
+    if major == 3:
+        return bytes(b[pos:pos + n]).decode(), pos + n
+    if major == 4:
+        ret: list = []
+        for _ in range(n):
+            v, pos = _cbor_decode(b, pos)
+            ret.append(v)
+        return ret, pos
+    if major == 5:
+        d: dict = {}
+        for _ in range(n):
+            k, pos = _cbor_decode(b, pos)
+            v, pos = _cbor_decode(b, pos)
+            d[k] = v
+        return d, pos
+
+    # major 6: tag -> the tagged value itself (tag 1 = epoch-seconds stays an int)
+    return _cbor_decode(b, pos)
+
+
+def _half_to_float(h: int) -> float:
+    exp: int = (h >> 10) & 0x1F
+    mant: int = h & 0x3FF
+    if exp == 0:
+        val: float = mant * 2 ** -24
+    elif exp == 31:
+        val = float("inf") if mant == 0 else float("nan")
+    else:
+        val = (mant + 1024) * 2 ** (exp - 25)
+    return -val if h & 0x8000 else val
+
+
+def cbor_loads(b):
+    return _cbor_decode(b, 0)[0]
+
+
+def cbor_document(base: dict, value, created_at: int | None = None) -> bytes:
+    """ base-data (lat/lon/ele) + created_at (tag 1, epoch) + value """
+    out: bytearray = bytearray()
+    _cbor_head(out, 5, len(base) + 2)
+    for k, v in base.items():
+        _cbor_encode(out, k)
+        _cbor_encode(out, v)
+
+    _cbor_encode(out, "created_at")
+    _cbor_head(out, 6, 1)
+    _cbor_encode(out, unix_time() if created_at is None else created_at)
+
+    _cbor_encode(out, "value")
+    _cbor_encode(out, value)
+    return bytes(out)
+
+
+############################# packed #############################
+
+def _ip4(s: str | None) -> bytes:
+    if not s:
+        return b"\0\0\0\0"
+    return bytes([int(p) for p in s.split(".")])
+
+
+def _ip4_str(b: bytes) -> str:
+    return ".".join([str(i) for i in b])
+
+
+def _short_str(s: str | None) -> bytes:
+    b: bytes = (s or "").encode()[:255]
+    return bytes((len(b),)) + b
+
+
+def pack(value, created_at: int | None = None) -> bytes:
+    """ int/float-values or a status-dict (see mqttwrap.send_status_to_mosquitto) -> ValueError for anything else """
+    if created_at is None:
+        created_at = unix_time()
+
+    if type(value) is int:
+        # "i": micropython's struct would silently truncate what does not fit
+        if not -0x80000000 <= value <= 0x7FFFFFFF:
+            raise ValueError(f"{value} does not fit the packed int")
+        return struct.pack(_PACKED_INT, PACKED_MAGIC, PACKED_KIND_INT, created_at, value)
+
+    if isinstance(value, float):
+        return struct.pack(_PACKED_FLOAT, PACKED_MAGIC, PACKED_KIND_FLOAT, created_at, value)
+
+    if isinstance(value, dict) and "wifi" in value:
+        w: dict = value["wifi"]
+        wc: dict = w.get("config") or {}
+        rssi: int | None = w.get("strength")
+        mac: str = (wc.get("mac") or "00:00:00:00:00:00").replace(":", "")
+
+        return struct.pack(
+            _PACKED_STATUS, PACKED_MAGIC, PACKED_KIND_STATUS, created_at,
+            value.get("runtime_seconds", 0),
+            value.get("reboot_pending_in", -1),
+            _RSSI_NONE if rssi is None else max(-127, min(127, rssi)),
+            wc.get("channel") or 0,
+            min(0xFFFF, (value.get("mqtt") or {}).get("rx_dropped_oversize", 0)),
+            _ip4(w.get("ip")), _ip4(w.get("subnet")), _ip4(w.get("gateway")), _ip4(w.get("dns")),
+            binascii.unhexlify(mac),
+        ) + _short_str(wc.get("ssid")) + _short_str(wc.get("hostname"))
+
+    raise ValueError(f"no packed layout for {type(value)}")
+
+
+def unpack(b) -> dict:
+    """ inverse of pack(): {"created_at": <epoch>, "value": ..} """
+    if b[0] != PACKED_MAGIC:
+        raise ValueError("not a packed payload")
+
+    kind: int = b[1]
+    if kind == PACKED_KIND_INT:
+        _, _, created_at, value = struct.unpack(_PACKED_INT, bytes(b[:struct.calcsize(_PACKED_INT)]))
+        return {"created_at": created_at, "value": value}
+
+    if kind == PACKED_KIND_FLOAT:
+        _, _, created_at, value = struct.unpack(_PACKED_FLOAT, bytes(b[:struct.calcsize(_PACKED_FLOAT)]))
+        return {"created_at": created_at, "value": value}
+
+    if kind == PACKED_KIND_STATUS:
+        n: int = struct.calcsize(_PACKED_STATUS)
+        (_, _, created_at, runtime_seconds, reboot_pending_in, rssi, channel, rx_dropped,
+         ip, subnet, gateway, dns, mac) = struct.unpack(_PACKED_STATUS, bytes(b[:n]))
+
+        sl: int = b[n]
+        ssid: str = bytes(b[n + 1:n + 1 + sl]).decode()
+        n += 1 + sl
+        hl: int = b[n]
+        hostname: str = bytes(b[n + 1:n + 1 + hl]).decode()
+
+        return {
+            "created_at": created_at,
+            "value": {
+                "wifi": {
+                    "ip": _ip4_str(ip),
+                    "subnet": _ip4_str(subnet),
+                    "gateway": _ip4_str(gateway),
+                    "dns": _ip4_str(dns),
+                    "strength": None if rssi == _RSSI_NONE else rssi,
+                    "config": {
+                        "mac": binascii.hexlify(mac, ":").decode(),
+                        "ssid": ssid,
+                        "channel": channel,
+                        "hostname": hostname,
+                    },
+                },
+                "mqtt": {"rx_dropped_oversize": rx_dropped},
+                "runtime_seconds": runtime_seconds,
+                "reboot_pending_in": reboot_pending_in,
+            },
+        }
+
+    raise ValueError(f"unknown packed kind {kind}")
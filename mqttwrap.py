@@ -1,68 +1,854 @@
 import micropython
+import random
 import time
 import machine
-import sys
-import io
-
-#### monkeypatching galore!!! ####
-#### needed for retain-bit ####
-# taken from https://github.com/micropython/micropython-lib/blob/master/micropython/umqtt.simple/umqtt/simple.py
-# and adapted
-from umqtt.simple import MQTTClient as MQTTClientSimple
-import ustruct as struct
-def wait_msg(self):
-    res = self.sock.read(1)
-    self.sock.setblocking(True)
-    if res is None:
-        return None
-    if res == b"":
-        raise OSError(-1)
-    if res == b"\xd0":  # PINGRESP
-        sz = self.sock.read(1)[0]
-        assert sz == 0
-        return None
-    op = res[0]
-    if op & 0xF0 != 0x30:
-        return op
-    sz = self._recv_len()
-    topic_len = self.sock.read(2)
-    topic_len = (topic_len[0] << 8) | topic_len[1]
-    topic = self.sock.read(topic_len)
-    sz -= topic_len + 2
-    if op & 6:
-        pid = self.sock.read(2)
-        pid = pid[0] << 8 | pid[1]
-        sz -= 2
-    msg = self.sock.read(sz)
-
-    # do not ignore retained
-    retained = op & 0x01
-
-    self.cb(topic, msg, retained == 1)
-    if op & 6 == 2:
-        pkt = bytearray(b"\x40\x02\0\0")
-        struct.pack_into("!H", pkt, 2, pid)
-        self.sock.write(pkt)
-    elif op & 6 == 4:
-        assert 0
-    return op
-
-MQTTClientSimple.wait_msg = wait_msg
-#### /monkeypatching galore!!! ####
-
-#from umqtt.robust import MQTTClient
-from umqtt.simple import MQTTClient
 
-import config
-import wifi
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
 
-import _thread
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+
+class MQTTException(Exception):
+    def __init__(self, msg: str = "", rc: int | None = None):
+        """ rc: the (mqtt5-)reason code / connack return code if there is one """
+        super().__init__(msg)
+        self.rc = rc
+
+
+class MQTTNotConnected(MQTTException):
+    """ raised before anything was sent - the packet never got into the in-flight window of the client """
+
+
+def _encode_varlen(n: int) -> bytearray:
+    ret: bytearray = bytearray()
+    while True:
+        b: int = n & 0x7F
+        n >>= 7
+        if n:
+            ret.append(b | 0x80)
+        else:
+            ret.append(b)
+            return ret
+
+
+def _encode_str(s: str | bytes) -> bytes:
+    if isinstance(s, str):
+        s = s.encode()
+    return struct.pack("!H", len(s)) + s
+
+
+def _publish_size(topic_len: int, msg_len: int, qos: int, props_len: int = -1) -> int:
+    # remaining length + fixed header (1 byte + up to 4 bytes varlen)
+    # props_len: length of the mqtt5-properties (-1: mqtt 3.1.1, no property-section at all)
+    sz: int = 2 + topic_len + msg_len + (2 if qos else 0) + props_len + 1
+    return sz + (2 if sz < 128 else 3 if sz < 16_384 else 4 if sz < 2_097_152 else 5)
+
+
+def _encode_publish_into(buf: bytearray, topic: bytes, msg, qos: int, retain: bool, pid: int, props=None) -> int:
+    """ writes the PUBLISH-packet in place into buf (no allocations) and returns its length
+    props: the encoded mqtt5-properties (less than 128 bytes) - None for mqtt 3.1.1
+    """
+    tl: int = len(topic)
+    ml: int = len(msg)
+    pl: int = -1 if props is None else len(props)
+
+    buf[0] = 0x30 | qos << 1 | retain
+
+    n: int = 2 + tl + ml + (2 if qos else 0) + pl + 1
+    i: int = 1
+    while True:
+        b: int = n & 0x7F
+        n >>= 7
+        if n:
+            buf[i] = b | 0x80
+            i += 1
+        else:
+            buf[i] = b
+            i += 1
+            break
+
+    buf[i] = tl >> 8
+    buf[i + 1] = tl & 0xFF
+    i += 2
+    buf[i:i + tl] = topic
+    i += tl
+
+    if qos:
+        buf[i] = pid >> 8
+        buf[i + 1] = pid & 0xFF
+        i += 2
+
+    if props is not None:
+        buf[i] = pl
+        buf[i + 1:i + 1 + pl] = props
+        i += 1 + pl
+
+    buf[i:i + ml] = msg
+    return i + ml
+
+
+# mqtt5-properties: identifier -> size of the value (-1: varint, -2: string/binary with 2-byte length, -3: string-pair)
+_PROP_SIZES: dict[int, int] = {
+    0x01: 1, 0x02: 4, 0x03: -2, 0x08: -2, 0x09: -2, 0x0B: -1, 0x11: 4, 0x12: -2, 0x13: 2, 0x15: -2, 0x16: -2,
+    0x17: 1, 0x18: 4, 0x19: 1, 0x1A: -2, 0x1C: -2, 0x1F: -2, 0x21: 2, 0x22: 2, 0x23: 2, 0x24: 1, 0x25: 1,
+    0x26: -3, 0x27: 4, 0x28: 1, 0x29: 1, 0x2A: 1,
+}
+
+
+def _decode_varint(b, i: int) -> tuple[int, int]:
+    """ -> (value, index after it) """
+    n: int = 0
+    sh: int = 0
+    while True:
+        c: int = b[i]
+        i += 1
+        n |= (c & 0x7F) << sh
+        if not c & 0x80:
+            return n, i
+        sh += 7
+
+
+def _prop_int(b, i: int, size: int) -> int:
+    n: int = 0
+    for k in range(size):
+        n = n << 8 | b[i + k]
+    return n
+
+
+def _props_skip(b, i: int) -> int:
+    """ i: start of a property-section -> index after it """
+    pl, i = _decode_varint(b, i)
+    return i + pl
+
+
+def _props_iter(b, i: int):
+    """ i: start of a property-section -> (identifier, index of its value)* """
+    pl, i = _decode_varint(b, i)
+    end: int = i + pl
+    while i < end:
+        pid, i = _decode_varint(b, i)
+        yield pid, i
+
+        sz: int = _PROP_SIZES.get(pid, 0)
+        if sz > 0:
+            i += sz
+        elif sz == -1:
+            _, i = _decode_varint(b, i)
+        elif sz == -2:
+            i += 2 + (b[i] << 8 | b[i + 1])
+        elif sz == -3:
+            i += 2 + (b[i] << 8 | b[i + 1])
+            i += 2 + (b[i] << 8 | b[i + 1])
+        else:
+            raise MQTTException(f"unknown mqtt5-property {pid:#x}")
+
+
+# completion-handle of a qos1-publish which is "in flight" (sent, but not yet acked by PUBACK)
+class PubAck:
+    def __init__(self, pid: int, buf: bytearray, n: int, callback=None):
+        self.pid = pid
+        # the encoded packet (kept for retransmits) - buf goes back to the tx-pool when done
+        self.buf = buf
+        self.pkt = memoryview(buf)[:n]
+        self.callback = callback
+        self.sent: int = time.ticks_ms()
+        self.retries: int = 0
+        self.ok: bool | None = None
+        self.reason: int = 0  # mqtt5 reason-code of the PUBACK (>= 0x80: rejected)
+        self.topic: bytes | None = None  # only set if pkt carries a topic-alias instead of the topic
+        self._ev: asyncio.Event | None = None
+
+    def done(self) -> bool:
+        return self.ok is not None
+
+    async def wait(self, timeout_ms: int | None = None) -> bool:
+        """ True if acked, False if given up (retries exhausted) - raises asyncio.TimeoutError on timeout_ms """
+        if self.ok is not None:
+            return self.ok
+
+        if self._ev is None:
+            self._ev = asyncio.Event()
+
+        if timeout_ms is None:
+            await self._ev.wait()
+        else:
+            await asyncio.wait_for_ms(self._ev.wait(), timeout_ms)
+        return self.ok
+
+    def _complete(self, ok: bool) -> None:
+        self.ok = ok
+        self.pkt = None
+        if self._ev is not None:
+            self._ev.set()
+        if self.callback:
+            try:
+                self.callback(self)
+            except Exception as ex:
+                logger.error(f"PubAck callback for pid={self.pid} failed: {ex!r}")
+
+
+# native asyncio mqtt-3.1.1 client (replaces umqtt.simple + the monkeypatched wait_msg)
+# reads are done by a background-task on the (non-blocking) asyncio-stream and are parsed packet by packet,
+# keepalive is handled by a second background-task. publish/subscribe are awaitable.
+# qos1-publishes are pipelined: up to max_inflight of them can be on the wire at once, unacked ones are
+# retransmitted (with DUP) after retransmit_ms and after a reconnect.
+# protocol=5: mqtt 5 - topic-aliases for publish(alias=True), message-expiry, retain-handling for subscribe,
+# reason-codes end up in MQTTException.rc / PubAck.reason / disconnect_reason.
+class MQTTClient:
+    def __init__(self, client_id: str, server: str, port: int = 1883, user: str | None = None,
+                 password: str | None = None, keepalive: int = 60, ack_timeout_ms: int = 10_000,
+                 max_inflight: int = 8, retransmit_ms: int = 5_000, max_retransmits: int = 3,
+                 rx_buffer_size: int = 512, tx_buffer_size: int = 256, protocol: int = 4,
+                 topic_alias_max: int = 16, session_expiry_s: int = 0):
+        assert protocol in (4, 5)
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.user = user
+        self.pswd = password
+        self.keepalive = keepalive
+        self.ack_timeout_ms = ack_timeout_ms
+        self.max_inflight = max_inflight
+        self.retransmit_ms = retransmit_ms
+        self.max_retransmits = max_retransmits
+
+        self.cb = None
+        self.lw_topic: str | None = None
+        self.lw_msg: str | bytes | None = None
+        self.lw_qos: int = 0
+        self.lw_retain: bool = False
+
+        self._reader = None
+        self._writer = None
+        self._tasks: list = []
+
+        # receive-path works on preallocated buffers only: packets are read (readinto) into _rxbuf and handed
+        # to the callback as memoryview-slices of it. bigger packets are streamed through it and dropped.
+        self._rxbuf: bytearray = bytearray(rx_buffer_size)
+        self._rxmv: memoryview = memoryview(self._rxbuf)
+        self._hdrbuf: bytearray = bytearray(1)
+        self._hdrmv: memoryview = memoryview(self._hdrbuf)
+        self._ackbuf: bytearray = bytearray(b"\x40\x02\x00\x00")
+
+        # send-path: packets are encoded in place into reusable buffers - _txbuf for qos0, and one buffer
+        # per in-flight slot for qos1 (they are needed until the PUBACK). bigger packets get their own bytearray.
+        self.tx_buffer_size = tx_buffer_size
+        self._txbuf: bytearray = bytearray(tx_buffer_size)
+        self._txpool: list[bytearray] = []
+        self.rx_dropped_oversize: int = 0
+        self._connected: bool = False
+
+        self._pid: int = 0
+        # pid -> [event, result] for subscribes waiting on their SUBACK
+        self._pending: dict[int, list] = {}
+        # pid -> PubAck for qos1-publishes waiting on their PUBACK
+        self._inflight: dict[int, PubAck] = {}
+        self._window_free: asyncio.Event = asyncio.Event()
+        self._window_free.set()
+
+        self._last_tx: int = time.ticks_ms()
+        self._last_rx: int = time.ticks_ms()
+        self._ping_sent: int | None = None
+        self.ping_rtt_ms: int | None = None
+        self.ping_cb = None  # f(rtt_ms) for every PINGRESP
+
+        # mqtt5: aliases are per connection - topic -> alias, at most what the broker allows in its CONNACK
+        self.protocol = protocol
+        self.topic_alias_max = topic_alias_max
+        self.session_expiry_s = session_expiry_s
+        self._aliases: dict[bytes, int] = {}
+        self._alias_max: int = 0
+        self._propbuf: bytearray = bytearray(8)
+        self._propmv: memoryview = memoryview(self._propbuf)
+        self.server_max_packet: int | None = None
+        self.disconnect_reason: int | None = None
+
+    def set_callback(self, f) -> None:
+        self.cb = f
+
+    def set_last_will(self, topic: str, msg: str | bytes, retain: bool = False, qos: int = 0) -> None:
+        assert 0 <= qos <= 2
+        assert topic
+        self.lw_topic = topic
+        self.lw_msg = msg
+        self.lw_qos = qos
+        self.lw_retain = retain
+
+    def isconnected(self) -> bool:
+        return self._connected
+
+    def _newpid(self) -> int:
+        while True:
+            self._pid = self._pid + 1 if self._pid < 65535 else 1
+            if self._pid not in self._inflight and self._pid not in self._pending:
+                return self._pid
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def _send(self, pkt: bytes | bytearray) -> None:
+        if self._writer is None:
+            raise MQTTNotConnected("not connected")
+        self._writer.write(pkt)
+        await self._writer.drain()
+        self._last_tx = time.ticks_ms()
+
+    async def _readinto_exactly(self, mv: memoryview) -> None:
+        n: int = len(mv)
+        pos: int = await self._reader.readinto(mv)
+        while True:
+            if pos == 0 and n > 0:
+                raise OSError(-1)  # EOF
+            if pos >= n:
+                return
+            r: int = await self._reader.readinto(mv[pos:])
+            if not r:
+                raise OSError(-1)
+            pos += r
+
+    async def _read_packet(self) -> tuple[int, int]:
+        """ returns (op, size) - the body is in _rxbuf[:size] unless size > len(_rxbuf),
+        in which case it has not been read yet (see _discard_oversize)
+        """
+        await self._readinto_exactly(self._hdrmv)
+        op: int = self._hdrbuf[0]
+
+        sz: int = 0
+        sh: int = 0
+        while True:
+            await self._readinto_exactly(self._hdrmv)
+            b: int = self._hdrbuf[0]
+            sz |= (b & 0x7F) << sh
+            if not b & 0x80:
+                break
+            sh += 7
+
+        if 0 < sz <= len(self._rxbuf):
+            await self._readinto_exactly(self._rxmv[:sz])
+
+        self._last_rx = time.ticks_ms()
+        return op, sz
+
+    async def _discard_oversize(self, op: int, sz: int) -> None:
+        # stream it through the rx-buffer chunk by chunk; a qos1-PUBLISH still gets its PUBACK (pid is in the first chunk)
+        bufsz: int = len(self._rxbuf)
+        await self._readinto_exactly(self._rxmv)
+
+        pid: int | None = None
+        if op & 0xF0 == 0x30 and op & 0x06 == 0x02:
+            pid_at: int = 2 + (self._rxbuf[0] << 8 | self._rxbuf[1])
+            if pid_at + 2 <= bufsz:
+                pid = self._rxbuf[pid_at] << 8 | self._rxbuf[pid_at + 1]
+
+        left: int = sz - bufsz
+        while left > 0:
+            chunk: int = left if left < bufsz else bufsz
+            await self._readinto_exactly(self._rxmv[:chunk])
+            left -= chunk
+
+        self.rx_dropped_oversize += 1
+        logger.warning(f"dropped packet {op:#x} of {sz} bytes (rx-buffer: {bufsz}) - {self.rx_dropped_oversize} so far")
+
+        if pid is not None:
+            await self._send_puback(pid)
+
+    async def _send_puback(self, pid: int) -> None:
+        self._ackbuf[2] = pid >> 8
+        self._ackbuf[3] = pid & 0xFF
+        await self._send(self._ackbuf)
+
+    async def connect(self, clean_session: bool = True) -> bool:
+        """ returns the session-present flag of the CONNACK """
+        self._reader, self._writer = await asyncio.open_connection(self.server, self.port)
+
+        flags: int = clean_session << 1
+        payload: bytearray = bytearray(_encode_str(self.client_id))
+
+        if self.lw_topic:
+            flags |= 0x04 | (self.lw_qos & 0x03) << 3 | self.lw_retain << 5
+            if self.protocol == 5:
+                payload.append(0)  # will-properties
+            payload += _encode_str(self.lw_topic)
+            payload += _encode_str(self.lw_msg)
+
+        if self.user:
+            flags |= 0x80
+            payload += _encode_str(self.user)
+            if self.pswd:
+                flags |= 0x40
+                payload += _encode_str(self.pswd)
+
+        varhdr: bytes = b"\x00\x04MQTT" + struct.pack("!BBH", self.protocol, flags, self.keepalive)
+        if self.protocol == 5:
+            # session-expiry (a persistent session needs one) + maximum packet size: the broker drops what would
+            # not fit into the rx-buffer instead of sending it
+            props: bytes = struct.pack("!BIBI", 0x27, len(self._rxbuf), 0x11, self.session_expiry_s)
+            varhdr += _encode_varlen(len(props)) + props
+
+        pkt: bytearray = bytearray(b"\x10")
+        pkt += _encode_varlen(len(varhdr) + len(payload))
+        pkt += varhdr
+        pkt += payload
+
+        self._writer.write(pkt)
+        await self._writer.drain()
+
+        op, sz = await asyncio.wait_for_ms(self._read_packet(), self.ack_timeout_ms)
+        if op != 0x20 or sz < 2 or sz > len(self._rxbuf):
+            await self._close()
+            raise MQTTException(f"unexpected packet {op:#x} instead of CONNACK")
+        if self._rxbuf[1] != 0:
+            await self._close()
+            raise MQTTException(f"connection refused rc={self._rxbuf[1]:#x}", rc=self._rxbuf[1])
+        session_present: bool = self._rxbuf[0] & 0x01 == 1
+
+        self._aliases = {}
+        self._alias_max = 0
+        self.disconnect_reason = None
+        if self.protocol == 5 and sz > 2:
+            self._connack_props(self._rxmv[:sz])
+
+        # aliases of the old connection are gone - unacked packets that only carry an alias get their topic back
+        for pa in self._inflight.values():
+            if pa.topic is not None:
+                self._dealias(pa)
+
+        self._connected = True
+        self._ping_sent = None
+        self._last_tx = self._last_rx = time.ticks_ms()
+
+        # whatever was not acked on the old connection goes out again
+        for pa in list(self._inflight.values()):
+            await self._retransmit(pa)
+
+        self._tasks = [
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self._keepalive_loop()),
+            asyncio.create_task(self._retransmit_loop()),
+        ]
+
+        return session_present
+
+    def _connack_props(self, body: memoryview) -> None:
+        for pid, i in _props_iter(body, 2):
+            if pid == 0x22:  # topic alias maximum
+                self._alias_max = min(self.topic_alias_max, _prop_int(body, i, 2))
+            elif pid == 0x21:  # receive maximum
+                self.max_inflight = min(self.max_inflight, _prop_int(body, i, 2))
+            elif pid == 0x27:  # maximum packet size
+                self.server_max_packet = _prop_int(body, i, 4)
+            elif pid == 0x13:  # server keep alive
+                self.keepalive = _prop_int(body, i, 2)
+            elif pid == 0x1F:  # reason string
+                logger.info(f"CONNACK: {bytes(body[i + 2:i + 2 + (body[i] << 8 | body[i + 1])])}")
+
+    def _dealias(self, pa: PubAck) -> None:
+        """ rewrites an unacked publish that only carries a topic-alias into one with the full topic """
+        pkt: memoryview = pa.pkt
+        i: int = 1
+        while pkt[i] & 0x80:
+            i += 1
+        i += 1 + 2 + (pkt[i + 1] << 8 | pkt[i + 2]) + 2  # remaining length, (empty) topic, pid
+
+        pl, j = _decode_varint(pkt, i)
+        props: bytearray = bytearray()
+        end: int = j + pl
+        while j < end:
+            if pkt[j] == 0x02:  # keep the message-expiry, drop the alias
+                props += pkt[j:j + 5]
+            j += 1 + _PROP_SIZES[pkt[j]]
+
+        msg: memoryview = pkt[end:]
+        buf: bytearray = bytearray(_publish_size(len(pa.topic), len(msg), 1, len(props)))
+        n: int = _encode_publish_into(buf, pa.topic, msg, 1, pkt[0] & 0x01, pa.pid, props)
+        buf[0] |= pkt[0] & 0x08
+
+        old: bytearray = pa.buf
+        pa.buf = buf
+        pa.pkt = memoryview(buf)[:n]
+        pa.topic = None
+        self._txbuf_release(old)
+
+    async def _close(self) -> None:
+        was_connected: bool = self._connected
+        self._connected = False
+
+        # the loops belong to this connection - connect() starts new ones (the loop calling this ends on its own)
+        for t in self._tasks:
+            if t is not asyncio.current_task():
+                t.cancel()
+        self._tasks = []
+
+        if self._writer:
+            try:
+                self._writer.close()
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+
+        self._reader = None
+        self._writer = None
+
+        # wake up every subscribe still waiting for an ack - they will see result None
+        # (in-flight publishes are kept and retransmitted after the next connect)
+        for p in self._pending.values():
+            p[0].set()
+        self._pending.clear()
+
+        if was_connected:
+            logger.info("mqtt connection closed")
+
+    async def disconnect(self) -> None:
+        if self._connected:
+            try:
+                await self._send(b"\xe0\x00")
+            except Exception:
+                pass
+
+        await self._close()
+
+    async def _wait_ack(self, pid: int):
+        ev: asyncio.Event = asyncio.Event()
+        p: list = [ev, None]
+        self._pending[pid] = p
+
+        try:
+            await asyncio.wait_for_ms(ev.wait(), self.ack_timeout_ms)
+        except asyncio.TimeoutError:
+            raise MQTTException(f"timeout waiting for ack of {pid=}")
+        finally:
+            self._pending.pop(pid, None)
+
+        if p[1] is None:
+            raise MQTTException(f"connection lost while waiting for ack of {pid=}")
+
+        return p[1]
+
+    def session_state(self, max_bytes: int = 1024) -> bytes:
+        """ next pid + the unacked qos1-publishes (encoded packets) - to be kept over a deepsleep, see restore_session()
+        publishes that do not fit into max_bytes are left out
+        """
+        out: bytearray = bytearray(struct.pack("!HB", self._pid, 0))
+        cnt: int = 0
+        for pa in self._inflight.values():
+            if pa.topic is not None:
+                self._dealias(pa)
+            if pa.pkt is None or len(out) + 4 + len(pa.pkt) > max_bytes:
+                continue
+            out += struct.pack("!HH", pa.pid, len(pa.pkt))
+            out += pa.pkt
+            cnt += 1
+        out[2] = cnt
+        return bytes(out)
+
+    def restore_session(self, state: bytes) -> int:
+        """ -> number of restored in-flight publishes (sent again with DUP on the next connect) """
+        self._pid, cnt = struct.unpack("!HB", state[:3])
+        pos: int = 3
+        for _ in range(cnt):
+            pid, n = struct.unpack("!HH", state[pos:pos + 4])
+            self._inflight[pid] = PubAck(pid, bytearray(state[pos + 4:pos + 4 + n]), n)
+            pos += 4 + n
+        return cnt
+
+    def _txbuf_get(self, n: int) -> bytearray:
+        if n > self.tx_buffer_size:
+            return bytearray(n)
+        if self._txpool:
+            return self._txpool.pop()
+        return bytearray(self.tx_buffer_size)
+
+    def _txbuf_release(self, buf: bytearray) -> None:
+        if len(buf) == self.tx_buffer_size and len(self._txpool) < self.max_inflight:
+            self._txpool.append(buf)
+
+    def _publish_props(self, topic: bytes, alias: bool, expiry_s: int) -> tuple:
+        """ mqtt5: -> (topic to put on the wire, properties, alias-only) """
+        pn: int = 0
+        if expiry_s:
+            self._propbuf[0] = 0x02
+            self._propbuf[1:5] = struct.pack("!I", expiry_s)
+            pn = 5
+
+        if not alias:
+            return topic, self._propmv[:pn], False
+
+        a: int | None = self._aliases.get(topic)
+        wire_topic: bytes = topic
+        if a is not None:
+            wire_topic = b""
+        elif len(self._aliases) < self._alias_max:
+            a = len(self._aliases) + 1
+            self._aliases[topic] = a  # the first publish carries topic + alias, then only the alias
+
+        if a is not None:
+            self._propbuf[pn] = 0x23
+            self._propbuf[pn + 1] = a >> 8
+            self._propbuf[pn + 2] = a & 0xFF
+            pn += 3
+
+        return wire_topic, self._propmv[:pn], a is not None and not wire_topic
+
+    async def publish(self, topic: str | bytes, msg: str | bytes | bytearray | memoryview, retain: bool = False,
+                      qos: int = 0, wait: bool = True, callback=None, alias: bool = False,
+                      expiry_s: int = 0) -> PubAck | None:
+        """ qos1: with wait=True returns after the PUBACK (raises MQTTException on timeout/give-up/reason-code),
+        with wait=False returns the PubAck as soon as the packet is on the wire
+
+        mqtt5 only (ignored otherwise): alias - use a topic-alias (for frequently used topics), expiry_s - message-expiry
+
+        topic and msg should already be bytes(-like) to keep this allocation-free
+        """
+        assert qos in (0, 1)
+
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(msg, str):
+            msg = msg.encode()
+
+        wire_topic: bytes = topic
+        props: memoryview | None = None
+        alias_only: bool = False
+
+        if qos == 0:
+            if self.protocol == 5:
+                wire_topic, props, alias_only = self._publish_props(topic, alias, expiry_s)
+            n: int = _publish_size(len(wire_topic), len(msg), 0, -1 if props is None else len(props))
+            buf: bytearray = self._txbuf if n <= self.tx_buffer_size else bytearray(n)
+            n = _encode_publish_into(buf, wire_topic, msg, 0, retain, 0, props)
+            # write() either sends it right away or copies it, so _txbuf is free again afterwards
+            await self._send(memoryview(buf)[:n] if n < len(buf) else buf)
+            return None
+
+        if len(self._inflight) >= self.max_inflight:
+            # msg may be a view into a reusable buffer (e.g. PayloadTemplate) - it has to survive the wait
+            if isinstance(msg, memoryview):
+                msg = bytes(msg)
+
+            while len(self._inflight) >= self.max_inflight:
+                self._window_free.clear()
+                await self._window_free.wait()
+
+        # only now: waiting for the window above may have yielded to a reconnect (-> new aliases)
+        if self.protocol == 5:
+            wire_topic, props, alias_only = self._publish_props(topic, alias, expiry_s)
+        n = _publish_size(len(wire_topic), len(msg), 1, -1 if props is None else len(props))
+
+        pid: int = self._newpid()
+        buf = self._txbuf_get(n)
+        n = _encode_publish_into(buf, wire_topic, msg, 1, retain, pid, props)
+
+        pa: PubAck = PubAck(pid, buf, n, callback)
+        if alias_only:
+            pa.topic = topic
+        self._inflight[pid] = pa
+        if len(self._inflight) >= self.max_inflight:
+            self._window_free.clear()
+
+        try:
+            await self._send(pa.pkt)
+        except Exception:
+            self._inflight.pop(pid, None)
+            self._txbuf_release(buf)
+            self._window_free.set()
+            raise
+
+        if not wait:
+            return pa
+
+        try:
+            ok: bool = await pa.wait(self.ack_timeout_ms)
+        except asyncio.TimeoutError:
+            raise MQTTException(f"timeout waiting for PUBACK of {pid=}")
+
+        if not ok:
+            if pa.reason >= 0x80:
+                raise MQTTException(f"publish {pid=} rejected rc={pa.reason:#x}", rc=pa.reason)
+            raise MQTTException(f"giving up on publish {pid=} after {pa.retries} retransmits")
+
+        return pa
+
+    async def flush(self, timeout_ms: int | None = None) -> bool:
+        """ waits until all in-flight publishes are acked (or given up) - False on timeout """
+        deadline: int = time.ticks_add(time.ticks_ms(), self.ack_timeout_ms if timeout_ms is None else timeout_ms)
+        while self._inflight:
+            if time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+                return False
+            await asyncio.sleep_ms(10)
+        return True
+
+    def _puback(self, pid: int, ok: bool, reason: int = 0) -> None:
+        pa: PubAck | None = self._inflight.pop(pid, None)
+        if pa is None:
+            return
+
+        pa.reason = reason
+        self._window_free.set()
+        buf: bytearray = pa.buf
+        pa.buf = None
+        pa._complete(ok)
+        self._txbuf_release(buf)
+
+    async def _retransmit(self, pa: PubAck) -> None:
+        pa.pkt[0] |= 0x08  # DUP
+        pa.retries += 1
+        pa.sent = time.ticks_ms()
+        await self._send(pa.pkt)
+
+    async def _retransmit_loop(self) -> None:
+        while self._connected:
+            await asyncio.sleep_ms(min(self.retransmit_ms, 1_000))
+
+            now: int = time.ticks_ms()
+            for pa in list(self._inflight.values()):
+                if time.ticks_diff(now, pa.sent) < self.retransmit_ms:
+                    continue
+
+                if pa.retries >= self.max_retransmits:
+                    logger.error(f"no PUBACK for pid={pa.pid} after {pa.retries} retransmits - giving up")
+                    self._puback(pa.pid, False)
+                    continue
+
+                logger.debug(f"retransmitting pid={pa.pid} retry={pa.retries + 1}")
+                try:
+                    await self._retransmit(pa)
+                except Exception as ex:
+                    logger.error(f"retransmit of pid={pa.pid} failed: {ex!r}")
+                    return
+
+    async def subscribe(self, topic: str | bytes, qos: int = 0, retain_handling: int = 0) -> int:
+        """ returns the granted qos (raises MQTTException with the reason-code if refused)
+        mqtt5 only: retain_handling 0 - send retained messages, 1 - only for new subscriptions, 2 - never
+        """
+        pid: int = self._newpid()
+
+        if self.protocol == 5:
+            body: bytes = struct.pack("!HB", pid, 0) + _encode_str(topic) + bytes((qos | retain_handling << 4,))
+        else:
+            body = struct.pack("!H", pid) + _encode_str(topic) + bytes((qos,))
+
+        pkt: bytearray = bytearray(b"\x82")
+        pkt += _encode_varlen(len(body))
+        pkt += body
+
+        await self._send(pkt)
+        granted: int = await self._wait_ack(pid)
+
+        if granted is None or granted >= 0x80:
+            raise MQTTException(f"subscribe to {topic} failed rc={granted}", rc=granted)
+
+        return granted
+
+    async def ping(self) -> None:
+        self._ping_sent = time.ticks_ms()
+        await self._send(b"\xc0\x00")
+
+    async def _read_loop(self) -> None:
+        writer = self._writer
+        try:
+            while self._connected:
+                op, sz = await self._read_packet()
+                if sz > len(self._rxbuf):
+                    await self._discard_oversize(op, sz)
+                else:
+                    await self._handle_packet(op, self._rxmv[:sz])
+        except Exception as ex:
+            if self._connected:
+                logger.error(f"mqtt read_loop: {ex!r}")
+        finally:
+            # not if the connection was closed (and maybe a new one opened) in the meantime
+            if self._writer is writer:
+                await self._close()
+
+    async def _handle_packet(self, op: int, body: memoryview) -> None:
+        kind: int = op & 0xF0
+
+        if kind == 0x30:  # PUBLISH
+            topic_end: int = 2 + (body[0] << 8 | body[1])
+
+            qos: int = (op & 0x06) >> 1
+            if qos == 2:
+                logger.warning(f"qos2 is not supported - dropping message on {bytes(body[2:topic_end])}")
+                return
+
+            msg_start: int = topic_end + (2 if qos else 0)
+            if self.protocol == 5:
+                msg_start = _props_skip(body, msg_start)  # we allow no topic-aliases from the broker (none in CONNECT)
+
+            # topic and msg are only valid during the callback (slices of the rx-buffer)
+            if self.cb:
+                self.cb(body[2:topic_end], body[msg_start:], op & 0x01 == 1)
+
+            # ack qos1-publishes only after the callback has seen them
+            if qos == 1:
+                await self._send_puback(body[topic_end] << 8 | body[topic_end + 1])
+        elif kind == 0x40:  # PUBACK
+            rc: int = body[2] if len(body) > 2 else 0  # mqtt5 (0x10 "no matching subscribers" is a success too)
+            self._puback(body[0] << 8 | body[1], rc < 0x80, rc)
+        elif kind == 0x90:  # SUBACK
+            pid: int = body[0] << 8 | body[1]
+            p: list | None = self._pending.get(pid)
+            if p is not None:
+                p[1] = body[_props_skip(body, 2) if self.protocol == 5 else 2]
+                p[0].set()
+        elif kind == 0xE0:  # DISCONNECT (mqtt5: the broker tells why)
+            self.disconnect_reason = body[0] if len(body) else 0
+            logger.error(f"disconnected by the broker rc={self.disconnect_reason:#x}")
+            await self._close()
+        elif kind == 0xD0:  # PINGRESP
+            if self._ping_sent is not None:
+                self.ping_rtt_ms = time.ticks_diff(time.ticks_ms(), self._ping_sent)
+                self._ping_sent = None
+                if self.ping_cb:
+                    self.ping_cb(self.ping_rtt_ms)
+        else:
+            logger.warning(f"unhandled packet {op:#x} {len(body)=}")
+
+    async def _keepalive_loop(self, threshold_s: int = 10) -> None:
+        if not self.keepalive:
+            return
+
+        interval_ms: int = max(1, self.keepalive - threshold_s) * 1000
+        while self._connected:
+            await asyncio.sleep_ms(1_000)
+
+            now: int = time.ticks_ms()
+            if self._ping_sent is not None and time.ticks_diff(now, self._ping_sent) > self.keepalive * 1000:
+                logger.error("no PINGRESP received within keepalive -> closing connection")
+                await self._close()
+                return
+
+            if self._ping_sent is None and time.ticks_diff(now, self._last_tx) >= interval_ms:
+                logger.debug("=> PING")
+                try:
+                    await self.ping()
+                except Exception as ex:
+                    logger.error(f"mqtt ping failed: {ex!r}")
+                    await self._close()
+                    return
 
-lock = _thread.allocate_lock()
+
+import config
+import wifi
+import mqttcodec
+import statusdelta
+import flashqueue
+import rtcstore
+import topicrouter
+import cmdqueue
+import stats
+import stagger
 
 TELE_PERIOD: int = 60
 
 last_status_gmt: float | None = None
+_next_status_gmt: int | None = None
 
 
 try:
@@ -90,7 +876,44 @@ _lastping: int = time.time()
 _mqttclient: MQTTClient | None = None
 _keepalive: int = 60
 _controlfeed: str | None = None
-_received_commands: list[tuple[int, str, str | None]] = []
+_received_commands: cmdqueue.CommandQueue = cmdqueue.CommandQueue(
+    capacity=config.data["mosquitto"].get("command_queue_size", 16),
+    arg_bytes=config.data["mosquitto"].get("command_arg_bytes", 64),
+)
+_session_up: bool = False
+_session_present: bool = False
+_session_restored: bool = False
+first_publish_ms: int | None = None  # ticks_ms (since boot/wake-up) when the first publish_one went out
+_spool: flashqueue.FlashQueue | None = None
+_status_delta: statusdelta.StatusDelta = statusdelta.StatusDelta(
+    keyframe_every=config.data["mosquitto"].get("status_keyframe_every", 10)
+)
+# incoming messages: topic-filter -> handler (see add_route()), the control-feed is one of the routes
+_router: topicrouter.TopicRouter = topicrouter.TopicRouter()
+_route_qos: dict[bytes, int] = {}
+_replyfeed: str | None = None
+# broadcast-commands waiting for their slot in the execution-window: [due (ticks_ms), cmd, arg, idempotent]
+_scheduled: list[list] = []
+# rpc: correlation-id -> [event, response, method, sent (ticks_ms)], see rpc_call()
+_rpc_pending: dict[int, list] = {}
+_rpc_id: int = 0
+rpc_latency: dict[str, stats.LogHistogram] = {}  # method -> round-trip times (ms) of the answered calls
+rpc_timeouts: dict[str, int] = {}
+
+
+def stagger_offset(window: int, salt: str) -> int:
+    """ per-device phase-offset in [0, window) (see stagger.py) - 0 if stagger.enabled is off """
+    if not config.data.stagger.enabled:
+        return 0
+    return stagger.offset(wifi.mac_no_colon, window, salt)
+
+
+def forcerestart_after_s() -> int:
+    """ forcerestart_after_running_seconds + this devices offset within stagger.restart_spread_s (0: never) """
+    s: int = config.data.forcerestart_after_running_seconds
+    if s <= 0:
+        return 0
+    return s + stagger_offset(config.data.stagger.restart_spread_s, "restart")
 
 
 def get_client_id() -> str:
@@ -103,8 +926,89 @@ def format_with_clientid(topic: str) -> str:
     return topic.format(clientid=get_client_id())
 
 
+# a configured feed with its topic formatted and encoded once - get the cached instance via feed(feedname)
+class Feed:
+    def __init__(self, name: str, topic: str, encoding: str = "json", alias: bool = False, expiry_s: int = 0):
+        self.name = name
+        self.topic = topic
+        self.topic_b: bytes = topic.encode()
+        self.encoding = encoding  # one of mqttcodec.ENCODINGS - see feed_payload()
+        # mqtt5 only: publish with a topic-alias / message-expiry (0: never)
+        self.alias = alias
+        self.expiry_s = expiry_s
+
+    def __repr__(self):
+        return f"Feed({self.name}={self.topic}, {self.encoding}, {self.alias=}, {self.expiry_s=})"
+
+
+_feeds: dict[str, Feed] = {}
+
+
+def feed(feedname: str) -> Feed:
+    f: Feed | None = _feeds.get(feedname)
+    if f is None:
+        encoding: str = config.data["mosquitto"].get("encoding", {}).get(feedname, "json")
+        if encoding not in mqttcodec.ENCODINGS:
+            logger.error(f"unknown encoding {encoding} for {feedname} -> using json")
+            encoding = "json"
+
+        f = Feed(
+            feedname,
+            format_with_clientid(config.data["mosquitto"][feedname]),
+            encoding,
+            alias=feedname in config.data["mosquitto"].get("topic_alias", []),
+            expiry_s=config.data["mosquitto"].get("message_expiry_s", {}).get(feedname, 0),
+        )
+        _feeds[feedname] = f
+    return f
+
+
 def get_feed(feedname: str) -> str | None:
-    return format_with_clientid(config.data["mosquitto"][feedname])
+    return feed(feedname).topic
+
+
+def get_spool() -> flashqueue.FlashQueue | None:
+    """ the store-and-forward queue on flash - None if disabled in the config (spool.enabled) """
+    global _spool
+
+    if _spool is None and config.data.spool.enabled:
+        sc = config.data.spool
+        _spool = flashqueue.FlashQueue(
+            directory=sc.directory,
+            segment_bytes=sc.segment_bytes,
+            max_segments=sc.max_segments,
+            batch_bytes=sc.batch_bytes,
+            flush_ms=sc.flush_ms,
+        )
+    return _spool
+
+
+def flush_spool() -> None:
+    """ before a reset: whatever is only batched in RAM goes to flash """
+    if _spool is not None:
+        _spool.flush()
+
+
+def flush_spool_if_due() -> None:
+    """ periodically, online or not: the batch goes to flash once it is spool.flush_ms old """
+    if _spool is not None:
+        _spool.flush_if_due()
+
+
+async def drain_spool() -> int:
+    sp: flashqueue.FlashQueue | None = get_spool()
+    if sp is None or sp.draining or not sp.pending() or not is_online():
+        return 0
+
+    try:
+        n: int = await sp.drain(_mqttclient)
+    except Exception as ex:
+        # whatever is left stays on flash for the next connect
+        logger.warning(f"draining the spool failed: {ex!r}")
+        return 0
+
+    logger.info(f"drained {n} spooled publishes ({sp.expired=} {sp.dropped=})")
+    return n
 
 
 mosquitto_to_send_base_data: dict = {
@@ -114,31 +1018,187 @@ mosquitto_to_send_base_data: dict = {
 }
 
 def pop_cmd_received() -> tuple[int, str, str | None] | None:
-    if len(_received_commands) > 0:
-        r: tuple[int, str, str | None] = _received_commands.pop(0)
-        return r
+    return _received_commands.pop()
+
+# command-registry: name -> async handler(arg: str | None), see register_command()
+# registered names are matched on the raw bytes and handed out as these (shared) strings
+_commands: dict = {}
+_commands_b: list[tuple[bytes, str, bool]] = []
+
+
+def register_command(name: str, handler, idempotent: bool = False) -> None:
+    """ idempotent: running it twice is the same as once (e.g. reboot) - repeats are coalesced while it is queued """
+    global _commands_b
+    _commands_b = [c for c in _commands_b if c[1] != name]
+    _commands_b.append((name.encode(), name, idempotent))
+    _commands[name] = handler
+
+
+def command_handler(cmd: str):
+    """ -> the async handler(arg) registered for cmd - None if unknown """
+    return _commands.get(cmd)
+
+
+def _targets_me(target: dict | None) -> bool:
+    """ all given selectors have to match: hostname_prefix, macs (list), groups (list, any of mosquitto.groups) """
+    if not target:
+        return True
+
+    hp: str | None = target.get("hostname_prefix")
+    if hp is not None and not wifi.wlan.config("hostname").startswith(hp):
+        return False
+
+    macs: list | None = target.get("macs")
+    if macs is not None and wifi.mac_no_colon not in [m.lower().replace(":", "") for m in macs]:
+        return False
+
+    groups: list | None = target.get("groups")
+    if groups is not None:
+        mine: list = config.data["mosquitto"].get("groups", [])
+        if not [g for g in groups if g in mine]:
+            return False
+
+    return True
+
+
+def _on_broadcast(topic, msg, retained):
+    """ fleet-command on the broadcast-/group-feeds:
+    {"cmd": "reboot", "arg": null, "target": {"hostname_prefix": .., "macs": [..], "groups": [..]}, "window_s": 600}
+    a matching device runs it at a random moment within window_s (so the fleet does not act all at once)
+    """
+    if retained:
+        return  # a fleet-command is meant for the devices online right now
+
+    try:
+        d: dict = ujson.loads(bytes(msg))
+        cmd: str = d["cmd"]
+    except Exception as ex:
+        logger.warning(f"invalid broadcast {bytes(msg)}: {ex!r}")
+        return
+
+    if not _targets_me(d.get("target")):
+        return
+
+    idempotent: bool = False
+    for _, cs, idem in _commands_b:
+        if cs == cmd:
+            cmd = cs
+            idempotent = idem
+            break
+    else:
+        logger.warning(f"unknown broadcast command: {cmd}")
+        _received_commands.count_drop("unknown")
+        return
+
+    arg: str | None = d.get("arg")
+    window_ms: int = min(int(d.get("window_s", 0)), config.data["mosquitto"].get("broadcast_max_window_s", 3_600)) * 1000
+    delay_ms: int = random.getrandbits(30) % window_ms if window_ms > 0 else 0
+    logger.info(f"broadcast {cmd=} {arg=} in {delay_ms}ms")
+
+    if idempotent:
+        for s in _scheduled:
+            if s[1] == cmd and s[2] == arg:
+                _received_commands.coalesced += 1
+                return
+
+    if len(_scheduled) >= config.data["mosquitto"].get("broadcast_max_scheduled", 4):
+        _received_commands.count_drop(cmd)
+        return
+
+    _scheduled.append([time.ticks_add(time.ticks_ms(), delay_ms), cmd, arg, idempotent])
+    run_due_broadcasts()
+
+
+def run_due_broadcasts() -> None:
+    """ broadcast-commands whose slot has come -> the command-queue (executed by main.check_msgs) """
+    now: int = time.ticks_ms()
+    for s in list(_scheduled):
+        if time.ticks_diff(now, s[0]) < 0:
+            continue
+        _scheduled.remove(s)
+
+        a: bytes = b"" if s[2] is None else str(s[2]).encode()
+        if not _received_commands.push(time.time(), s[1], a, 0, len(a), coalesce=s[3]):
+            logger.warning(f"broadcast command {s[1]} not queued ({len(_received_commands)} queued)")
+
+
+def add_route(topic_filter: str, handler, qos: int = 0) -> None:
+    """ handler(topic, msg, retained) for every message matching topic_filter (+/# wildcards) - topic and msg are
+    memoryviews into the rx-buffer, only valid during the call. subscribed with the next session (or right away)
+    """
+    tf: bytes = topic_filter.encode()
+    new: bool = tf not in _router.filters
+    _router.add(tf, handler)
+    _route_qos[tf] = max(qos, _route_qos.get(tf, 0))
+
+    if new and is_online():
+        asyncio.create_task(_mqttclient.subscribe(topic=tf, qos=_route_qos[tf]))
+
+
+
+def _is_ws(c: int) -> bool:
+    return c == 0x20 or c == 0x09 or c == 0x0A or c == 0x0D
+
+
+def _mv_eq(mv, start: int, end: int, b: bytes) -> bool:
+    # mv[start:end] == b without creating the slice (memoryview does not compare by content on micropython)
+    n: int = len(b)
+    if end - start != n:
+        return False
+    for i in range(n):
+        if mv[start + i] != b[i]:
+            return False
+    return True
 
-    return None
 
 def sub_cb(topic, msg, retained):
+    """ topic and msg are memoryviews into the rx-buffer of the client - only valid during this call """
     global _lastping
     _lastping = time.time()
 
-    msg: str = msg.decode("utf-8")
-    topic = topic.decode("utf-8")
-    logger.info(f"{topic=} {msg=} {retained=}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"topic={bytes(topic)} msg={bytes(msg)} {retained=}")
+
+    if not _router.route(topic, msg, retained):
+        logger.warning(f"no route for {bytes(topic)}")
+
+
+def _on_control(topic, msg, retained):
+    """ "<command> [<arg>]" -> _received_commands (see pop_cmd_received()) """
+    n: int = len(msg)
+    start: int = 0
+    while start < n and _is_ws(msg[start]):
+        start += 1
+    end: int = start
+    while end < n and not _is_ws(msg[end]):
+        end += 1
+
+    if start == end:
+        logger.warning("empty command received")
+        return
+
+    cmd: str | None = None
+    idempotent: bool = False
+    for cb, cs, idem in _commands_b:
+        if _mv_eq(msg, start, end, cb):
+            cmd = cs
+            idempotent = idem
+            break
 
-    if topic == _controlfeed:
-        cmd_arg = msg.split(None, 1)
-        cmd: str = cmd_arg[0]
-        arg: str | None = None
+    while end < n and _is_ws(msg[end]):
+        end += 1
 
-        if len(cmd_arg) > 1:
-            arg = cmd_arg[1]
+    if cmd is None:
+        # nothing to queue for it (and no string to allocate per message of a flood)
+        logger.warning(f"unknown command: {bytes(msg[start:n])}")
+        _received_commands.count_drop("unknown")
+        return
 
-        logger.info(f"received {cmd=} {arg=} {retained=}")
-        if not retained:
-            _received_commands.append((_lastping, cmd, arg))
+    logger.info(f"received {cmd=} arg={bytes(msg[end:n])} {retained=}")
+    if not retained:
+        if not _received_commands.push(_lastping, cmd, msg, end, n, coalesce=idempotent):
+            # a repeated idempotent one (coalesced) or the queue is full (dropped)
+            logger.warning(f"command {cmd} not queued ({len(_received_commands)} queued)")
 
 
 def get_ip(host, port=80):
@@ -146,61 +1206,160 @@ def get_ip(host, port=80):
     return addr_info[0][-1][0]
 
 
-def ensure_mqtt_connect():
-    global _mqttclient, _keepalive, _controlfeed, _lastping
+def _get_client() -> MQTTClient:
+    global _mqttclient
+
+    if _mqttclient is None:
+        _mqttclient = MQTTClient(
+            client_id=get_client_id(),
+            server=config.data["mosquitto"]["MOSQUITTO_HOST"],
+            port=config.data["mosquitto"]["MOSQUITTO_PORT"],
+            keepalive=_keepalive,
+            password=config.data["mosquitto"]["MOSQUITTO_PASSWORD"],
+            user=config.data["mosquitto"]["MOSQUITTO_USERNAME"],
+            max_inflight=config.data["mosquitto"].get("max_inflight", 8),
+            rx_buffer_size=config.data["mosquitto"].get("rx_buffer_size", 512),
+            tx_buffer_size=config.data["mosquitto"].get("tx_buffer_size", 256),
+            protocol=config.data["mosquitto"].get("protocol", 4),
+            session_expiry_s=config.data["mosquitto"].get("session_expiry_s", 86_400) if _persistent_session() else 0,
+        )
 
-    with lock:
-        if _mqttclient is None:
-            _mqttclient = MQTTClient(
-                client_id=get_client_id(),
-                server=config.data["mosquitto"]["MOSQUITTO_HOST"],
-                port=config.data["mosquitto"]["MOSQUITTO_PORT"],
-                keepalive=_keepalive,
-                password=config.data["mosquitto"]["MOSQUITTO_PASSWORD"],
-                user=config.data["mosquitto"]["MOSQUITTO_USERNAME"],
-            )
+        _mqttclient.set_callback(sub_cb)
+        _mqttclient.ping_cb = wifi.link.ping_ms.add
 
-            _mqttclient.set_callback(sub_cb)
+        _mqttclient.set_last_will(
+            format_with_clientid(config.data["mosquitto"]["lwtfeed"]),
+            "OFFLINE",
+            qos=1,
+            retain=True,
+        )
 
-            _mqttclient.set_last_will(
-                format_with_clientid(config.data["mosquitto"]["lwtfeed"]),
-                "OFFLINE",
-                qos=1,
-                retain=True,
-            )
-            _mqttclient.connect(clean_session=True)
-            _mqttclient.publish(
-                format_with_clientid(config.data["mosquitto"]["lwtfeed"]),
-                "ONLINE",
-                qos=1,
-                retain=True,
-            )
+    return _mqttclient
+
+
+def is_connected() -> bool:
+    return _mqttclient is not None and _mqttclient.isconnected()
+
+
+def is_online() -> bool:
+    """ connected and the session is set up (ONLINE published, control-feed subscribed) """
+    return _session_up and is_connected()
+
+
+def _persistent_session() -> bool:
+    return config.data.mosquitto.persistent_session
+
+
+async def connect_socket() -> None:
+    """ reconnect-layer "mqtt": tcp + CONNECT/CONNACK """
+    global _session_up, _session_present, _session_restored
+
+    _session_up = False
+    c: MQTTClient = _get_client()
+
+    # after a deepsleep: pid-counter + unacked publishes from the RTC-memory (see prepare_deepsleep())
+    if _persistent_session() and not _session_restored:
+        _session_restored = True
+        st: bytes | None = rtcstore.get("mq")
+        if st is not None and st[1:1 + st[0]] == c.client_id.encode():
+            n: int = c.restore_session(st[1 + st[0]:])
+            logger.info(f"restored mqtt-session from RTC-memory ({n} unacked publishes)")
+        rtcstore.put("mq", None)
 
-            _controlfeed = format_with_clientid(config.data["mosquitto"]["controlfeed"])
-            _mqttclient.subscribe(
-                topic=_controlfeed
+    _session_present = await c.connect(clean_session=not _persistent_session())
+    if not _session_present:
+        rtcstore.put("ms", None)
+
+
+async def setup_session() -> None:
+    """ reconnect-layer "session": ONLINE, subscriptions, full status and the spooled publishes
+    with a resumed persistent session the broker still has the subscription (and queued the commands that came in
+    meanwhile) - then nothing is waited for here and the first publish can go out right after the CONNACK
+    """
+    global _controlfeed, _replyfeed, _lastping, _session_up
+
+    if _controlfeed is None:
+        _controlfeed = format_with_clientid(config.data["mosquitto"]["controlfeed"])
+        # qos1, so that the broker queues commands for a persistent session while we sleep
+        add_route(_controlfeed, _on_control, qos=1 if _persistent_session() else 0)
+
+        if "replyfeed" in config.data["mosquitto"]:
+            _replyfeed = format_with_clientid(config.data["mosquitto"]["replyfeed"])
+            add_route(_replyfeed, _on_reply)
+
+        # fleet-commands (see _on_broadcast()): one topic for everybody + one per group this device is in
+        if "broadcastfeed" in config.data["mosquitto"]:
+            add_route(config.data["mosquitto"]["broadcastfeed"], _on_broadcast, qos=1)
+        if "groupfeed" in config.data["mosquitto"]:
+            for g in config.data["mosquitto"]["groups"]:
+                add_route(config.data["mosquitto"]["groupfeed"].format(group=g), _on_broadcast, qos=1)
+
+    subscribed: bytes = b"\n".join(_router.filters)
+    resumed: bool = _session_present and rtcstore.get("ms") == subscribed
+
+    await _mqttclient.publish(
+        format_with_clientid(config.data["mosquitto"]["lwtfeed"]),
+        "ONLINE",
+        qos=1,
+        retain=True,
+        wait=not resumed,
+    )
+
+    # whoever subscribed while we were gone needs the full status again
+    _status_delta.force_keyframe()
+
+    if not resumed:
+        # mqtt5: retain_handling 2 - a retained command is not executed again with every (re-)subscribe
+        for tf in _router.filters:
+            await _mqttclient.subscribe(
+                topic=tf,
+                qos=_route_qos.get(tf, 0),
+                retain_handling=config.data["mosquitto"].get("retain_handling", 0),
             )
+        if _persistent_session():
+            rtcstore.put("ms", subscribed)
+
+    _lastping = time.time()
+    _session_up = True
 
-        _mqttclient.ping()
-        _lastping = time.time()
+    if _spool is not None and _spool.pending():
+        asyncio.create_task(drain_spool())
 
 
-def ensure_mqtt_catch_reset(reset_if_mqtt_fails: bool = True):
+async def prepare_deepsleep(timeout_ms: int = 2_000) -> None:
+    """ OFFLINE, wait for the outstanding PUBACKs, keep the session-state in the RTC-memory and disconnect cleanly
+    (a persistent session stays on the broker and collects the commands until we are back)
+    """
+    flush_spool()
+    if not is_connected():
+        return
+
     try:
-        ensure_mqtt_connect()
+        await _mqttclient.publish(
+            format_with_clientid(config.data["mosquitto"]["lwtfeed"]),
+            "OFFLINE",
+            qos=1,
+            retain=True,
+            wait=False,
+        )
+        await _mqttclient.flush(timeout_ms)
     except Exception as ex:
-        _timestring = time.getisotimenow()
+        logger.warning(f"prepare_deepsleep: {ex!r}")
+
+    if _persistent_session():
+        cid: bytes = _mqttclient.client_id.encode()
+        rtcstore.put("mq", bytes((len(cid),)) + cid + _mqttclient.session_state(max_bytes=min(1024, rtcstore.free() - 64)))
 
-        _out = io.StringIO()
-        sys.print_exception(ex)
-        sys.print_exception(ex, _out)
+    await _mqttclient.disconnect()
 
-        logger.error(_out.getvalue())
 
-        if reset_if_mqtt_fails:
-            logger.debug("RESETTING...")
-            time.sleep(29)
-            machine.soft_reset()
+async def ensure_mqtt_connect():
+    if is_online():
+        return
+
+    if not is_connected():
+        await connect_socket()
+    await setup_session()
 
 
 def value_to_mqtt_string(
@@ -213,42 +1372,252 @@ def value_to_mqtt_string(
     return ujson.dumps(d)
 
 
-def publish_one(topic: str, msg: str, qos: int = 1, retain: bool = True):
-    global _lastping, _mqttclient, lock
+def _put_ascii(buf: bytearray, i: int, s: str) -> int:
+    n: int = len(s)
+    try:
+        buf[i:i + n] = s  # micropython: str has the buffer-protocol -> no encode()-copy
+    except TypeError:
+        buf[i:i + n] = s.encode()
+    return i + n
 
-    logger.debug(f"publish_one {topic=} {len(msg)=} {qos=}")
 
-    with lock:
-        _mqttclient.publish(topic=topic, msg=msg, retain=retain, qos=qos)
+def _put_int(buf: bytearray, i: int, v: int) -> int:
+    # writes the decimal digits of v without creating a str
+    if v < 0:
+        buf[i] = 0x2D  # -
+        i += 1
+        v = -v
+    if v == 0:
+        buf[i] = 0x30
+        return i + 1
 
-    logger.debug(f"publisheD {topic=}")
-    _lastping = time.time()
+    n: int = 0
+    t: int = v
+    while t:
+        t //= 10
+        n += 1
 
+    j: int = i + n
+    while v:
+        j -= 1
+        buf[j] = 0x30 + v % 10
+        v //= 10
 
-def check_msg():
-    with lock:
-        _mqttclient.check_msg()
+    return i + n
 
 
-def ping_if_needed(threshhold: int = 10):
-    global _keepalive
-    global _lastping
-    now: int = time.time()
-    if now - _lastping > _keepalive - threshhold:
-        logger.debug("=> PING")
+_TEMPLATE_MID: bytes = b'", "value": '
+
 
-        with lock:
-            _mqttclient.ping()
+# {<static fields>, "created_at": "<iso-time>", "value": <value>} - the static part is serialized once,
+# render() only splices created_at and value into the preallocated buffer (ints without any allocation)
+class PayloadTemplate:
+    def __init__(self, static: dict, capacity: int = 96):
+        s: str = ujson.dumps(static)
+        head: bytes = (s[:-1] + (", " if static else "") + '"created_at": "').encode()
 
-        _lastping = now
+        self._head_len: int = len(head)
+        self._buf: bytearray = bytearray(self._head_len + capacity)
+        self._buf[:self._head_len] = head
+        self._mv: memoryview = memoryview(self._buf)
 
+    def _ensure(self, needed: int) -> None:
+        if needed > len(self._buf):
+            nb: bytearray = bytearray(needed + 32)
+            nb[:self._head_len] = self._buf[:self._head_len]
+            self._buf = nb
+            self._mv = memoryview(nb)
 
+    def render(self, value: str | float | int | dict, created_at: str | None = None) -> memoryview:
+        """ the returned view is only valid until the next render() """
+        if created_at is None:
+            created_at = time.getisotimenow()
 
-def send_status_to_mosquitto(include_wifi_scan: bool = True):
+        enc: bytes | None = None
+        vlen: int = 20
+        if type(value) is not int:
+            enc = ujson.dumps(value).encode()
+            vlen = len(enc)
+
+        self._ensure(self._head_len + len(created_at) + len(_TEMPLATE_MID) + vlen + 1)
+        buf: bytearray = self._buf
+
+        i: int = _put_ascii(buf, self._head_len, created_at)
+        buf[i:i + len(_TEMPLATE_MID)] = _TEMPLATE_MID
+        i += len(_TEMPLATE_MID)
+
+        if enc is None:
+            i = _put_int(buf, i, value)
+        else:
+            buf[i:i + vlen] = enc
+            i += vlen
+
+        buf[i] = 0x7D  # }
+        return self._mv[:i + 1]
+
+
+_payload_template: PayloadTemplate = PayloadTemplate(mosquitto_to_send_base_data)
+
+
+def value_to_mqtt_payload(value: str | float | int | dict, created_at: str | None = None) -> memoryview:
+    """ same json as value_to_mqtt_string(), but rendered from the pre-serialized template
+    (valid until the next call - hand it straight to publish_one)
+    """
+    return _payload_template.render(value, created_at)
+
+
+def feed_payload(f: Feed, value: str | float | int | dict) -> bytes | memoryview:
+    """ value encoded the way the feed is configured (mosquitto.encoding) - values without a packed layout are sent as json """
+    if f.encoding == "cbor":
+        return mqttcodec.cbor_document(mosquitto_to_send_base_data, value)
+
+    if f.encoding == "packed":
+        try:
+            return mqttcodec.pack(value)
+        except ValueError:
+            pass
+
+    return value_to_mqtt_payload(value)
+
+
+def rpc_payload(f: Feed, value: str | float | int | dict, rpc_id: int) -> bytes:
+    """ like feed_payload(), plus "rpc": {"id": rpc_id, "reply_to": <replyfeed>} - packed has no room for it -> json """
+    rpc: dict = {"id": rpc_id, "reply_to": _replyfeed}
+
+    if f.encoding == "cbor":
+        base: dict = mosquitto_to_send_base_data.copy()
+        base["rpc"] = rpc
+        return mqttcodec.cbor_document(base, value)
+
+    d: dict = mosquitto_to_send_base_data.copy()
+    d["created_at"] = time.getisotimenow()
+    d["value"] = value
+    d["rpc"] = rpc
+    return ujson.dumps(d).encode()
+
+
+def _on_reply(topic, msg, retained):
+    """ {"id": <correlation-id>, "ok": true|false, ...} from the responder of an rpc_call() """
+    if retained:
+        return
+
+    try:
+        resp: dict = ujson.loads(bytes(msg))
+        p: list | None = _rpc_pending.get(resp["id"])
+    except Exception as ex:
+        logger.warning(f"invalid rpc-reply {bytes(msg)}: {ex!r}")
+        return
+
+    if p is None:
+        logger.warning(f"rpc-reply for unknown/timed out id {resp['id']}")
+        return
+
+    p[1] = resp
+    p[0].set()
+
+
+async def rpc_call(topic: Feed, value: str | float | int | dict, method: str | None = None,
+                   timeout_ms: int = 5_000, retain: bool = False) -> dict:
+    """ publishes value (with a correlation-id and the reply-topic) and waits for the reply of the responder
+    (e.g. node-red) - raises MQTTException if offline or no reply came within timeout_ms
+    -> the reply ({"id": .., "ok": .., ...}), its round-trip time is added to rpc_latency[method]
+    """
+    global _rpc_id
+
+    if method is None:
+        method = topic.name
+
+    if not is_online() or _replyfeed is None:
+        raise MQTTException("not connected")  # not spooled: nobody could answer it later
+
+    _rpc_id = _rpc_id + 1 if _rpc_id < 0x7FFFFFFF else 1
+    rpc_id: int = _rpc_id
+    p: list = [asyncio.Event(), None, method, time.ticks_ms()]
+    _rpc_pending[rpc_id] = p
+
+    try:
+        await publish_one(topic, rpc_payload(topic, value, rpc_id), qos=1, retain=retain, wait=False, spool=False)
+        await asyncio.wait_for_ms(p[0].wait(), timeout_ms)
+    except asyncio.TimeoutError:
+        rpc_timeouts[method] = rpc_timeouts.get(method, 0) + 1
+        raise MQTTException(f"no reply for rpc {method} id={rpc_id} within {timeout_ms}ms")
+    finally:
+        _rpc_pending.pop(rpc_id, None)
+
+    h: stats.LogHistogram | None = rpc_latency.get(method)
+    if h is None:
+        h = rpc_latency[method] = stats.LogHistogram()
+    h.add(time.ticks_diff(time.ticks_ms(), p[3]))
+
+    return p[1]
+
+
+async def publish_one(topic: str | Feed, msg: str | bytes | bytearray | memoryview, qos: int = 1,
+                      retain: bool = True, wait: bool = True, spool: bool = True,
+                      ttl_s: int | None = None) -> PubAck | None:
+    """ wait=False: do not wait for the PUBACK of a qos1-publish (it stays in the in-flight window of the client)
+    hot paths should pass a Feed (see feed()) and an encoded msg - then nothing has to be formatted/encoded here
+
+    spool: while not connected (or the spool is drained) the publish goes to the flash-queue (see get_spool())
+    and None is returned - ttl_s: drop it if not sent within that time (None: the message-expiry of the Feed or
+    spool.default_ttl_s, 0: never)
+    """
+    global _lastping, _mqttclient, first_publish_ms
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"publish_one {topic=} {len(msg)=} {qos=} {wait=}")
+
+    topic_b: str | bytes = topic.topic_b if isinstance(topic, Feed) else topic
+    alias: bool = isinstance(topic, Feed) and topic.alias
+    expiry_s: int = topic.expiry_s if isinstance(topic, Feed) else 0
+    if ttl_s is None and expiry_s:
+        ttl_s = expiry_s
+
+    sp: flashqueue.FlashQueue | None = get_spool() if spool else None
+
+    # as long as something is spooled, new publishes queue up behind it (keeps the order)
+    if sp is not None and (not is_online() or sp.draining or sp.pending()):
+        if ttl_s is None:
+            ttl_s = config.data.spool.default_ttl_s
+        sp.append(topic_b, msg, qos=qos, retain=retain, ttl_s=ttl_s)
+
+        if is_online() and not sp.draining:
+            asyncio.create_task(drain_spool())
+        return None
+
+    if _mqttclient is None:
+        raise MQTTNotConnected("not connected")
+
+    try:
+        ret: PubAck | None = await _mqttclient.publish(topic=topic_b, msg=msg, retain=retain, qos=qos, wait=wait,
+                                                       alias=alias, expiry_s=expiry_s)
+    except (OSError, MQTTNotConnected) as ex:
+        # the connection went away while sending (the packet is not in the in-flight window then) - or was already
+        # gone when it got to the send. not on a PUBACK-timeout: that packet is still in flight and goes out again
+        if sp is None:
+            raise
+        logger.warning(f"publish failed: {ex!r} -> spooled")
+        if ttl_s is None:
+            ttl_s = config.data.spool.default_ttl_s
+        sp.append(topic_b, msg, qos=qos, retain=retain, ttl_s=ttl_s)
+        return None
+
+    _lastping = time.time()
+
+    if first_publish_ms is None:
+        first_publish_ms = time.ticks_ms()
+        logger.info(f"first publish {first_publish_ms}ms after boot ({machine.reset_cause()=})")
+
+    return ret
+
+
+async def send_status_to_mosquitto(include_wifi_scan: bool = True):
     global boottime_local_str, boottime_gmt, last_status_gmt
 
-    ifconfig: tuple = wifi.ensure_wifi_catch_reset(reset_if_wifi_fails=True)
-    ensure_mqtt_catch_reset(reset_if_mqtt_fails=True)
+    if not is_online():
+        return  # (re-)connecting is up to the reconnect-controller (see main.setup)
+
+    ifconfig: tuple = wifi.wlan.ifconfig()
 
     statusdata: dict = {
         "wifi": {
@@ -257,7 +1626,10 @@ def send_status_to_mosquitto(include_wifi_scan: bool = True):
             "gateway": ifconfig[2],
             "dns": ifconfig[2],
             "strength": wifi.get_wifi_strength(),
+            "strength_avg": None if wifi.manager.rssi_avg is None else round(wifi.manager.rssi_avg),
+            "roams": wifi.manager.roams,
             "config": wifi.get_wifi_config(),
+            "connect": {"path": wifi.connect_path, "ms": wifi.connect_ms},
         }
     }
 
@@ -266,31 +1638,83 @@ def send_status_to_mosquitto(include_wifi_scan: bool = True):
     else:
         statusdata["wifi_scan"] = None
 
+    statusdata["link"] = wifi.link.to_dict()
+
+    statusdata["mqtt"] = {
+        "rx_dropped_oversize": _mqttclient.rx_dropped_oversize,
+        "session_present": _session_present,
+        "first_publish_ms": first_publish_ms,
+    }
+
+    if rpc_latency or rpc_timeouts:
+        statusdata["rpc"] = {
+            "latency_ms": {m: h.to_dict() for m, h in rpc_latency.items()},
+            "timeouts": rpc_timeouts,
+        }
+
+    statusdata["commands"] = {
+        "queued": len(_received_commands),
+        "scheduled": len(_scheduled),
+        "coalesced": _received_commands.coalesced,
+        "dropped": _received_commands.dropped,
+    }
+
+    if _spool is not None:
+        statusdata["spool"] = {
+            "pending": _spool.pending(),
+            "drained": _spool.drained,
+            "expired": _spool.expired,
+            "dropped": _spool.dropped,
+        }
+
     rtseconds: int = round(time.time() - boottime_gmt)
     statusdata["runtime_seconds"] = rtseconds
     statusdata["running_since"] = boottime_local_str
 
     statusdata["reboot_pending_in"] = -1
-    if config.data["forcerestart_after_running_seconds"] > 0:
-        statusdata["reboot_pending_in"] = (
-            config.data["forcerestart_after_running_seconds"] - rtseconds
-        )
+    if forcerestart_after_s() > 0:
+        statusdata["reboot_pending_in"] = forcerestart_after_s() - rtseconds
+
+    f: Feed = feed("statusfeed")
+
+    # keyframes are retained (late subscribers start from there), the deltas in between are not.
+    # the packed layout is fixed-size anyway -> always complete
+    keyframe: bool = True
+    if f.encoding != "packed":
+        statusdata, keyframe = _status_delta.next(statusdata)
 
-    msg: str = value_to_mqtt_string(value=statusdata)
+    msg: bytes | memoryview = feed_payload(f, statusdata)
 
-    logger.debug(msg)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{f.encoding} {keyframe=} {bytes(msg)}")
 
-    publish_one(
-        topic=get_feed("statusfeed"),
+    await publish_one(
+        topic=f,
         msg=msg,
         qos=1,
-        retain=True,
+        retain=keyframe,
+        wait=False,
+        spool=False,  # outdated by the next one anyway
     )
-    # mqttwrap.loop()
     last_status_gmt = time.mktime(time.gmtime())
 
 
-def check_msgs(_=None):
+def _status_due(now: int) -> bool:
+    """ every TELE_PERIOD - with stagger.enabled in this devices own slot of the period (also the first one) """
+    global _next_status_gmt
+
+    phase: int = stagger_offset(TELE_PERIOD, "status")
+    if _next_status_gmt is None:
+        _next_status_gmt = now if phase == 0 else stagger.next_slot(now, TELE_PERIOD, phase)
+
+    if now < _next_status_gmt:
+        return False
+
+    _next_status_gmt = now + TELE_PERIOD if phase == 0 else stagger.next_slot(now, TELE_PERIOD, phase)
+    return True
+
+
+async def check_msgs(_=None):
     global last_status_gmt, TELE_PERIOD
 
     now: float = time.mktime(time.gmtime())
@@ -300,25 +1724,12 @@ def check_msgs(_=None):
 
     # logger.debug(f"{last_status_gmt=} now-last_status_gmt={ll} {TELE_PERIOD=}")
 
-    if not last_status_gmt or now - last_status_gmt > TELE_PERIOD:
-        send_status_to_mosquitto(include_wifi_scan=False)
+    if _status_due(int(now)):
+        # the scan comes from the scan-cache (no blocking), but it is only in the status if configured
+        await send_status_to_mosquitto(include_wifi_scan=config.data.wifi_scan.in_status)
         last_status_gmt = now
 
-    # logger.debug("check_msgs")
-
-    check_msg()
-    ping_if_needed(threshhold=10)
-
-
-def loop():
-    # logger.debug("loop")
-    ifdata: str | None = wifi.ensure_wifi()
-    if not ifdata:
-        logger.error("No wifi connected - sleeping 30s now and then restarting...")
-        time.sleep(30)
-        machine.reset()
-
-    with lock:
-        _mqttclient.check_msg()
+    # incoming messages are read (and pings are sent) by the background-tasks of the client
 
-    # logger.debug("looped")
+    if _spool is not None:
+        await drain_spool()
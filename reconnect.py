@@ -0,0 +1,118 @@
+# layered reconnect: wifi -> mqtt-socket -> mqtt-session (ONLINE, subscribe, spool-drain).
+# every layer has its own exponential backoff with random jitter (so a broker-restart does not make the whole fleet
+# reconnect in lockstep), everything else (ui, countdown, spooling publishes) keeps running in the meantime.
+# only if nothing comes back within reset_after_s, on_give_up (e.g. a reset) is called as the last resort.
+# stagger_ms: after losing the connection, wait this (per device different, see stagger.py) time before the first
+# attempt - the whole fleet notices a broker-restart at the same moment.
+
+import time
+import random
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import logging
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class Backoff:
+    def __init__(self, base_ms: int = 1_000, max_ms: int = 120_000, factor: int = 2, jitter: float = 0.5):
+        """ jitter: the delay is randomly shortened by up to this fraction """
+        self.base_ms = base_ms
+        self.max_ms = max_ms
+        self.factor = factor
+        self.jitter = jitter
+        self.failures: int = 0
+
+    def reset(self) -> None:
+        self.failures = 0
+
+    def next_ms(self) -> int:
+        delay: int = self.base_ms
+        for _ in range(self.failures):
+            delay *= self.factor
+            if delay >= self.max_ms:
+                delay = self.max_ms
+                break
+        self.failures += 1
+
+        return delay - int(delay * self.jitter * random.getrandbits(16) / 65536)
+
+
+class Layer:
+    def __init__(self, name: str, is_up, up, backoff: Backoff, timeout_ms: int = 30_000):
+        """ is_up: () -> bool, up: async () -> ... (raises if it did not work) """
+        self.name = name
+        self.is_up = is_up
+        self.up = up
+        self.backoff = backoff
+        self.timeout_ms = timeout_ms
+        self.failures: int = 0
+
+
+class ReconnectController:
+    def __init__(self, layers: list[Layer], poll_ms: int = 1_000, reset_after_s: int = 3_600, on_give_up=None,
+                 stagger_ms: int = 0):
+        """ reset_after_s: call (async) on_give_up after being down that long - 0: never """
+        self.layers = layers
+        self.poll_ms = poll_ms
+        self.reset_after_s = reset_after_s
+        self.on_give_up = on_give_up
+        self.stagger_ms = stagger_ms
+
+        self.state: str = "down"  # name of the layer that is being brought up - or "up"
+        self.down_since: int | None = None
+        self.reconnects: int = 0
+
+    def is_up(self) -> bool:
+        return self.state == "up"
+
+    async def _step(self) -> Layer | None:
+        """ -> the layer that failed, None if everything is up """
+        for l in self.layers:
+            if l.is_up():
+                continue
+
+            self.state = l.name
+            try:
+                await asyncio.wait_for_ms(l.up(), l.timeout_ms)
+            except Exception as ex:
+                l.failures += 1
+                logger.warning(f"{l.name} down: {ex!r}")
+                return l
+
+            logger.info(f"{l.name} up")
+            l.backoff.reset()
+
+        if self.state != "up" and self.down_since is not None:
+            self.reconnects += 1
+        self.state = "up"
+        return None
+
+    async def run(self) -> None:
+        while True:
+            failed: Layer | None = await self._step()
+
+            if failed is None:
+                self.down_since = None
+                await asyncio.sleep_ms(self.poll_ms)
+                if self.stagger_ms and not all([l.is_up() for l in self.layers]):
+                    logger.info(f"connection lost - first attempt in {self.stagger_ms}ms")
+                    await asyncio.sleep_ms(self.stagger_ms)
+                continue
+
+            if self.down_since is None:
+                self.down_since = time.ticks_ms()
+
+            down_s: int = time.ticks_diff(time.ticks_ms(), self.down_since) // 1000
+            if self.reset_after_s > 0 and down_s >= self.reset_after_s and self.on_give_up is not None:
+                logger.error(f"down for {down_s}s (at {failed.name}) - giving up")
+                await self.on_give_up()
+
+            delay: int = failed.backoff.next_ms()
+            logger.info(f"retrying {failed.name} in {delay}ms (down for {down_s}s)")
+            await asyncio.sleep_ms(delay)
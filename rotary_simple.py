@@ -1,5 +1,9 @@
 import machine
-import micropython
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
 
 import time
 import logging
@@ -8,38 +12,63 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 try:
-    from typing import Callable
+    from typing import Callable, Awaitable
 except Exception as ex:
     logger.error(ex)
 
 import sys
 
-if sys.platform == 'esp8266' or sys.platform == 'esp32':
-    from rotary_irq_esp import RotaryIRQ
-else:
+if sys.platform != 'esp8266' and sys.platform != 'esp32':
     logger.error('Warning:  The Rotary module has not been tested on this platform')
 
+from rotary_irq_esp import RotaryIRQ
+
 shutdown: bool = False
 
-def rotary_loop(pin_num_clk=25,
-                pin_num_dt=26,
-                pin_num_sw=27,
-                min_val=0,
-                max_val=5,
-                reverse=False,
-                range_mode=RotaryIRQ.RANGE_WRAP,
-                click_handler: Callable[[int], None] = None,
-                change_handler: Callable[[int, int], None] = None,
-                loop_handler: Callable[[int], None] = None,
-                init_value:int|None = None
-                ):
+async def _click_loop(sw_pin: machine.Pin, clicked: asyncio.ThreadSafeFlag, click_handler) -> None:
+    while True:
+        await clicked.wait()
+        try:
+            await click_handler(sw_pin)
+        except Exception as ex:
+            import sys
+            import io
+
+            _out = io.StringIO()
+            sys.print_exception(ex)
+            sys.print_exception(ex, _out)
+
+            logger.error(_out.getvalue())
+
+
+async def rotary_loop(pin_num_clk=25,
+                      pin_num_dt=26,
+                      pin_num_sw=27,
+                      min_val=0,
+                      max_val=5,
+                      reverse=False,
+                      range_mode=RotaryIRQ.RANGE_WRAP,
+                      click_handler: Callable[[machine.Pin], Awaitable[None]] = None,
+                      change_handler: Callable[[int, int], None] = None,
+                      loop_handler: Callable[[int], None] = None,
+                      init_value:int|None = None,
+                      period_ms: int = 50
+                      ):
+    """ cooperative version of the rotary-loop: polls the encoder every period_ms and
+    hands clicks (signalled from the pin-irq via ThreadSafeFlag) over to the async click_handler
+    """
 
     global shutdown
     sw_pin: machine.Pin = machine.Pin(pin_num_sw, machine.Pin.IN, machine.Pin.PULL_UP)
 
+    click_task = None
     if click_handler:
+        clicked: asyncio.ThreadSafeFlag = asyncio.ThreadSafeFlag()
+
         def click_handler_cb(pin: machine.Pin) -> None:
-            micropython.schedule(click_handler, pin)
+            clicked.set()
+
+        click_task = asyncio.create_task(_click_loop(sw_pin, clicked, click_handler))
     else:
         def click_handler_cb(pin: machine.Pin) -> None:
             logger.debug(f"CLICKED {pin=} {pin.value()}")
@@ -75,7 +104,7 @@ def rotary_loop(pin_num_clk=25,
                         loop_handler(None)
                         break
 
-                time.sleep_ms(50)
+                await asyncio.sleep_ms(period_ms)
             except Exception as exx:
                 import sys
                 import io
@@ -86,7 +115,7 @@ def rotary_loop(pin_num_clk=25,
 
                 logger.error(_out.getvalue())
                 
-                time.sleep_ms(50)            
+                await asyncio.sleep_ms(period_ms)
     except Exception as ex:
         import sys
         import io
@@ -98,3 +127,5 @@ def rotary_loop(pin_num_clk=25,
         logger.error(_out.getvalue())
     finally:
         sw_pin.irq(handler=None)
+        if click_task:
+            click_task.cancel()
@@ -0,0 +1,106 @@
+# small key -> bytes store in the RTC-memory of the esp32 (machine.RTC().memory(), 2048 bytes):
+# survives deepsleep and soft-resets, but not a power-cycle (-> magic + checksum, garbage reads as empty)
+#
+# layout: b"RS" length(2) checksum(2) {keylen(1) key vallen(2) value}*
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+import machine
+
+_MAGIC: bytes = b"RS"
+_CAPACITY: int = 2048
+
+_rtc = machine.RTC()
+_data: dict[str, bytes] | None = None
+
+
+def _checksum(b) -> int:
+    c: int = 0
+    for i in b:
+        c = (c * 31 + i) & 0xFFFF
+    return c
+
+
+def _load() -> dict[str, bytes]:
+    global _data
+
+    if _data is not None:
+        return _data
+
+    _data = {}
+    try:
+        raw: bytes = _rtc.memory()
+    except Exception:
+        return _data
+
+    if len(raw) < 6 or raw[:2] != _MAGIC:
+        return _data
+
+    n: int = struct.unpack("!H", raw[2:4])[0]
+    body: bytes = raw[6:6 + n]
+    if len(body) != n or _checksum(body) != struct.unpack("!H", raw[4:6])[0]:
+        return _data
+
+    pos: int = 0
+    while pos < n:
+        kl: int = body[pos]
+        key: str = body[pos + 1:pos + 1 + kl].decode()
+        pos += 1 + kl
+        vl: int = struct.unpack("!H", body[pos:pos + 2])[0]
+        _data[key] = body[pos + 2:pos + 2 + vl]
+        pos += 2 + vl
+
+    return _data
+
+
+def _save() -> None:
+    body: bytearray = bytearray()
+    for k, v in _data.items():
+        kb: bytes = k.encode()
+        body.append(len(kb))
+        body += kb
+        body += struct.pack("!H", len(v))
+        body += v
+
+    if len(body) + 6 > _CAPACITY:
+        raise ValueError(f"rtcstore: {len(body) + 6} bytes do not fit into the RTC memory")
+
+    _rtc.memory(_MAGIC + struct.pack("!HH", len(body), _checksum(body)) + body)
+
+
+def get(key: str) -> bytes | None:
+    return _load().get(key)
+
+
+def put(key: str, value: bytes | None) -> None:
+    """ value None removes key """
+    d: dict[str, bytes] = _load()
+    old: bytes | None = d.get(key)
+
+    if value is None:
+        if old is None:
+            return
+        del d[key]
+    else:
+        if old == value:
+            return
+        d[key] = bytes(value)
+
+    try:
+        _save()
+    except ValueError:
+        if value is not None:
+            if old is None:
+                del d[key]
+            else:
+                d[key] = old
+        raise
+
+
+def free() -> int:
+    """ bytes left for one more entry (including its key/length-overhead) """
+    used: int = 6 + sum([3 + len(k.encode()) + len(v) for k, v in _load().items()])
+    return _CAPACITY - used
@@ -0,0 +1,26 @@
+# deterministic per-device phase-offsets: devices that were powered on together (or lost the broker at the same
+# moment) would otherwise publish status, reconnect and reboot in lockstep. the offset is derived from the MAC
+# (FNV-1a), so it is stable across reboots and evenly spread over the fleet; the salt decorrelates the different
+# uses (the device that reports first is not necessarily the one that reboots first)
+
+
+def fraction(mac: str, salt: str = "") -> float:
+    """ -> [0, 1) """
+    h: int = 0x811C9DC5
+    for c in (mac.lower().replace(":", "") + salt).encode():
+        h = ((h ^ c) * 0x01000193) & 0xFFFFFFFF
+    # the low bits of FNV are the weak ones, fold them in
+    h ^= h >> 16
+    return h / 4294967296
+
+
+def offset(mac: str, window: int, salt: str = "") -> int:
+    """ -> [0, window) """
+    return int(fraction(mac, salt) * window)
+
+
+def next_slot(now: int, period: int, phase: int) -> int:
+    """ the next time after now with (time - phase) % period == 0 - on a shared clock (ntp) the fleet ends up
+    spread evenly over the period, no matter when the devices were started
+    """
+    return now + ((phase - now) % period or period)
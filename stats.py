@@ -0,0 +1,51 @@
+# fixed-size histograms for latencies: bucket i counts values in [2^(i-1), 2^i) (bucket 0: < 1), so a few ints
+# cover 1ms .. minutes with ~factor 2 resolution - cheap enough to keep one per rpc-method / measurement
+
+class LogHistogram:
+    def __init__(self, buckets: int = 18):
+        self.counts: list[int] = [0] * buckets
+        self.n: int = 0
+        self.total: int = 0
+        self.min: int | None = None
+        self.max: int | None = None
+
+    def add(self, v: int) -> None:
+        i: int = 0
+        x: int = v
+        while x > 0 and i < len(self.counts) - 1:
+            x >>= 1
+            i += 1
+        self.counts[i] += 1
+
+        self.n += 1
+        self.total += v
+        if self.min is None or v < self.min:
+            self.min = v
+        if self.max is None or v > self.max:
+            self.max = v
+
+    def percentile(self, p: float) -> int | None:
+        """ upper bound of the bucket the p-th percentile (0..100) falls into (capped at max) """
+        if self.n == 0:
+            return None
+
+        rank: int = max(1, int(self.n * p / 100 + 0.5))
+        seen: int = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min((1 << i) - 1, self.max)
+        return self.max
+
+    def mean(self) -> float | None:
+        return self.total / self.n if self.n else None
+
+    def to_dict(self) -> dict:
+        return {
+            "n": self.n,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
@@ -0,0 +1,136 @@
+# delta-encoded status telemetry: most of the status (ip, dns, mac, ssid, running_since, ...) never changes between
+# two reports, so only every keyframe_every-th report (and the first one after a (re-)connect) carries everything.
+# the ones in between only carry the keys that changed since the last report.
+#
+#   keyframe: {"_seq": 17, "_kf": 1, <full status>}
+#   delta:    {"_seq": 18, "runtime_seconds": 12405, "wifi": {"strength": -63}}                (nested dicts are diffed)
+#             {"_seq": 19, ..., "_del": ["wifi/config/ssid"]}                                    (removed keys, if any)
+#
+# plain python, the host-side StatusMerger below rebuilds the full status from keyframe + deltas (tools/merge_status.py)
+
+SEQ: str = "_seq"
+KEYFRAME: str = "_kf"
+DELETED: str = "_del"
+
+
+def _copy(d: dict) -> dict:
+    # the snapshot must not share (mutable) sub-dicts with the status-dict of the caller
+    return {k: _copy(v) if isinstance(v, dict) else v for k, v in d.items()}
+
+
+def _diff(old: dict, new: dict, path: str, deleted: list) -> dict:
+    ret: dict = {}
+    for k, v in new.items():
+        if k not in old:
+            ret[k] = v
+            continue
+
+        o = old[k]
+        if isinstance(v, dict) and isinstance(o, dict):
+            sub: dict = _diff(o, v, f"{path}{k}/", deleted)
+            if sub:
+                ret[k] = sub
+        elif o != v or type(o) is not type(v):
+            ret[k] = v
+
+    for k in old:
+        if k not in new:
+            deleted.append(f"{path}{k}")
+
+    return ret
+
+
+class StatusDelta:
+    def __init__(self, keyframe_every: int = 10):
+        self.keyframe_every = keyframe_every
+        self.seq: int = 0
+        self._last: dict | None = None
+        self._since_keyframe: int = 0
+
+    def force_keyframe(self) -> None:
+        """ e.g. after a reconnect - subscribers that came in between need the full state """
+        self._last = None
+
+    def next(self, status: dict) -> tuple[dict, bool]:
+        """ -> (dict to publish, is_keyframe) """
+        self.seq += 1
+
+        if self._last is None or self._since_keyframe + 1 >= self.keyframe_every:
+            self._since_keyframe = 0
+            self._last = _copy(status)
+
+            ret: dict = dict(status)
+            ret[SEQ] = self.seq
+            ret[KEYFRAME] = 1
+            return ret, True
+
+        self._since_keyframe += 1
+
+        deleted: list = []
+        ret = _diff(self._last, status, "", deleted)
+        if deleted:
+            ret[DELETED] = deleted
+        ret[SEQ] = self.seq
+
+        self._last = _copy(status)
+        return ret, False
+
+
+def _apply(state: dict, delta: dict) -> None:
+    for k, v in delta.items():
+        if isinstance(v, dict) and isinstance(state.get(k), dict):
+            _apply(state[k], v)
+        else:
+            state[k] = v
+
+
+class StatusMerger:
+    """ rebuilds the full status of one device from keyframes and deltas.
+    after a gap in the sequence (lost delta, missed messages) nothing is returned until the next keyframe.
+    """
+
+    def __init__(self):
+        self.state: dict | None = None
+        self.seq: int | None = None
+        self.gaps: int = 0
+
+    def feed(self, value: dict) -> dict | None:
+        seq: int | None = value.get(SEQ)
+
+        if seq is None:  # not delta-encoded at all
+            self.state = _copy(value)
+            self.seq = None
+            return self.state
+
+        if value.get(KEYFRAME):
+            self.state = _copy(value)
+            del self.state[SEQ], self.state[KEYFRAME]
+            self.seq = seq
+            return self.state
+
+        if self.state is None or self.seq is None:
+            return None
+
+        if seq <= self.seq:  # qos1-redelivery
+            return self.state
+
+        if seq != self.seq + 1:
+            self.gaps += 1
+            self.state = None
+            self.seq = None
+            return None
+
+        delta: dict = _copy(value)
+        del delta[SEQ]
+
+        for path in delta.pop(DELETED, []):
+            parts: list = path.split("/")
+            d: dict | None = self.state
+            for p in parts[:-1]:
+                d = d.get(p) if isinstance(d, dict) else None
+            if isinstance(d, dict):
+                d.pop(parts[-1], None)
+
+        _apply(self.state, delta)
+        self.seq = seq
+        return self.state
@@ -0,0 +1,31 @@
+# config.py (against tools/unixport/network.py and the esp32config.json of the repo) - run from the repo root:
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tests/test_config.py
+
+import config
+import testing
+
+
+def test_update_deep_merges_dicts():
+    base: dict = {"mosquitto": {"MOSQUITTO_PORT": 1883, "lwtfeed": "a"}}
+    config.update_deep(base, {"mosquitto": {"lwtfeed": "b"}, "hostname": "x"})
+    assert base == {"mosquitto": {"MOSQUITTO_PORT": 1883, "lwtfeed": "b"}, "hostname": "x"}
+
+
+def test_update_deep_replaces_lists():
+    # an overlay with mosquitto.groups crashed (lists were "merged" like dicts)
+    base: dict = {"mosquitto": {"groups": ["floor1"], "MOSQUITTO_PORT": 1883}}
+    config.update_deep(base, {"mosquitto": {"groups": ["room2"]}})
+    assert base == {"mosquitto": {"groups": ["room2"], "MOSQUITTO_PORT": 1883}}
+
+
+def test_rotary_pins_with_rotary_disabled():
+    # main.run() starts rotary_loop() on its host whatever rotary.enabled says (the default config has it off)
+    r = config.data["rotary"]
+    assert not r["enabled"]
+    assert (r["clk_pin"], r["dt_pin"], r["sw_pin"]) == (25, 26, 27)
+    assert config.data.rotary.clk_pin == 25
+
+
+if __name__ == "__main__":
+    testing.run(globals())
@@ -0,0 +1,71 @@
+# configschema.py - run from the repo root:
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tests/test_configschema.py
+
+import configschema
+import testing
+
+
+def _build(data: dict) -> tuple:
+    problems: list[str] = []
+    return configschema.build(data, problems), problems
+
+
+def test_defaults_for_missing_keys():
+    c, problems = _build({"mosquitto": {"MOSQUITTO_HOST": "broker"}})
+    assert problems == [], problems
+    assert c.mosquitto.MOSQUITTO_HOST == "broker"
+    assert c.mosquitto.max_inflight == 8
+    assert "lwtfeed" not in c.mosquitto  # OPTIONAL stays unset
+    assert c.reconnect.base_ms == 1_000  # section missing in the json: defaults only
+    assert "webrepl" not in c  # ... unless it has REQUIRED keys
+
+
+def test_wrong_types_missing_and_unknown_keys_are_reported():
+    c, problems = _build({"mosquitto": {"MOSQUITTO_PORT": "1883", "nope": 1}, "hostname": "x"})
+    assert sorted(problems) == [
+        "mosquitto.MOSQUITTO_HOST is missing",
+        "mosquitto.MOSQUITTO_PORT: '1883' is not int -> ignored",
+        "mosquitto.nope is unknown -> ignored",
+    ], problems
+    assert c.mosquitto.MOSQUITTO_PORT == 1883
+    assert c.hostname == "x"
+
+
+def test_toggled_sections_are_dropped_unless_enabled():
+    c, _ = _build({"uart": {"enabled": False, "rx_pin": 1, "tx_pin": 2},
+                   "pwm": {"enabled": True, "output_pin": 5},
+                   "espnow": {"channel": 1, "pmk": "k"}})
+    assert c.uart is configschema.DISABLED and not c.uart.enabled
+    assert c.pwm.enabled and c.pwm.output_pin == 5
+    assert c.espnow is configschema.DISABLED  # decided by get_time_per_espnow
+
+
+def test_dict_api():
+    c, _ = _build({"mosquitto": {"MOSQUITTO_HOST": "broker", "max_inflight": 4}})
+    assert c["mosquitto"]["max_inflight"] == 4
+    assert c["mosquitto"].get("lwtfeed", "none") == "none"
+    assert c.get("stagger", {}).get("enabled", True) is False
+    try:
+        c["mosquitto"]["lwtfeed"]
+        assert False
+    except KeyError:
+        pass
+    assert c.mosquitto.to_dict()["max_inflight"] == 4
+
+
+def test_dict_api_sees_only_the_fields():
+    c, _ = _build({"mosquitto": {"MOSQUITTO_HOST": "broker"}})
+    for name in ("get", "keys", "items", "to_dict", "__slots__"):
+        assert name not in c.mosquitto, name
+        assert c.mosquitto.get(name, 1) == 1, name
+        try:
+            c.mosquitto[name]
+            assert False, name
+        except KeyError:
+            pass
+    assert "mosquitto" in c and "get" not in c
+
+
+if __name__ == "__main__":
+    testing.run(globals())
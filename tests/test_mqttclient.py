@@ -0,0 +1,99 @@
+# mqttwrap.MQTTClient against tools/fakebroker.py - run from the repo root:
+#
+#   python3 tools/fakebroker.py --port 18830 --no-puback 'test/noack/#' &
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tests/test_mqttclient.py [host] [port]
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import mqttwrap
+import testing
+
+_HOST, _PORT = testing.broker()
+
+
+def _client(name: str, **kw) -> mqttwrap.MQTTClient:
+    return mqttwrap.MQTTClient(testing.unique(f"test_{name}"), _HOST, _PORT, **kw)
+
+
+async def _subscribed(c: mqttwrap.MQTTClient, topic: str) -> list:
+    """ -> the list the messages on topic end up in """
+    got: list = []
+    c.set_callback(lambda t, m, retained: got.append(bytes(m)))
+    await c.subscribe(topic)
+    return got
+
+
+async def test_publish_subscribe():
+    topic: str = testing.unique("test/pubsub")
+    c: mqttwrap.MQTTClient = _client("pubsub")
+    await c.connect()
+    got: list = await _subscribed(c, topic)
+
+    await c.publish(topic, b"0", qos=0)
+    await c.publish(topic, b"1", qos=1)
+    await asyncio.sleep_ms(200)
+    await c.disconnect()
+
+    assert got == [b"0", b"1"], got
+    assert not c.isconnected()
+
+
+async def test_reconnect_ends_the_loops_of_the_previous_connection():
+    topic: str = testing.unique("test/reconnect")
+    c: mqttwrap.MQTTClient = _client("reconnect")
+    await c.connect()
+
+    old: list = []
+    for _ in range(7):
+        await asyncio.sleep_ms(50)  # the loops are running
+        old += c._tasks
+        await c._close()  # the connection is lost (what the read-loop does on an error)
+        await c.connect()
+    await asyncio.sleep_ms(200)
+
+    running: list = [t for t in old if not t.done()]
+    assert not running, f"{len(running)} loops of the previous connections still running"
+    # and none of them closed the new connection on its way out
+    assert c.isconnected()
+    got: list = await _subscribed(c, topic)
+    await c.publish(topic, b"x", qos=1)
+    await asyncio.sleep_ms(100)
+    tasks: list = c._tasks
+    await c.disconnect()
+    await asyncio.sleep_ms(10)
+
+    assert got == [b"x"], got
+    assert not [t for t in tasks if not t.done()]
+
+
+async def test_unacked_publish_is_sent_once_per_connection():
+    # the broker routes it but never acks it: it goes out again after each reconnect (and not once per old loop)
+    topic: str = testing.unique("test/noack/inflight")
+    mon: mqttwrap.MQTTClient = _client("monitor")
+    await mon.connect()
+    got: list = await _subscribed(mon, topic)
+
+    c: mqttwrap.MQTTClient = _client("inflight", retransmit_ms=60_000)
+    await c.connect()
+    await c.publish(topic, b"x", qos=1, wait=False)
+    old: list = []
+    for _ in range(3):
+        await asyncio.sleep_ms(100)
+        old += c._tasks
+        await c._close()
+        await c.connect()
+    await asyncio.sleep_ms(1_500)
+    inflight: int = c.inflight()
+    await c.disconnect()
+    await mon.disconnect()
+
+    assert inflight == 1
+    assert not [t for t in old if not t.done()]
+    assert got == [b"x"] * 4, got
+
+
+if __name__ == "__main__":
+    testing.run(globals())
@@ -0,0 +1,35 @@
+# mqttcodec.py and mqttwrap.feed_payload() - run from the repo root:
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tests/test_mqttcodec.py
+
+try:
+    import ujson
+except ImportError:
+    import json as ujson
+
+import mqttcodec
+import mqttwrap
+import testing
+
+
+def test_pack_int():
+    assert mqttcodec.unpack(mqttcodec.pack(-42, created_at=1_700_000_000)) == {"created_at": 1_700_000_000, "value": -42}
+    assert mqttcodec.unpack(mqttcodec.pack(0x7FFFFFFF, created_at=1))["value"] == 0x7FFFFFFF
+
+
+def test_pack_int_out_of_range():
+    for v in (2 ** 40, 0x80000000, -0x80000001):
+        try:
+            mqttcodec.pack(v)
+        except ValueError:
+            continue
+        raise AssertionError(f"{v} packed")
+
+
+def test_packed_feed_falls_back_to_json():
+    f: mqttwrap.Feed = mqttwrap.Feed("lightswitchfeed", "esp32/test/trigger", "packed")
+    assert ujson.loads(bytes(mqttwrap.feed_payload(f, 2 ** 40)))["value"] == 2 ** 40
+
+
+if __name__ == "__main__":
+    testing.run(globals())
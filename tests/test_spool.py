@@ -0,0 +1,117 @@
+# mqttwrap.publish_one() -> spool (flashqueue.py) -> drain_spool() against tools/fakebroker.py - run from the repo root:
+#
+#   python3 tools/fakebroker.py --port 18830 &
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tests/test_spool.py [host] [port]
+
+import os
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import config
+import mqttwrap
+import testing
+
+_HOST, _PORT = testing.broker()
+_DIR: str = "/tmp/test_spool"
+
+
+def _spool():
+    try:
+        for n in os.listdir(_DIR):
+            os.remove(f"{_DIR}/{n}")
+    except OSError:
+        pass
+    config.apply({"spool": {"enabled": True, "directory": _DIR, "batch_bytes": 512}})
+    mqttwrap._spool = None
+    return mqttwrap.get_spool()
+
+
+async def _monitor(topic: str) -> tuple:
+    """ -> (client, the list the messages on topic end up in) """
+    got: list = []
+    mon: mqttwrap.MQTTClient = mqttwrap.MQTTClient(testing.unique("test_monitor"), _HOST, _PORT)
+    mon.set_callback(lambda t, m, retained: got.append(bytes(m)))
+    await mon.connect()
+    await mon.subscribe(topic)
+    return mon, got
+
+
+async def test_spooled_while_offline_drained_after_connect():
+    sp = _spool()
+    topic: str = testing.unique("test/spool")
+    mon, got = await _monitor(topic)
+
+    c: mqttwrap.MQTTClient = mqttwrap.MQTTClient(testing.unique("test_spool"), _HOST, _PORT)
+    mqttwrap._mqttclient = c
+    try:
+        for i in range(5):
+            assert await mqttwrap.publish_one(topic, str(i), qos=1) is None
+        assert sp.appended == 5 and sp.pending()
+
+        await c.connect()
+        mqttwrap._session_up = True
+        assert await mqttwrap.drain_spool() == 5
+        await asyncio.sleep_ms(200)
+    finally:
+        mqttwrap._mqttclient = None
+        mqttwrap._session_up = False
+        await c.disconnect()
+        await mon.disconnect()
+
+    assert got == [b"0", b"1", b"2", b"3", b"4"], got
+    assert not sp.pending() and c.inflight() == 0
+
+
+async def test_connection_lost_before_the_send_is_spooled():
+    sp = _spool()
+    c: mqttwrap.MQTTClient = mqttwrap.MQTTClient("test", "127.0.0.1")
+    # online when publish_one() checked, the connection went away before the send (the writer is gone)
+    c.isconnected = lambda: True
+    mqttwrap._mqttclient = c
+    mqttwrap._session_up = True
+    try:
+        ret = await mqttwrap.publish_one("esp32/test/status", b"{}", qos=1)
+    finally:
+        mqttwrap._mqttclient = None
+        mqttwrap._session_up = False
+
+    assert ret is None
+    assert sp.appended == 1 and sp.pending()
+
+
+async def test_puback_timeout_is_not_spooled():
+    # the packet is still in the in-flight window and goes out again from there - spooled, it would go out twice
+    sp = _spool()
+    topic: str = testing.unique("test/noack/spool")  # fakebroker --no-puback 'test/noack/#'
+    mon, got = await _monitor(topic)
+
+    c: mqttwrap.MQTTClient = mqttwrap.MQTTClient(testing.unique("test_timeout"), _HOST, _PORT, ack_timeout_ms=200)
+    await c.connect()
+    mqttwrap._mqttclient = c
+    mqttwrap._session_up = True
+    try:
+        try:
+            await mqttwrap.publish_one(topic, b"x", qos=1)
+            assert False, "no PUBACK, but no exception either"
+        except mqttwrap.MQTTException:
+            pass
+        await c._close()
+        await c.connect()  # -> retransmitted
+        await asyncio.sleep_ms(200)
+        inflight: int = c.inflight()
+    finally:
+        mqttwrap._mqttclient = None
+        mqttwrap._session_up = False
+        await c.disconnect()
+        await mon.disconnect()
+
+    assert sp.appended == 0 and not sp.pending()
+    assert inflight == 1
+    assert got == [b"x", b"x"], got
+
+
+if __name__ == "__main__":
+    testing.run(globals())
@@ -0,0 +1,22 @@
+# stagger.py - run from the repo root:
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tests/test_stagger.py
+
+import stagger
+import testing
+
+
+def test_next_slot():
+    assert stagger.next_slot(101, 10, 3) == 103
+    assert stagger.next_slot(104, 10, 3) == 113
+    assert stagger.next_slot(99, 10, 0) == 100
+
+
+def test_next_slot_now_on_the_slot():
+    # the next one, not now: a status went out on every poll during that second
+    assert stagger.next_slot(100, 10, 0) == 110
+    assert stagger.next_slot(103, 10, 3) == 113
+
+
+if __name__ == "__main__":
+    testing.run(globals())
@@ -0,0 +1,49 @@
+# shared by the tests/test_*.py scripts - each runs on its own from the repo root:
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tests/test_stagger.py
+#
+# the ones that need a broker take its address as arguments (default 127.0.0.1 18830):
+#
+#   python3 tools/fakebroker.py --port 18830 &
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tests/test_mqttclient.py [host] [port]
+
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+
+def broker() -> tuple[str, int]:
+    """ (host, port) from the command line """
+    return (sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1",
+            int(sys.argv[2]) if len(sys.argv) > 2 else 18830)
+
+
+def unique(name: str) -> str:
+    """ client-ids/topics of one run do not meet the (retained) leftovers of the previous ones on the broker """
+    return f"{name}_{time.ticks_ms()}"
+
+
+def run(tests: dict) -> None:
+    """ runs every test_* of tests (the globals() of the script), the async ones each in asyncio.run() -
+    exits with 1 if one of them failed
+    """
+    failed: int = 0
+    for name, f in list(tests.items()):
+        if not name.startswith("test_"):
+            continue
+        try:
+            r = f()
+            if r is not None:
+                asyncio.run(r)
+            print(f"{name} ok")
+        except Exception as ex:
+            failed += 1
+            print(f"{name} FAILED")
+            sys.print_exception(ex)
+
+    if failed:
+        sys.exit(1)
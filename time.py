@@ -175,9 +175,14 @@ def getisotime(timestamp_secs: float) -> str:
     offsethours: int = dd[-1]
     return f"{dd[0]:02d}-{dd[1]:02d}-{dd[2]:02d}T{dd[3]:02d}:{dd[4]:02d}:{dd[5]:02d}+{offsethours:02d}:00"
 
+# getisotimenow() is called for every published value - only re-format once per second
+_ISONOW_CACHE: list = [None, None]
 def getisotimenow() -> str:
     dd: float = mktime(gmtime())
-    return getisotime(dd)
+    if _ISONOW_CACHE[0] != dd:
+        _ISONOW_CACHE[1] = getisotime(dd)
+        _ISONOW_CACHE[0] = dd
+    return _ISONOW_CACHE[1]
 
 def set_had_proper_time_set(timesetproperly: bool = False) -> None:
     """ sets timesetproperly flag and also resets CETTIMEOFFSETHOURS
@@ -187,6 +192,7 @@ def set_had_proper_time_set(timesetproperly: bool = False) -> None:
     global HAD_PROPER_TIME_SET, CETTIMEOFFSETHOURS
     HAD_PROPER_TIME_SET = timesetproperly
     CETTIMEOFFSETHOURS = None
+    _ISONOW_CACHE[0] = None
 
 def get_had_proper_time_set() -> bool:
     global HAD_PROPER_TIME_SET
@@ -0,0 +1,108 @@
+# config.data as the merged json-dict (before) vs. the configschema.Config built from it (config.py now): time per
+# lookup on the paths the code hits all the time, and the RAM kept by config.data (for the Config: with the dict
+# gone - the strings in it are shared)
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_config_access.py [rounds]
+
+import gc
+import sys
+import time
+
+try:
+    import ujson
+except ImportError:
+    import json as ujson
+
+import configschema
+
+
+def _mem() -> int:
+    gc.collect()
+    try:
+        return gc.mem_alloc()
+    except AttributeError:
+        import tracemalloc  # cpython
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _load() -> dict:
+    with open("esp32config.json") as fp:
+        return ujson.load(fp)
+
+
+def _empty(d, c, n: int) -> None:
+    for _ in range(n):
+        pass
+
+
+def _dict_index(d, c, n: int) -> None:
+    for _ in range(n):
+        d["mosquitto"]["max_inflight"]
+
+
+def _dict_get(d, c, n: int) -> None:
+    for _ in range(n):
+        d.get("stagger", {}).get("enabled", False)
+
+
+def _compat_index(d, c, n: int) -> None:
+    for _ in range(n):
+        c["mosquitto"]["max_inflight"]
+
+
+def _compat_get(d, c, n: int) -> None:
+    for _ in range(n):
+        c.get("stagger", {}).get("enabled", False)
+
+
+def _attr(d, c, n: int) -> None:
+    for _ in range(n):
+        c.mosquitto.max_inflight
+
+
+def _attr2(d, c, n: int) -> None:
+    for _ in range(n):
+        c.stagger.enabled
+
+
+def _ns_per_lookup(f, d, c, n: int) -> int:
+    t0: int = time.ticks_us()
+    f(d, c, n)
+    return time.ticks_diff(time.ticks_us(), t0) * 1000 // n
+
+
+def bench(rounds: int) -> None:
+    d: dict = _load()
+    c: configschema.Section = configschema.build(_load(), [])
+
+    loop: int = _ns_per_lookup(_empty, d, c, rounds)
+    print(f"lookups ({rounds} rounds, loop overhead {loop}ns subtracted):")
+    for name, f in (
+        ('dict    data["mosquitto"]["max_inflight"]', _dict_index),
+        ('dict    data.get("stagger", {}).get("enabled", False)', _dict_get),
+        ('Config  data["mosquitto"]["max_inflight"]', _compat_index),
+        ('Config  data.get("stagger", {}).get("enabled", False)', _compat_get),
+        ("Config  data.mosquitto.max_inflight", _attr),
+        ("Config  data.stagger.enabled", _attr2),
+    ):
+        print(f"    {name:56s} {_ns_per_lookup(f, d, c, rounds) - loop:6d}ns")
+    del d, c
+
+    try:
+        import tracemalloc  # cpython: only now, it slows down the timing
+        tracemalloc.start()
+    except ImportError:
+        pass
+
+    m0: int = _mem()
+    d = _load()
+    m_dict: int = _mem() - m0
+    c = configschema.build(d, [])
+    del d
+    m_config: int = _mem() - m0
+    print(f"config.data retains: dict {m_dict} bytes, Config {m_config} bytes "
+          f"({len(c.keys())} keys, {len([k for k, v in c.items() if v is configschema.DISABLED])} sections disabled)")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,110 @@
+# config load time and RAM retained by config.data for a fleet config with n device overlays: what config.py does
+# with the json (parse everything, merge the overlay of this MAC) vs. importing the module tools/compile_config.py
+# pre-merged for this MAC. (on the device the .mpy is faster still: no compiling of the source at import)
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_config_load.py [n] [rounds]
+
+import gc
+import os
+import sys
+import time
+
+try:
+    import ujson
+except ImportError:
+    import json as ujson
+
+sys.path.insert(0, "tools")
+
+import compile_config  # noqa: E402
+
+_DIR: str = "bench_config"
+
+
+def _mem() -> int:
+    gc.collect()
+    try:
+        return gc.mem_alloc()
+    except AttributeError:
+        import tracemalloc  # cpython
+        return tracemalloc.get_traced_memory()[0]
+
+
+def fleet(n: int) -> dict:
+    with open("esp32config.json") as fp:
+        f: dict = ujson.load(fp)
+
+    for i in range(n):
+        f[f"24dcc3{i:06x}"] = {
+            "hostname": f"dorm{i}",
+            "wifi1": {"SSID": f"dorm-{i // 20}", "password": f"<SECRET{i}>", "retries": 10},
+            "mosquitto": {"groups": [f"floor{i // 20}", f"room{i}"]},
+            "rotary": {"enabled": i % 2 == 0},
+            "ssd1306": {"enabled": True},
+        }
+    return f
+
+
+def _load_json(path: str, mac: str) -> dict:
+    """ = config.py without the compiled module """
+    with open(path) as fp:
+        data: dict = ujson.load(fp)
+    if mac in data:
+        compile_config.update_deep(data, data[mac])
+    return data
+
+
+def _load_compiled() -> dict:
+    sys.modules.pop(compile_config.MODULE, None)
+    m = __import__(compile_config.MODULE)
+    return m.data
+
+
+def bench(n: int, rounds: int) -> None:
+    try:
+        os.mkdir(_DIR)
+    except OSError:
+        pass
+
+    f: dict = fleet(n)
+    mac: str = f"24dcc3{n // 2:06x}"
+    json_path: str = f"{_DIR}/esp32config.json"
+    with open(json_path, "w") as fp:
+        ujson.dump(f, fp)
+    with open(f"{_DIR}/{compile_config.MODULE}.py", "w") as fp:
+        fp.write(compile_config.render(compile_config.device_config(f, mac), mac))
+    sys.path.insert(0, _DIR)
+    del f
+
+    print(f"{n} devices: esp32config.json {os.stat(json_path)[6]} bytes, "
+          f"{compile_config.MODULE}.py {os.stat(_DIR + '/' + compile_config.MODULE + '.py')[6]} bytes")
+
+    loads: tuple = (("json", lambda: _load_json(json_path, mac)), ("compiled", _load_compiled))
+    us: dict = {}
+    for name, load in loads:
+        t0: int = time.ticks_us()
+        for _ in range(rounds):
+            load()
+        us[name] = time.ticks_diff(time.ticks_us(), t0) // rounds
+
+    try:
+        import tracemalloc  # cpython: only now, it slows down the timing
+        tracemalloc.start()
+    except ImportError:
+        pass
+
+    for name, load in loads:
+        sys.modules.pop(compile_config.MODULE, None)
+        m0: int = _mem()
+        data: dict = load()
+        retained: int = _mem() - m0
+        print(f"    {name:10s} {us[name]:7d}us per load, config.data retains {retained:7d} bytes "
+              f"({len(data)} keys, hostname {data['hostname']})")
+        del data
+
+
+if __name__ == "__main__":
+    bench(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    )
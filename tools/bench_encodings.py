@@ -0,0 +1,36 @@
+# bytes on the wire and encode-time per feed-encoding (json template / cbor / packed) for a light-trigger value
+# and a status-dict
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_encodings.py [n]
+
+import sys
+import time
+
+import mqttcodec
+import mqttwrap
+
+from bench_payload_template import STATUS
+
+
+def _measure(name: str, n: int, f) -> None:
+    size: int = len(f())
+
+    t0: int = time.ticks_us()
+    for _ in range(n):
+        f()
+    dt: int = time.ticks_diff(time.ticks_us(), t0)
+
+    print(f"{name:16s} {size:5d} bytes {dt // n:6d}us/encode")
+
+
+def bench(n: int) -> None:
+    base: dict = mqttwrap.mosquitto_to_send_base_data
+
+    for vname, value in (("trigger", 42), ("status", STATUS)):
+        _measure(f"{vname} json", n, lambda: mqttwrap.value_to_mqtt_payload(value))
+        _measure(f"{vname} cbor", n, lambda: mqttcodec.cbor_document(base, value))
+        _measure(f"{vname} packed", n, lambda: mqttcodec.pack(value))
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,71 @@
+# publish-throughput and round-trip-latency of mqttwrap.MQTTClient against a broker
+# (a local mosquitto or tools/fakebroker.py)
+#
+#   python3 tools/fakebroker.py --port 1883 --latency-ms 20 &
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_mqtt.py 127.0.0.1 1883 500 [window]
+
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import mqttwrap
+
+
+async def bench(host: str, port: int, n: int, window: int) -> None:
+    received: list = [0]
+    done: asyncio.Event = asyncio.Event()
+
+    def cb(topic, msg, retained):
+        received[0] += 1
+        done.set()
+
+    c = mqttwrap.MQTTClient(client_id="bench_mqttwrap", server=host, port=port, max_inflight=window)
+    c.set_callback(cb)
+    await c.connect()
+    await c.subscribe(b"bench/echo")
+
+    payload: bytes = b"x" * 64
+
+    for qos in (0, 1):
+        t0: int = time.ticks_us()
+        for _ in range(n):
+            await c.publish(b"bench/sink", payload, qos=qos)
+        dt: int = time.ticks_diff(time.ticks_us(), t0)
+        print(f"publish qos={qos}: {n} msgs in {dt // 1000}ms => {n * 1_000_000 // max(dt, 1)} msgs/s")
+
+    # qos1 pipelined: do not wait for each PUBACK, the in-flight window of the client limits what is on the wire
+    t0 = time.ticks_us()
+    for _ in range(n):
+        await c.publish(b"bench/sink", payload, qos=1, wait=False)
+    await c.flush(timeout_ms=60_000)
+    dt = time.ticks_diff(time.ticks_us(), t0)
+    print(f"publish qos=1 pipelined (window={c.max_inflight}): {n} msgs in {dt // 1000}ms "
+          f"=> {n * 1_000_000 // max(dt, 1)} msgs/s")
+
+    # round trip: publish to a topic we are subscribed to and wait until it comes back
+    rtts: list[int] = []
+    for _ in range(min(n, 100)):
+        done.clear()
+        t0 = time.ticks_us()
+        await c.publish(b"bench/echo", payload, qos=0)
+        await done.wait()
+        rtts.append(time.ticks_diff(time.ticks_us(), t0))
+
+    rtts.sort()
+    print(f"round-trip: n={len(rtts)} min={rtts[0]}us p50={rtts[len(rtts) // 2]}us "
+          f"p95={rtts[len(rtts) * 95 // 100]}us max={rtts[-1]}us")
+
+    await c.disconnect()
+
+
+if __name__ == "__main__":
+    _host: str = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    _port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+    _n: int = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    _window: int = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+
+    asyncio.run(bench(_host, _port, _n, _window))
@@ -0,0 +1,63 @@
+# value_to_mqtt_string() (dict-copy + ujson.dumps + encode) vs. value_to_mqtt_payload() (pre-serialized template)
+# for small ints and for a status-like nested dict
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_payload_template.py [n]
+#
+# (bytes/call are only meaningful on micropython - gc.mem_alloc() with the gc disabled)
+
+import gc
+import sys
+import time
+
+import mqttwrap
+
+STATUS: dict = {
+    "wifi": {
+        "ip": "192.168.1.23",
+        "subnet": "255.255.255.0",
+        "gateway": "192.168.1.1",
+        "dns": "192.168.1.1",
+        "strength": -61,
+        "config": {"mac": "aa:bb:cc:dd:ee:ff", "ssid": "somessid", "channel": 6, "reconnects": -1,
+                   "hostname": "josolightesp32"},
+    },
+    "wifi_scan": None,
+    "runtime_seconds": 12345,
+    "running_since": "2026-10-17T12:00:00+02:00",
+    "reboot_pending_in": 74055,
+}
+
+
+def _mem_alloc() -> int:
+    if hasattr(gc, "mem_alloc"):
+        return gc.mem_alloc()
+    return 0
+
+
+def _measure(name: str, n: int, f) -> None:
+    gc.collect()
+    gc.disable()
+    m0: int = _mem_alloc()
+    t0: int = time.ticks_us()
+
+    for i in range(n):
+        f(i)
+
+    dt: int = time.ticks_diff(time.ticks_us(), t0)
+    m1: int = _mem_alloc()
+    gc.enable()
+
+    print(f"{name:32s} {dt // n:6d}us/call {(m1 - m0) // n:6d} bytes/call")
+
+
+def bench(n: int) -> None:
+    created_at: str = time.getisotimenow()
+
+    _measure("int    ujson.dumps + encode", n, lambda i: mqttwrap.value_to_mqtt_string(i % 200, created_at).encode())
+    _measure("int    template", n, lambda i: mqttwrap.value_to_mqtt_payload(i % 200, created_at))
+    _measure("status ujson.dumps + encode", n, lambda i: mqttwrap.value_to_mqtt_string(STATUS, created_at).encode())
+    _measure("status template", n, lambda i: mqttwrap.value_to_mqtt_payload(STATUS, created_at))
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,78 @@
+# heap-allocations per publish: "old" path (format the topic + str payload on every call) vs.
+# cached Feed + pre-encoded payload + in-place packet encoding. no broker needed, the client writes into a null-stream.
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_publish_alloc.py [n]
+#
+# (bytes/publish are only meaningful on micropython - gc.mem_alloc() with the gc disabled)
+
+import gc
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import config
+import mqttwrap
+
+
+class NullWriter:
+    def __init__(self):
+        self.written: int = 0
+
+    def write(self, buf):
+        self.written += len(buf)
+
+    async def drain(self):
+        pass
+
+
+def _mem_alloc() -> int:
+    if hasattr(gc, "mem_alloc"):
+        return gc.mem_alloc()
+    return 0
+
+
+async def _run(c: mqttwrap.MQTTClient, n: int, qos: int, old_style: bool) -> tuple[int, int]:
+    payload_s: str = '{"value": 42}'
+    payload_b: bytes = payload_s.encode()
+    f: mqttwrap.Feed = mqttwrap.feed("statusfeed")
+
+    gc.collect()
+    gc.disable()
+    m0: int = _mem_alloc()
+    t0: int = time.ticks_us()
+
+    for _ in range(n):
+        if old_style:
+            pa = await c.publish(mqttwrap.format_with_clientid(config.data["mosquitto"]["statusfeed"]), payload_s,
+                                 qos=qos, wait=False)
+        else:
+            pa = await c.publish(f.topic_b, payload_b, qos=qos, wait=False)
+
+        if pa is not None:
+            c._puback(pa.pid, True)  # "broker" acks right away
+
+    dt: int = time.ticks_diff(time.ticks_us(), t0)
+    m1: int = _mem_alloc()
+    gc.enable()
+
+    return (m1 - m0) // n, dt // n
+
+
+async def bench(n: int) -> None:
+    c: mqttwrap.MQTTClient = mqttwrap.MQTTClient(client_id="bench_alloc", server="127.0.0.1")
+    c._writer = NullWriter()
+    c._connected = True
+
+    for qos in (0, 1):
+        for old_style in (True, False):
+            per_pub, us = await _run(c, n, qos, old_style)
+            name: str = "format+str  " if old_style else "feed+bytes  "
+            print(f"{name} qos={qos}: {per_pub} bytes allocated/publish, {us}us/publish")
+
+
+if __name__ == "__main__":
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
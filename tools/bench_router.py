@@ -0,0 +1,79 @@
+# messages/s through topicrouter.TopicRouter (trie on the raw bytes) vs. a linear loop over the filters on the
+# decoded topic - with k filters (own control-feed, broadcast, groups, rooms with wildcards, ...) and topics that
+# hit an exact filter, a wildcard filter or nothing
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_router.py [n] [k]
+
+import sys
+import time
+
+from topicrouter import TopicRouter
+
+
+def _linear_matches(topic_filter: str, topic: str) -> bool:
+    f: list = topic_filter.split("/")
+    t: list = topic.split("/")
+    for i in range(len(f)):
+        if f[i] == "#":
+            return True
+        if i >= len(t) or (f[i] != "+" and f[i] != t[i]):
+            return False
+    return len(f) == len(t)
+
+
+def _filters(k: int) -> list[str]:
+    ret: list[str] = [
+        "esp32/esp32_aabbccddeeff/control",
+        "esp32/all/control",
+        "esp32/room/+/control",
+        "esp32/esp32_aabbccddeeff/config/#",
+    ]
+    i: int = 0
+    while len(ret) < k:
+        ret.append(f"esp32/group/g{i}/control")
+        i += 1
+    return ret
+
+
+def bench(n: int, k: int) -> None:
+    hits: list = [0]
+
+    def handler(topic, msg, retained):
+        hits[0] += 1
+
+    filters: list[str] = _filters(k)
+    r: TopicRouter = TopicRouter()
+    for f in filters:
+        r.add(f, handler)
+
+    msg: memoryview = memoryview(b"reboot")
+    for name, topic in (
+        ("exact", "esp32/esp32_aabbccddeeff/control"),
+        ("wildcard", "esp32/room/kitchen/control"),
+        (f"group {k - 5}", f"esp32/group/g{k - 5}/control"),
+        ("no match", "esp32/esp32_001122334455/control"),
+    ):
+        tb: memoryview = memoryview(topic.encode())
+
+        hits[0] = 0
+        t0: int = time.ticks_us()
+        for _ in range(n):
+            r.route(tb, msg, False)
+        dt_trie: int = max(1, time.ticks_diff(time.ticks_us(), t0))
+        trie_hits: int = hits[0]
+
+        hits[0] = 0
+        t0 = time.ticks_us()
+        for _ in range(n):
+            ts: str = bytes(tb).decode()
+            for f in filters:
+                if _linear_matches(f, ts):
+                    handler(tb, msg, False)
+        dt_lin: int = max(1, time.ticks_diff(time.ticks_us(), t0))
+
+        assert trie_hits == hits[0], (name, trie_hits, hits[0])
+        print(f"{name:12s} trie {n * 1_000_000 // dt_trie:8d} msg/s   linear {n * 1_000_000 // dt_lin:8d} msg/s")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5_000, int(sys.argv[2]) if len(sys.argv) > 2 else 20)
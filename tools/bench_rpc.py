@@ -0,0 +1,50 @@
+# round-trips of mqttwrap.rpc_call() against tools/rpc_responder.py: n light-requests one after the other,
+# then the latency-histogram (as it goes into the status feed) and the timeouts
+#
+#   python3 tools/fakebroker.py --port 1883 &
+#   python3 tools/rpc_responder.py --port 1883 --delay-ms 20 &
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_rpc.py 127.0.0.1 1883 100
+
+import sys
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import config
+import mqttwrap
+
+
+async def bench(host: str, port: int, n: int) -> None:
+    config.data["mosquitto"]["MOSQUITTO_HOST"] = host
+    config.data["mosquitto"]["MOSQUITTO_PORT"] = port
+    config.data["mosquitto"]["replyfeed"] = "esp32/{clientid}/reply"  # not in the base config
+
+    await mqttwrap.connect_socket()
+    await mqttwrap.setup_session()
+
+    f: mqttwrap.Feed = mqttwrap.feed("lightswitchfeed")
+    failed: int = 0
+    for i in range(n):
+        try:
+            reply: dict = await mqttwrap.rpc_call(f, i % 180, method="light", timeout_ms=2_000)
+            if not reply.get("ok"):
+                failed += 1
+        except mqttwrap.MQTTException as ex:
+            print(ex)
+
+    for method, h in mqttwrap.rpc_latency.items():
+        print(f"{method}: {h.to_dict()} mean={h.mean():.1f}ms")
+    print(f"ok=false: {failed} timeouts: {mqttwrap.rpc_timeouts}")
+    print(f"histogram (bucket i: < 2^i ms): {mqttwrap.rpc_latency['light'].counts}")
+
+    await mqttwrap.prepare_deepsleep()
+
+
+if __name__ == "__main__":
+    _host: str = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    _port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+    _n: int = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    asyncio.run(bench(_host, _port, _n))
@@ -0,0 +1,57 @@
+# store-and-forward (flashqueue.FlashQueue) during a broker outage: spool n publishes while the broker is down
+# (flash-writes per publish), wait for the broker to come back and drain everything in bulk
+#
+#   python3 tools/fakebroker.py --port 1883 --latency-ms 20 &      # ... and kill it
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_spool.py 127.0.0.1 1883 1000 &
+#   python3 tools/fakebroker.py --port 1883 --latency-ms 20        # restart it - the bench drains as soon as it is up
+
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import flashqueue
+import mqttwrap
+
+
+async def bench(host: str, port: int, n: int, window: int) -> None:
+    payload: bytes = b"x" * 64
+    # large enough for all n - the default (8 segments) would overwrite the oldest ones
+    q: flashqueue.FlashQueue = flashqueue.FlashQueue(directory="bench_spool", max_segments=n * 96 // 4096 + 2)
+
+    t0: int = time.ticks_us()
+    for i in range(n):
+        q.append(b"bench/spool", payload, qos=1 if i % 4 else 0, retain=False, ttl_s=3600)
+    q.flush()
+    dt: int = time.ticks_diff(time.ticks_us(), t0)
+    print(f"spooled {n} publishes in {dt // 1000}ms ({dt // n}us/publish) into {len(q._segs)} segments")
+
+    c: mqttwrap.MQTTClient = mqttwrap.MQTTClient(client_id="bench_spool", server=host, port=port, max_inflight=window)
+    t_down: int = time.ticks_ms()
+    while True:
+        try:
+            await c.connect()
+            break
+        except OSError:
+            await asyncio.sleep_ms(200)
+    print(f"broker reachable after {time.ticks_diff(time.ticks_ms(), t_down)}ms")
+
+    t0 = time.ticks_us()
+    sent: int = await q.drain(c)
+    dt = time.ticks_diff(time.ticks_us(), t0)
+    print(f"drained {sent} publishes in {dt // 1000}ms => {sent * 1_000_000 // max(dt, 1)} msgs/s "
+          f"(window={window}, dropped={q.dropped}, pending afterwards: {q.pending()})")
+
+    await c.disconnect()
+
+
+if __name__ == "__main__":
+    _host: str = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    _port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+    _n: int = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    _window: int = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+
+    asyncio.run(bench(_host, _port, _n, _window))
@@ -0,0 +1,116 @@
+# thundering herd: n virtual devices (own MAC each) that were powered on together publish ONLINE + a status every
+# period, lose the broker at the same moment half-way through and reconnect - once in lockstep, once staggered
+# (status in the devices own slot of the period, reconnect after its own offset, see stagger.py).
+# a subscriber on esp32/# counts what the broker has to route per 100ms/1s
+#
+#   python3 tools/fakebroker.py --port 1883 &
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_stagger.py 127.0.0.1 1883 200 [period_s]
+
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import stagger
+from mqttwrap import MQTTClient
+
+
+class _Counter:
+    def __init__(self):
+        self.t0: int = time.ticks_ms()
+        self.bins: dict[int, int] = {}  # 100ms-bin -> messages
+
+    def cb(self, topic, msg, retained: bool) -> None:
+        if retained:
+            return
+        b: int = time.ticks_diff(time.ticks_ms(), self.t0) // 100
+        self.bins[b] = self.bins.get(b, 0) + 1
+
+    def peak_per_s(self, width: int, from_ms: int, to_ms: int) -> int:
+        """ width: bins per window (1: 100ms, 10: 1s) """
+        best: int = 0
+        for start in range(from_ms // 100, to_ms // 100, width):
+            best = max(best, sum([self.bins.get(b, 0) for b in range(start, start + width)]))
+        return best * 10 // width
+
+
+async def _device(host: str, port: int, mac: str, staggered: bool, period_ms: int, run_ms: int, t0: int) -> None:
+    cid: str = f"esp32_{mac}"
+    c: MQTTClient = MQTTClient(cid, host, port, keepalive=120)
+    status: bytes = f"esp32/{cid}/status".encode()
+    lwt: bytes = f"esp32/{cid}/LWT".encode()
+    payload: bytes = b'{"runtime_seconds": 12345, "wifi": {"strength": -61}}' + b" " * 300
+
+    async def _up() -> None:
+        await c.connect()
+        await c.publish(lwt, b"ONLINE", qos=1, retain=True, wait=False)
+
+    await _up()
+
+    phase: int = stagger.offset(mac, period_ms, "status")
+    outage_at: int = run_ms // 2
+    had_outage: bool = False
+    nxt: int = stagger.next_slot(0, period_ms, phase) if staggered else 0
+
+    while True:
+        now: int = time.ticks_diff(time.ticks_ms(), t0)
+        if now >= run_ms:
+            break
+
+        if not had_outage and now >= outage_at:
+            had_outage = True
+            await c._close()  # like a broker-restart: every device notices it at the same moment
+            if staggered:
+                await asyncio.sleep_ms(stagger.offset(mac, period_ms // 2, "reconnect"))
+            await _up()
+            continue
+
+        if now >= nxt:
+            await c.publish(status, payload, qos=1, wait=False)
+            nxt = stagger.next_slot(now, period_ms, phase) if staggered else now + period_ms
+
+        await asyncio.sleep_ms(max(1, min(nxt, outage_at if not had_outage else run_ms) - now))
+
+    await c.disconnect()
+
+
+async def _run(host: str, port: int, n: int, period_ms: int, staggered: bool) -> None:
+    cnt: _Counter = _Counter()
+    mon: MQTTClient = MQTTClient(f"bench_stagger_{time.ticks_ms()}", host, port, rx_buffer_size=1024)
+    mon.set_callback(cnt.cb)
+    await mon.connect()
+    await mon.subscribe("esp32/#")
+
+    t0: int = time.ticks_ms()
+    cnt.t0 = t0
+    run_ms: int = period_ms * 4
+    # a fleet: espressif-OUI + a random-looking, but reproducible part
+    macs: list[str] = [f"24dcc3{(i * 2654435761) & 0xFFFFFF:06x}" for i in range(n)]
+    await asyncio.gather(*[_device(host, port, m, staggered, period_ms, run_ms, t0) for m in macs])
+
+    await asyncio.sleep_ms(500)
+    await mon.disconnect()
+
+    # power-on (everybody connects at once either way), steady state, after the outage (run_ms // 2)
+    print(f"{'staggered' if staggered else 'lockstep':10s} {n} devices, {sum(cnt.bins.values())} msgs - peak msg/s "
+          f"(100ms/1s windows):")
+    for name, a, b in (("power-on", 0, period_ms), ("steady", period_ms, run_ms // 2),
+                       ("reconnect", run_ms // 2, run_ms)):
+        print(f"    {name:10s} {cnt.peak_per_s(1, a, b):6d} {cnt.peak_per_s(10, a, b):6d}")
+
+
+async def bench(host: str, port: int, n: int, period_s: int) -> None:
+    for staggered in (False, True):
+        await _run(host, port, n, period_s * 1000, staggered)
+
+
+if __name__ == "__main__":
+    _host: str = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    _port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+    _n: int = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    _period_s: int = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+
+    asyncio.run(bench(_host, _port, _n, _period_s))
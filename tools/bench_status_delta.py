@@ -0,0 +1,47 @@
+# full status vs. delta-encoded status (statusdelta.StatusDelta) over a series of reports where only
+# runtime_seconds, strength and reboot_pending_in move: bytes on the wire and encode-time per report
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_status_delta.py [reports] [keyframe_every]
+
+import sys
+import time
+
+import mqttwrap
+import statusdelta
+
+from bench_payload_template import STATUS
+
+
+def _reports(n: int):
+    for i in range(n):
+        s: dict = statusdelta._copy(STATUS)
+        s["runtime_seconds"] += i * 60
+        s["reboot_pending_in"] -= i * 60
+        s["wifi"]["strength"] = -60 - (i % 3)
+        yield s
+
+
+def bench(n: int, keyframe_every: int) -> None:
+    total_full: int = 0
+    total_delta: int = 0
+    us_full: int = 0
+    us_delta: int = 0
+    sd: statusdelta.StatusDelta = statusdelta.StatusDelta(keyframe_every=keyframe_every)
+
+    for s in _reports(n):
+        t0: int = time.ticks_us()
+        total_full += len(mqttwrap.value_to_mqtt_payload(s))
+        t1: int = time.ticks_us()
+        d, _ = sd.next(s)
+        total_delta += len(mqttwrap.value_to_mqtt_payload(d))
+        t2: int = time.ticks_us()
+
+        us_full += time.ticks_diff(t1, t0)
+        us_delta += time.ticks_diff(t2, t1)
+
+    print(f"full:  {total_full // n:5d} bytes/report {us_full // n:5d}us/report")
+    print(f"delta: {total_delta // n:5d} bytes/report {us_delta // n:5d}us/report (keyframe every {keyframe_every})")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,56 @@
+# wake-to-first-publish: what a device has to do after a deepsleep wake-up before its first publish is acked -
+# clean session (CONNECT, ONLINE + PUBACK, SUBSCRIBE + SUBACK, publish) vs. persistent session resumed from the
+# RTC-memory (CONNECT, publish). n simulated wake-ups per mode (prepare_deepsleep() in between)
+#
+#   python3 tools/fakebroker.py --port 1883 --latency-ms 20 &
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_wake.py 127.0.0.1 1883 20
+
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import config
+import mqttwrap
+
+
+async def _wake(persistent: bool) -> int:
+    # what is left after a deepsleep: nothing but the RTC-memory
+    mqttwrap._mqttclient = None
+    mqttwrap._session_up = False
+    mqttwrap._session_present = False
+    mqttwrap._session_restored = False
+    config.data["mosquitto"]["persistent_session"] = persistent
+
+    f: mqttwrap.Feed = mqttwrap.feed("lightswitchfeed")
+    t0: int = time.ticks_ms()
+
+    await mqttwrap.connect_socket()
+    await mqttwrap.setup_session()
+    await mqttwrap.publish_one(f, mqttwrap.feed_payload(f, 42), qos=1, wait=True, spool=False)
+
+    dt: int = time.ticks_diff(time.ticks_ms(), t0)
+    await mqttwrap.prepare_deepsleep()
+    return dt
+
+
+async def bench(host: str, port: int, n: int) -> None:
+    config.data["mosquitto"]["MOSQUITTO_HOST"] = host
+    config.data["mosquitto"]["MOSQUITTO_PORT"] = port
+
+    for persistent in (False, True):
+        await _wake(persistent)  # the first one creates the session on the broker
+        ts: list[int] = sorted([await _wake(persistent) for _ in range(n)])
+        name: str = "persistent session" if persistent else "clean session"
+        print(f"{name:20s} wake-to-first-publish: min={ts[0]}ms p50={ts[len(ts) // 2]}ms max={ts[-1]}ms")
+
+
+if __name__ == "__main__":
+    _host: str = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    _port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+    _n: int = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    asyncio.run(bench(_host, _port, _n))
@@ -0,0 +1,94 @@
+# boot-to-connected of wifi.ensure_wifi() against the fake WLAN (tools/unixport/network.py) with esp32-like scan,
+# association and dhcp delays: the single scan ranking all configured networks vs. the loop it replaced (one scan
+# per configured network, retries x 1s waiting each) - and the reconnect after a reset/deepsleep from the cache in
+# the RTC-memory (wifi_cache), with dhcp and with the old lease as static ip
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_wifi_connect.py [scan_ms] [assoc_ms] [dhcp_ms]
+
+import sys
+import time
+
+import config
+import rtcstore
+import wifi
+
+_NETWORKS: dict = {
+    "wifi1": {"SSID": "dorm", "password": "x", "retries": 10},
+    "wifi2": {"SSID": "lab", "password": "x", "retries": 10},
+    "wifi3": {"SSID": "home", "password": "x", "retries": 10},
+}
+
+_SCENARIOS: dict = {
+    # (ssid, bssid, channel, rssi, authmode, hidden)
+    "wifi1 out of range": [
+        (b"lab", b"\x02\x00\x00\x00\x00\x01", 1, -82, 3, False),
+        (b"lab", b"\x02\x00\x00\x00\x00\x02", 6, -54, 3, False),
+        (b"home", b"\x02\x00\x00\x00\x00\x03", 11, -70, 3, False),
+    ],
+    "all in range": [
+        (b"dorm", b"\x02\x00\x00\x00\x00\x04", 1, -88, 3, False),
+        (b"dorm", b"\x02\x00\x00\x00\x00\x05", 6, -61, 3, False),
+        (b"lab", b"\x02\x00\x00\x00\x00\x02", 6, -54, 3, False),
+        (b"home", b"\x02\x00\x00\x00\x00\x03", 11, -70, 3, False),
+    ],
+}
+
+
+def _legacy_connect() -> None:
+    w: str
+    for w in wifi.wlan_scanlist:
+        best: tuple | None = None
+        for ssid, bssid, channel, RSSI, authmode, hidden in wifi.wlan.scan():
+            if ssid.decode() == config.data[w]["SSID"] and (best is None or RSSI > best[1]):
+                best = (bssid, RSSI)
+
+        wifi.wlan.connect(config.data[w]["SSID"], config.data[w]["password"], bssid=best[0] if best else None)
+        for _ in range(config.data[w]["retries"]):
+            if wifi.wlan.isconnected():
+                return
+            time.sleep(1)
+        wifi.wlan.disconnect()
+
+
+def _measure(name: str, connect, cached: bool = False, static_ip: bool = False) -> None:
+    wifi.wlan.disconnect()
+    wifi.wlan.ifconfig("dhcp")
+    config.apply({"wifi_cache": {"enabled": True, "static_ip": static_ip, "timeout_ms": 3_000}})
+    if not cached:
+        rtcstore.put(wifi._CACHE_KEY, None)
+    wifi.scan_cache.invalidate()  # RAM, gone after a reset
+    wifi.wlan.scans = 0
+    t0: int = time.ticks_ms()
+    connect()
+    dt: int = time.ticks_diff(time.ticks_ms(), t0)
+    print(f"    {name:14s} {dt:6d}ms  {wifi.wlan.scans} scans  -> {wifi.wlan.config('ssid')} "
+          f"channel {wifi.wlan.config('channel')} rssi {wifi.wlan.status('rssi')}")
+
+
+def bench(scan_ms: int, assoc_ms: int, dhcp_ms: int) -> None:
+    config.apply(_NETWORKS)
+    wifi.wlan.scan_ms = scan_ms
+    wifi.wlan.assoc_ms = assoc_ms
+    wifi.wlan.dhcp_ms = dhcp_ms
+
+    for name, results in _SCENARIOS.items():
+        wifi.wlan.scan_results = results
+        print(f"{name} ({scan_ms=} {assoc_ms=} {dhcp_ms=}):")
+        _measure("legacy", _legacy_connect)
+        _measure("ranked", wifi.ensure_wifi)
+        # the ranked connect above filled the cache
+        _measure("cached", wifi.ensure_wifi, cached=True)
+        _measure("cached+static", wifi.ensure_wifi, cached=True, static_ip=True)
+
+    # the cached ap is gone: the directed connect fails, then the scan
+    wifi.wlan.scan_results = _SCENARIOS["wifi1 out of range"][:1]
+    print("cached ap gone:")
+    _measure("cached", wifi.ensure_wifi, cached=True)
+
+
+if __name__ == "__main__":
+    bench(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 2_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1_000,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 1_000,
+    )
@@ -0,0 +1,110 @@
+# checks the mqtt5-mode of MQTTClient against a broker (mosquitto 2.x or tools/fakebroker.py): topic-aliases,
+# retain-handling, message-expiry and the reason-codes - and how many bytes the aliases save per publish
+#
+#   mosquitto -p 1883 -v    (or: python3 tools/fakebroker.py --port 1883)
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/check_mqtt5.py 127.0.0.1 1883
+
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+from mqttwrap import MQTTClient, MQTTException, _publish_size
+
+_failed: int = 0
+
+
+def _check(name: str, ok: bool, detail: str = "") -> None:
+    global _failed
+    if not ok:
+        _failed += 1
+    print(f"{'ok  ' if ok else 'FAIL'} {name} {detail}")
+
+
+class _Inbox:
+    def __init__(self):
+        self.msgs: list = []
+
+    def cb(self, topic, msg, retained: bool) -> None:
+        self.msgs.append((bytes(topic), bytes(msg), retained))
+
+
+async def _client(host: str, port: int, cid: str, inbox: _Inbox | None = None) -> MQTTClient:
+    c: MQTTClient = MQTTClient(cid, host, port, protocol=5, ack_timeout_ms=3_000)
+    if inbox is not None:
+        c.set_callback(inbox.cb)
+    await c.connect()
+    return c
+
+
+async def check(host: str, port: int) -> None:
+    base: str = f"check_mqtt5/{time.ticks_ms()}"
+    topic: bytes = f"{base}/esp32/aabbccddeeff/trigger".encode()
+
+    # topic-aliases: the subscriber gets the full topic every time, only the first publish carries it
+    inbox: _Inbox = _Inbox()
+    sub: MQTTClient = await _client(host, port, "check5-sub", inbox)
+    await sub.subscribe(f"{base}/esp32/+/trigger", qos=1)
+    pub: MQTTClient = await _client(host, port, "check5-pub")
+    _check("broker allows topic-aliases", pub._alias_max > 0, f"(max {pub._alias_max})")
+
+    for i in range(5):
+        await pub.publish(topic, b"%d" % i, qos=1, alias=True)
+    await asyncio.sleep_ms(300)
+    _check("aliased publishes arrive with their topic", [m[0] for m in inbox.msgs] == [topic] * 5,
+           f"({len(inbox.msgs)} received)")
+
+    full: int = _publish_size(len(topic), 2, 1, 0)
+    aliased: int = _publish_size(0, 2, 1, 3)
+    print(f"     PUBLISH {full} bytes with the topic, {aliased} bytes with an alias")
+
+    # reason-codes: PUBACK 0x10 (no matching subscribers) is a success, not an exception
+    pa = await pub.publish(f"{base}/nobody".encode(), b"x", qos=1)
+    _check("PUBACK reason-code", pa is not None and pa.reason in (0x00, 0x10), f"({pa.reason:#x})")
+
+    # retain-handling 2: the retained "command" is not sent on subscribe, with 0 it is
+    await pub.publish(f"{base}/control".encode(), b"RESET", qos=1, retain=True)
+    for rh in (2, 0):
+        inbox.msgs.clear()
+        await sub.subscribe(f"{base}/control", qos=1, retain_handling=rh)
+        await asyncio.sleep_ms(300)
+        got: int = len([m for m in inbox.msgs if m[2]])
+        _check(f"retain_handling={rh}", got == (0 if rh == 2 else 1), f"({got} retained messages)")
+
+    # message-expiry: an expired retained message is not sent to a new subscriber
+    await pub.publish(f"{base}/expiring".encode(), b"stale", qos=1, retain=True, expiry_s=1)
+    await asyncio.sleep_ms(2_200)
+    inbox.msgs.clear()
+    await sub.subscribe(f"{base}/expiring", qos=1)
+    await asyncio.sleep_ms(300)
+    _check("message-expiry", not inbox.msgs, f"({len(inbox.msgs)} received)")
+
+    # SUBACK reason-code >= 0x80 -> MQTTException.rc
+    try:
+        await sub.subscribe(f"{base}/#/invalid", qos=1)
+        _check("SUBACK reason-code", False, "(no exception)")
+    except MQTTException as ex:
+        # mosquitto may disconnect on a malformed filter instead (-> DISCONNECT with a reason-code)
+        _check("SUBACK reason-code", (ex.rc is not None and ex.rc >= 0x80) or sub.disconnect_reason is not None,
+               f"({ex.rc=} {sub.disconnect_reason=})")
+
+    # cleanup: the retained messages
+    for t in ("control", "expiring"):
+        await pub.publish(f"{base}/{t}".encode(), b"", qos=1, retain=True)
+
+    await pub.disconnect()
+    if sub.isconnected():
+        await sub.disconnect()
+
+    print(f"{_failed} failed")
+
+
+if __name__ == "__main__":
+    _host: str = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    _port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+
+    asyncio.run(check(_host, _port))
+    sys.exit(1 if _failed else 0)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# build-time config compiler (cpython): the fleet config (esp32config.json, + esp32config.local.json by the same
+# rules as config.py) -> one pre-merged module per device with MAC and data = the base config with that MAC's overlay
+# applied, without the sections (and secrets) of all the other devices. on the device config.py imports it instead
+# of parsing the json - copy it as esp32config_compiled.py (or .mpy, cross-compiled with --mpy)
+#
+#   python3 tools/compile_config.py esp32config.json --out build/config [--mac aabbccddee00 ...] [--mpy]
+#   -> build/config/<mac>/esp32config_compiled.py (+ .mpy)
+#   mpremote cp build/config/<mac>/esp32config_compiled.mpy :
+
+import json
+import os
+
+MODULE: str = "esp32config_compiled"
+
+# same as in config.py
+REPLACE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS: bool = True
+UPDATE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS: bool = False
+
+
+def update_deep(base: dict, u: dict) -> dict:
+    """ same as config.update_deep() """
+    for k, v in u.items():
+        if isinstance(v, dict):
+            base[k] = update_deep(base.get(k, {}), v)
+        else:
+            base[k] = v
+    return base
+
+
+def is_mac(key: str) -> bool:
+    """ the per-device overlays are keyed by the MAC without colons (all hex - the examples have 14 digits) """
+    return len(key) >= 12 and all([c in "0123456789abcdef" for c in key])
+
+
+def load_fleet(path: str, local_path: str | None = None) -> dict:
+    with open(path) as fp:
+        fleet: dict = json.load(fp)
+
+    if local_path is not None and os.path.exists(local_path):
+        with open(local_path) as fp:
+            local: dict = json.load(fp)
+        if REPLACE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS:
+            fleet = local
+        elif UPDATE_CONFIG_WITH_LOCAL_CONFIG_IF_EXISTS:
+            update_deep(fleet, local)
+
+    return fleet
+
+
+def device_config(fleet: dict, mac: str) -> dict:
+    """ what config.data ends up as on the device with this MAC """
+    # json round-trip: a deep copy that works on micropython as well (tools/bench_config_load.py)
+    data: dict = json.loads(json.dumps({k: v for k, v in fleet.items() if not is_mac(k)}))
+    if mac in fleet:
+        update_deep(data, json.loads(json.dumps(fleet[mac])))
+    return data
+
+
+def render(data: dict, mac: str) -> str:
+    """ -> the source of the module (python literals, so importing it is just building the dict) """
+    return f"# generated by tools/compile_config.py - do not edit\nMAC = {mac!r}\ndata = {data!r}\n"
+
+
+def compile_fleet(fleet: dict, out: str, extra_macs: list[str], mpy: bool) -> list[str]:
+    """ -> the written files """
+    macs: list[str] = [k for k in fleet if is_mac(k)]
+    for m in extra_macs:
+        m = m.lower().replace(":", "")
+        if m not in macs:
+            macs.append(m)
+
+    written: list[str] = []
+    for mac in macs:
+        d: str = os.path.join(out, mac)
+        os.makedirs(d, exist_ok=True)
+        path: str = os.path.join(d, f"{MODULE}.py")
+        with open(path, "w") as fp:
+            fp.write(render(device_config(fleet, mac), mac))
+        written.append(path)
+
+        if mpy:
+            import subprocess
+            subprocess.run(["mpy-cross", path], check=True)
+            written.append(path[:-3] + ".mpy")
+
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="pre-merged per-device config modules from the fleet config")
+    parser.add_argument("config", nargs="?", default="esp32config.json")
+    parser.add_argument("--local", default="esp32config.local.json", help="applied like config.py does, if it exists")
+    parser.add_argument("--out", default="build/config")
+    parser.add_argument("--mac", action="append", default=[], help="also for a device without an overlay")
+    parser.add_argument("--mpy", action="store_true", help="cross-compile with mpy-cross")
+    args = parser.parse_args()
+
+    for p in compile_fleet(load_fleet(args.config, args.local), args.out, args.mac, args.mpy):
+        print(f"{p} ({os.path.getsize(p)} bytes)")
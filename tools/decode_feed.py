@@ -0,0 +1,54 @@
+# host-side decoder for the feed payloads (json / cbor / packed - see mqttcodec.py), the encoding is detected from
+# the first byte. prints one json-line per payload, created_at of the binary encodings as iso-8601 (utc).
+#
+#   mosquitto_sub -h <broker> -t 'esp32/+/status' -t 'esp32/+/trigger' -F '%x' | python3 tools/decode_feed.py
+#   python3 tools/decode_feed.py fe0168... [...]
+#
+# as a library (e.g. from a bridge): sys.path.insert(0, "<repo>/tools"); from decode_feed import decode
+
+import datetime
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import mqttcodec  # noqa: E402
+
+
+def detect(payload: bytes) -> str:
+    if payload[:1] == b"{":
+        return "json"
+    if payload[0] == mqttcodec.PACKED_MAGIC:
+        return "packed"
+    return "cbor"
+
+
+def decode(payload: bytes) -> dict:
+    encoding: str = detect(payload)
+
+    if encoding == "json":
+        return json.loads(payload)
+
+    doc: dict = mqttcodec.unpack(payload) if encoding == "packed" else mqttcodec.cbor_loads(payload)
+
+    if isinstance(doc.get("created_at"), int):
+        doc["created_at"] = datetime.datetime.fromtimestamp(doc["created_at"], datetime.timezone.utc).isoformat()
+
+    doc["encoding"] = encoding
+    return doc
+
+
+def main(hexpayloads: list[str]) -> None:
+    for h in hexpayloads:
+        h = h.strip()
+        if not h:
+            continue
+        try:
+            print(json.dumps(decode(bytes.fromhex(h))), flush=True)
+        except Exception as ex:
+            print(f"cannot decode {h[:32]}...: {ex!r}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] if len(sys.argv) > 1 else sys.stdin)
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+# minimal mqtt-3.1.1/5 broker stand-in (cpython, asyncio) for testing/benchmarking mqttwrap without a mosquitto
+#
+#   python3 tools/fakebroker.py --port 1883 --latency-ms 20
+#   python3 tools/fakebroker.py --port 1883 --no-puback 'test/noack/#'   (routes those, but never acks them)
+#   python3 tools/fakebroker.py --port 1883 --drop-every-s 60 --down-for-s 20   # drops all connections (wills fire)
+#                                                                              # every 60s and refuses new ones for 20s
+#
+# supports: CONNECT/CONNACK (+will, clean_session=0: subscriptions are kept and qos1-messages queued while the
+# client is away), PUBLISH qos0/1 (+retain), SUBSCRIBE/UNSUBSCRIBE with +/# wildcards, PINGREQ, DISCONNECT
+# --latency-ms delays CONNACK, SUBACK and every PUBLISH (ack + routing)
+# mqtt5: topic-aliases from the client (--topic-alias-max), message-expiry (also for retained/queued messages),
+# retain-handling of SUBSCRIBE, reason-codes in PUBACK (0x10 no matching subscribers)/SUBACK; other properties are
+# parsed and ignored
+# NOT supported: qos2, authentication (user/password are accepted as-is)
+
+import argparse
+import asyncio
+import struct
+import time
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    f: list[str] = topic_filter.split("/")
+    t: list[str] = topic.split("/")
+
+    for i, part in enumerate(f):
+        if part == "#":
+            return True
+        if i >= len(t):
+            return False
+        if part != "+" and part != t[i]:
+            return False
+
+    return len(f) == len(t)
+
+
+def filter_valid(topic_filter: str) -> bool:
+    parts: list[str] = topic_filter.split("/")
+    for i, part in enumerate(parts):
+        if ("#" in part and (part != "#" or i != len(parts) - 1)) or ("+" in part and part != "+"):
+            return False
+    return bool(topic_filter)
+
+
+def encode_varlen(n: int) -> bytes:
+    ret: bytearray = bytearray()
+    while True:
+        b: int = n & 0x7F
+        n >>= 7
+        if n:
+            ret.append(b | 0x80)
+        else:
+            ret.append(b)
+            return bytes(ret)
+
+
+def encode_str(s: bytes) -> bytes:
+    return struct.pack("!H", len(s)) + s
+
+
+def decode_varlen(b: bytes, pos: int) -> tuple[int, int]:
+    n: int = 0
+    sh: int = 0
+    while True:
+        c: int = b[pos]
+        pos += 1
+        n |= (c & 0x7F) << sh
+        if not c & 0x80:
+            return n, pos
+        sh += 7
+
+
+# mqtt5-property -> size of the value (-1: varint, -2: 2-byte length + data, -3: string-pair)
+PROP_SIZES: dict[int, int] = {
+    0x01: 1, 0x02: 4, 0x03: -2, 0x08: -2, 0x09: -2, 0x0B: -1, 0x11: 4, 0x12: -2, 0x13: 2, 0x15: -2, 0x16: -2,
+    0x17: 1, 0x18: 4, 0x19: 1, 0x1A: -2, 0x1C: -2, 0x1F: -2, 0x21: 2, 0x22: 2, 0x23: 2, 0x24: 1, 0x25: 1,
+    0x26: -3, 0x27: 4, 0x28: 1, 0x29: 1, 0x2A: 1,
+}
+
+
+def read_props(b: bytes, pos: int) -> tuple[dict[int, int | bytes], int]:
+    """ -> ({identifier: value (int or raw bytes)}, position after the property-section) """
+    ln, pos = decode_varlen(b, pos)
+    end: int = pos + ln
+    props: dict[int, int | bytes] = {}
+    while pos < end:
+        pid, pos = decode_varlen(b, pos)
+        sz: int = PROP_SIZES[pid]
+        if sz > 0:
+            props[pid] = int.from_bytes(b[pos:pos + sz], "big")
+            pos += sz
+        elif sz == -1:
+            props[pid], pos = decode_varlen(b, pos)
+        else:
+            start: int = pos
+            for _ in range(1 if sz == -2 else 2):
+                pos += 2 + struct.unpack("!H", b[pos:pos + 2])[0]
+            props[pid] = b[start:pos]
+    return props, end
+
+
+def build_publish(topic: bytes, msg: bytes, qos: int, retain: bool, pid: int = 0, dup: bool = False,
+                  props: bytes | None = None) -> bytes:
+    """ props: encoded mqtt5-properties (without the length) - None for mqtt 3.1.1 """
+    body: bytes = encode_str(topic)
+    if qos:
+        body += struct.pack("!H", pid)
+    if props is not None:
+        body += encode_varlen(len(props)) + props
+    body += msg
+    return bytes((0x30 | dup << 3 | qos << 1 | retain,)) + encode_varlen(len(body)) + body
+
+
+class Stats:
+    def __init__(self):
+        self.msgs_in: int = 0
+        self.msgs_out: int = 0
+        self.bytes_in: int = 0
+        self.connects: int = 0
+        self.drops: int = 0
+        self.aliased: int = 0
+        self.expired: int = 0
+        self.per_second: dict[int, int] = {}
+
+    def count_in(self, nbytes: int) -> None:
+        self.msgs_in += 1
+        self.bytes_in += nbytes
+        sec: int = int(time.monotonic())
+        self.per_second[sec] = self.per_second.get(sec, 0) + 1
+
+    def peak_rate(self) -> int:
+        return max(self.per_second.values()) if self.per_second else 0
+
+    def summary(self) -> str:
+        return (f"connects={self.connects} drops={self.drops} msgs_in={self.msgs_in} msgs_out={self.msgs_out} "
+                f"bytes_in={self.bytes_in} aliased={self.aliased} expired={self.expired} "
+                f"peak_in_rate={self.peak_rate()}/s")
+
+
+class Session:
+    def __init__(self, broker: "Broker", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id: str = ""
+        self.subscriptions: dict[str, int] = {}
+        self.will: tuple[bytes, bytes, int, bool] | None = None
+        self.clean: bool = True
+        self.pid: int = 0
+        self.level: int = 4
+        self.aliases: dict[int, bytes] = {}  # mqtt5: topic-aliases of this connection (client -> broker)
+
+    def next_pid(self) -> int:
+        self.pid = self.pid + 1 if self.pid < 65535 else 1
+        return self.pid
+
+    async def send(self, pkt: bytes) -> None:
+        self.writer.write(pkt)
+        await self.writer.drain()
+
+    async def read_packet(self) -> tuple[int, bytes]:
+        hdr: bytes = await self.reader.readexactly(1)
+        sz: int = 0
+        sh: int = 0
+        while True:
+            b: int = (await self.reader.readexactly(1))[0]
+            sz |= (b & 0x7F) << sh
+            if not b & 0x80:
+                break
+            sh += 7
+        body: bytes = await self.reader.readexactly(sz) if sz else b""
+        return hdr[0], body
+
+    async def deliver(self, topic: bytes, msg: bytes, qos: int, retain: bool, expires_at: float | None = None) -> None:
+        """ expires_at: time.monotonic() of the message-expiry (None: never) """
+        props: bytes | None = None
+        if expires_at is not None:
+            left: int = int(expires_at - time.monotonic())
+            if left <= 0:
+                self.broker.stats.expired += 1
+                return
+            if self.level == 5:
+                props = b"\x02" + struct.pack("!I", left)
+        if self.level == 5 and props is None:
+            props = b""
+
+        pid: int = self.next_pid() if qos else 0
+        await self.send(build_publish(topic, msg, qos, retain, pid, props=props))
+        self.broker.stats.msgs_out += 1
+
+    async def handle_connect(self, body: bytes) -> None:
+        pos: int = 2 + struct.unpack("!H", body[0:2])[0]  # protocol name
+        level: int = body[pos]
+        flags: int = body[pos + 1]
+        pos += 4  # level, flags, keepalive
+        self.level = level
+        if level == 5:
+            _, pos = read_props(body, pos)
+
+        def take_str() -> bytes:
+            nonlocal pos
+            ln: int = struct.unpack("!H", body[pos:pos + 2])[0]
+            s: bytes = body[pos + 2:pos + 2 + ln]
+            pos += 2 + ln
+            return s
+
+        self.client_id = take_str().decode()
+        self.clean = bool(flags & 0x02)
+        if flags & 0x04:
+            if level == 5:
+                _, pos = read_props(body, pos)  # will-properties
+            wt: bytes = take_str()
+            wm: bytes = take_str()
+            self.will = (wt, wm, (flags >> 3) & 0x03, bool(flags & 0x20))
+
+        if level not in (4, 5):
+            await self.send(b"\x20\x02\x00\x01")  # unacceptable protocol version
+            raise ConnectionError(f"unsupported protocol level {level}")
+
+        await self.broker.register(self)
+
+        queued: list = []
+        persisted: tuple | None = self.broker.persisted.pop(self.client_id, None)
+        if persisted is not None and not self.clean:
+            self.subscriptions, queued = persisted
+
+        if self.broker.latency_ms:
+            await asyncio.sleep(self.broker.latency_ms / 1000)
+        varhdr: bytes = (b"\x01" if persisted is not None and not self.clean else b"\x00") + b"\x00"
+        if level == 5:
+            props: bytes = b"\x22" + struct.pack("!H", self.broker.topic_alias_max)
+            varhdr += encode_varlen(len(props)) + props
+        await self.send(b"\x20" + encode_varlen(len(varhdr)) + varhdr)
+
+        for topic, msg, qos, expires_at in queued:
+            await self.deliver(topic, msg, qos, False, expires_at)
+
+    async def handle_publish(self, op: int, body: bytes) -> None:
+        qos: int = (op >> 1) & 0x03
+        retain: bool = bool(op & 0x01)
+        tl: int = struct.unpack("!H", body[0:2])[0]
+        topic: bytes = body[2:2 + tl]
+        pos: int = 2 + tl
+        pid: int = 0
+        if qos:
+            pid = struct.unpack("!H", body[pos:pos + 2])[0]
+            pos += 2
+
+        expires_at: float | None = None
+        if self.level == 5:
+            props, pos = read_props(body, pos)
+            alias: int | None = props.get(0x23)
+            if alias is not None:
+                if alias == 0 or alias > self.broker.topic_alias_max:
+                    await self.send(b"\xe0\x01\x94")  # topic alias invalid
+                    raise ConnectionError(f"invalid topic alias {alias}")
+                if topic:
+                    self.aliases[alias] = topic
+                elif alias in self.aliases:
+                    topic = self.aliases[alias]
+                else:
+                    await self.send(b"\xe0\x01\x82")  # protocol error
+                    raise ConnectionError(f"unknown topic alias {alias}")
+                self.broker.stats.aliased += 1
+            if 0x02 in props:
+                expires_at = time.monotonic() + props[0x02]
+        msg: bytes = body[pos:]
+
+        self.broker.stats.count_in(len(body))
+
+        if self.broker.latency_ms:
+            # every message is delayed on its own (like a link with rtt), so pipelined publishes overlap
+            t = asyncio.ensure_future(
+                self._ack_and_route(topic, msg, qos, retain, pid, self.broker.latency_ms, expires_at))
+            self.broker.background.add(t)
+            t.add_done_callback(self.broker.background.discard)
+        else:
+            await self._ack_and_route(topic, msg, qos, retain, pid, 0, expires_at)
+
+    async def _ack_and_route(self, topic: bytes, msg: bytes, qos: int, retain: bool, pid: int, delay_ms: int,
+                             expires_at: float | None = None) -> None:
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+
+        matched: int = await self.broker.route(topic, msg, qos, retain, expires_at)
+
+        try:
+            if qos == 1 and not self.broker.withholds_puback(topic):
+                if self.level == 5 and not matched:
+                    await self.send(b"\x40\x03" + struct.pack("!HB", pid, 0x10))  # no matching subscribers
+                else:
+                    await self.send(b"\x40\x02" + struct.pack("!H", pid))
+        except (ConnectionError, OSError):
+            pass
+
+    async def handle_subscribe(self, body: bytes) -> None:
+        pid: int = struct.unpack("!H", body[0:2])[0]
+        pos: int = 2
+        if self.level == 5:
+            _, pos = read_props(body, pos)
+        granted: bytearray = bytearray()
+        send_retained: list[str] = []
+        while pos < len(body):
+            ln: int = struct.unpack("!H", body[pos:pos + 2])[0]
+            f: str = body[pos + 2:pos + 2 + ln].decode()
+            opts: int = body[pos + 2 + ln]
+            qos: int = min(opts & 0x03, 1)
+            pos += 3 + ln
+
+            # retain-handling (mqtt5): 0 - always send the retained messages, 1 - only for a new subscription, 2 - never
+            rh: int = (opts >> 4) & 0x03 if self.level == 5 else 0
+            if not filter_valid(f):
+                granted.append(0x8F if self.level == 5 else 0x80)  # topic filter invalid / failure
+                continue
+
+            if rh == 0 or (rh == 1 and f not in self.subscriptions):
+                send_retained.append(f)
+
+            self.subscriptions[f] = qos
+            granted.append(qos)
+
+        if self.broker.latency_ms:
+            await asyncio.sleep(self.broker.latency_ms / 1000)
+        varhdr: bytes = struct.pack("!H", pid) + (b"\x00" if self.level == 5 else b"")
+        await self.send(b"\x90" + encode_varlen(len(varhdr) + len(granted)) + varhdr + bytes(granted))
+
+        for f in send_retained:
+            for topic, (msg, qos, expires_at) in list(self.broker.retained.items()):
+                if topic_matches(f, topic.decode()):
+                    await self.deliver(topic, msg, min(qos, self.subscriptions[f]), True, expires_at)
+
+    async def handle_unsubscribe(self, body: bytes) -> None:
+        pid: int = struct.unpack("!H", body[0:2])[0]
+        pos: int = 2
+        if self.level == 5:
+            _, pos = read_props(body, pos)
+        n: int = 0
+        while pos < len(body):
+            ln: int = struct.unpack("!H", body[pos:pos + 2])[0]
+            self.subscriptions.pop(body[pos + 2:pos + 2 + ln].decode(), None)
+            pos += 2 + ln
+            n += 1
+        if self.level == 5:
+            await self.send(b"\xb0" + encode_varlen(3 + n) + struct.pack("!H", pid) + b"\x00" + b"\x00" * n)
+        else:
+            await self.send(b"\xb0\x02" + struct.pack("!H", pid))
+
+    async def run(self) -> None:
+        clean_disconnect: bool = False
+        try:
+            op, body = await self.read_packet()
+            if op != 0x10:
+                return
+            await self.handle_connect(body)
+
+            while True:
+                op, body = await self.read_packet()
+                kind: int = op & 0xF0
+                if kind == 0x30:
+                    await self.handle_publish(op, body)
+                elif kind == 0x40:  # PUBACK from client
+                    pass
+                elif kind == 0x80:
+                    await self.handle_subscribe(body)
+                elif kind == 0xA0:
+                    await self.handle_unsubscribe(body)
+                elif kind == 0xC0:
+                    await self.send(b"\xd0\x00")
+                elif kind == 0xE0:
+                    clean_disconnect = True
+                    return
+                else:
+                    print(f"[{self.client_id}] unhandled packet {op:#x}")
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            self.broker.unregister(self)
+            if not self.clean and self.client_id and self.client_id not in self.broker.sessions:
+                self.broker.persisted[self.client_id] = (self.subscriptions, [])
+            if self.will and not clean_disconnect:
+                wt, wm, wq, wr = self.will
+                await self.broker.route(wt, wm, wq, wr)
+            self.writer.close()
+
+
+class Broker:
+    def __init__(self, latency_ms: int = 0, verbose: bool = False, topic_alias_max: int = 10,
+                 no_puback: list[str] | None = None):
+        self.latency_ms = latency_ms
+        self.verbose = verbose
+        self.topic_alias_max = topic_alias_max
+        self.no_puback: list[str] = no_puback or []
+        self.sessions: dict[str, Session] = {}
+        # clean_session=0 clients that are not connected: client_id -> (subscriptions, queued (topic, msg, qos, expires_at))
+        self.persisted: dict[str, tuple[dict[str, int], list]] = {}
+        self.retained: dict[bytes, tuple[bytes, int, float | None]] = {}
+        self.stats: Stats = Stats()
+        self.background: set = set()
+        self.server: asyncio.AbstractServer | None = None
+
+    async def register(self, session: Session) -> None:
+        old: Session | None = self.sessions.get(session.client_id)
+        if old is not None and old is not session:
+            old.will = None
+            old.writer.close()
+        self.sessions[session.client_id] = session
+        self.stats.connects += 1
+        if self.verbose:
+            print(f"CONNECT {session.client_id}")
+
+    def withholds_puback(self, topic: bytes) -> bool:
+        return any([topic_matches(f, topic.decode()) for f in self.no_puback])
+
+    def unregister(self, session: Session) -> None:
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+            if self.verbose:
+                print(f"GONE {session.client_id}")
+
+    async def route(self, topic: bytes, msg: bytes, qos: int, retain: bool, expires_at: float | None = None) -> int:
+        """ -> number of matching subscriptions (connected or persisted) """
+        if self.verbose:
+            print(f"PUBLISH {topic!r} {len(msg)=} {qos=} {retain=} {expires_at=}")
+
+        if retain:
+            if msg:
+                self.retained[topic] = (msg, qos, expires_at)
+            else:
+                self.retained.pop(topic, None)
+
+        matched: int = 0
+        t: str = topic.decode()
+        for s in list(self.sessions.values()):
+            for f, sq in s.subscriptions.items():
+                if topic_matches(f, t):
+                    matched += 1
+                    try:
+                        await s.deliver(topic, msg, min(qos, sq), False, expires_at)
+                    except (ConnectionError, OSError):
+                        pass
+                    break
+
+        for subs, queue in self.persisted.values():
+            for f, sq in subs.items():
+                if min(qos, sq) > 0 and topic_matches(f, t):
+                    matched += 1
+                    queue.append((topic, msg, min(qos, sq), expires_at))
+                    break
+
+        return matched
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await Session(self, reader, writer).run()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 1883) -> None:
+        self.server = await asyncio.start_server(self._client, host, port)
+
+    async def drop_all(self, down_for_s: float = 0) -> None:
+        """ like a crashing broker: every connection is cut (without DISCONNECT -> wills are sent), with down_for_s
+        new connections are refused for that long (retained messages survive, like a persistent mosquitto)
+        """
+        sockname = self.server.sockets[0].getsockname() if self.server else None
+        if down_for_s and self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+        for s in list(self.sessions.values()):
+            s.writer.close()
+        self.stats.drops += 1
+
+        if down_for_s and sockname:
+            await asyncio.sleep(down_for_s)
+            await self.start(sockname[0], sockname[1])
+
+    async def stop(self) -> None:
+        for s in list(self.sessions.values()):
+            s.will = None
+            s.writer.close()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+async def _main(args: argparse.Namespace) -> None:
+    broker: Broker = Broker(latency_ms=args.latency_ms, verbose=args.verbose, topic_alias_max=args.topic_alias_max,
+                            no_puback=args.no_puback)
+    await broker.start(args.host, args.port)
+    print(f"fakebroker listening on {args.host}:{args.port} latency={args.latency_ms}ms")
+
+    if args.drop_every_s:
+        asyncio.ensure_future(_chaos(broker, args.drop_every_s, args.down_for_s))
+
+    while True:
+        await asyncio.sleep(args.stats_every)
+        print(broker.stats.summary())
+
+
+async def _chaos(broker: Broker, every_s: float, down_for_s: float) -> None:
+    while True:
+        await asyncio.sleep(every_s)
+        print(f"dropping {len(broker.sessions)} connections, down for {down_for_s}s")
+        await broker.drop_all(down_for_s)
+        print("accepting connections again")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="minimal mqtt-3.1.1/5 broker stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--latency-ms", type=int, default=0, help="artificial delay before a PUBLISH is acked/routed")
+    parser.add_argument("--stats-every", type=int, default=10, help="print stats every n seconds")
+    parser.add_argument("--no-puback", action="append", metavar="FILTER",
+                        help="never ack qos1 publishes on topics matching FILTER (they are routed), repeatable")
+    parser.add_argument("--drop-every-s", type=float, default=0, help="cut all connections every n seconds")
+    parser.add_argument("--down-for-s", type=float, default=0, help="... and refuse new ones for that long")
+    parser.add_argument("--topic-alias-max", type=int, default=10, help="mqtt5: topic-aliases a client may use")
+    parser.add_argument("-v", "--verbose", action="store_true")
+
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,293 @@
+# fleet simulator / capacity-planning benchmark: n virtual devices, each one running the real config, wifi, mqttwrap
+# and the command handling of main.py (own MAC, own per-MAC config overlay, own reconnect-controller) against one
+# broker - replaying the traffic of a fleet: status every STATUS_PERIOD_S, light triggers, control-commands (direct
+# and broadcast) and connection losses.
+# reports what the broker had to route, end-to-end latencies (light: device -> subscriber, command: sender ->
+# handler on the device) and the device-side cpu-time per message sent/received
+#
+#   python3 tools/fakebroker.py --port 1883 &
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/fleetsim.py 127.0.0.1 1883 200 [duration_s]
+
+import sys
+import time
+import random
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+try:
+    import ujson
+except ImportError:
+    import json as ujson
+
+import logging
+
+import stats
+from mqttwrap import MQTTClient
+
+STATUS_PERIOD_S: int = 10
+POLL_MS: int = 250  # main.CHECK_MSGS_PERIOD_MS of the virtual devices (the device polls every 3s)
+LIGHT_EVERY_S: int = 20  # mean time between two light-triggers of a device
+COMMANDS_PER_S: int = 20  # direct control-commands, fleet-wide
+BROADCAST_EVERY_S: int = 15  # alternately to everybody / to one group
+GROUPS: int = 10
+OUTAGE_EVERY_S: int = 20
+OUTAGE_FRACTION: float = 0.1  # of the fleet losing the connection at once
+
+# modules with per-device state in their globals - each virtual device imports its own instances of them
+_PER_DEVICE: tuple = ("network", "config", "wifi", "rtcstore", "mqttwrap", "main")
+
+
+def fleet_macs(n: int) -> list[str]:
+    # espressif-OUI + a random-looking, but reproducible part (same as tools/bench_stagger.py)
+    return [f"24dcc3{(i * 2654435761) & 0xFFFFFF:06x}" for i in range(n)]
+
+
+def overlay_for(i: int, mac: str, host: str, port: int) -> dict:
+    """ what the per-MAC section of esp32config.json would hold for this device """
+    return {
+        "hostname": f"fleetsim{i}",
+        "mosquitto": {
+            "MOSQUITTO_HOST": host,
+            "MOSQUITTO_PORT": port,
+            "broadcastfeed": "esp32/all/control",
+            "groupfeed": "esp32/group/{group}/control",
+            "groups": [f"room{i % GROUPS}"],
+            "encoding": {"statusfeed": "json", "lightswitchfeed": "json"},
+            "light_confirm": False,
+        },
+        "spool": {"enabled": False},
+        "stagger": {"enabled": True},  # off in the base config - a fleet is what it is for
+        "reconnect": {"reset_after_s": 0},  # giving up = machine.reset() would end the simulation
+    }
+
+
+def load_device(mac: str, overlay: dict) -> dict:
+    """ fresh instances of the _PER_DEVICE modules for one MAC - sys.modules is left as it was """
+    saved: dict = {}
+    for n in _PER_DEVICE:
+        if n in sys.modules:
+            saved[n] = sys.modules.pop(n)
+
+    mods: dict = {}
+    try:
+        import network
+        network.WLAN(network.STA_IF).config(mac=bytes([int(mac[i:i + 2], 16) for i in range(0, 12, 2)]))
+
+        import config
+        config.apply(overlay)
+
+        import main  # imports wifi, rtcstore and mqttwrap against the network/config above
+        for n in _PER_DEVICE:
+            mods[n] = sys.modules[n]
+    finally:
+        for n in _PER_DEVICE:
+            sys.modules.pop(n, None)
+        sys.modules.update(saved)
+
+    for n in _PER_DEVICE + ("reconnect", "rotary_simple"):
+        logging.getLogger(n).setLevel(logging.ERROR)
+    return mods
+
+
+class _Sim:
+    def __init__(self):
+        self.light_ms: stats.LogHistogram = stats.LogHistogram()
+        self.command_ms: stats.LogHistogram = stats.LogHistogram()
+        self.routed: dict[str, int] = {}  # topic-kind -> messages seen by the monitor
+        self.bins: dict[int, int] = {}  # second -> messages seen by the monitor
+        self.sent_commands: int = 0
+        self.outages: int = 0
+        self.online: int = 0  # ONLINEs published (connects + reconnects)
+        self.wills: int = 0  # OFFLINEs published by the broker for a device
+        self.t0: int = time.ticks_ms()
+
+    def monitor_cb(self, topic, msg, retained: bool) -> None:
+        if retained:
+            return
+
+        t: bytes = bytes(topic)
+        kind: str = t[t.rfind(b"/") + 1:].decode()
+        self.routed[kind] = self.routed.get(kind, 0) + 1
+        s: int = time.ticks_diff(time.ticks_ms(), self.t0) // 1000
+        self.bins[s] = self.bins.get(s, 0) + 1
+
+        if kind == "LWT":
+            if bytes(msg) == b"ONLINE":
+                self.online += 1
+            else:
+                self.wills += 1
+        elif kind == "trigger":
+            try:
+                self.light_ms.add(time.ticks_diff(time.ticks_ms(), int(ujson.loads(bytes(msg))["value"])))
+            except Exception:
+                pass
+
+
+class _Device:
+    def __init__(self, sim: _Sim, i: int, mac: str, host: str, port: int):
+        self.sim = sim
+        self.mac = mac
+        mods: dict = load_device(mac, overlay_for(i, mac, host, port))
+        self.main = mods["main"]
+        self.mqttwrap = mods["mqttwrap"]
+        self.mqttwrap.TELE_PERIOD = STATUS_PERIOD_S
+
+        self.cpu_us: int = 0
+        self.rx: int = 0
+
+        self.main.register_commands()
+        # reboot/reset would end the process: here they just drop the connection (like a reboot, seen from outside)
+        for name in ("reboot", "reset"):
+            self.mqttwrap.register_command(name, self._reboot, idempotent=True)
+        # every simulated command carries the ticks_ms it was sent at as its arg
+        for name, h in list(self.mqttwrap._commands.items()):
+            self.mqttwrap._commands[name] = self._timed_command(h)
+
+        c: MQTTClient = self.mqttwrap._get_client()
+        cb = c.cb
+
+        def _cb(topic, msg, retained: bool) -> None:
+            t0: int = time.ticks_us()
+            cb(topic, msg, retained)
+            self.cpu_us += time.ticks_diff(time.ticks_us(), t0)
+            self.rx += 1
+
+        c.set_callback(_cb)
+
+    def _timed_command(self, handler):
+        async def _h(arg: str | None) -> None:
+            try:
+                self.sim.command_ms.add(time.ticks_diff(time.ticks_ms(), int(arg)))
+            except (TypeError, ValueError):
+                pass
+            await handler(arg)
+        return _h
+
+    async def _reboot(self, arg: str | None) -> None:
+        await self.drop()
+
+    async def drop(self) -> None:
+        if self.mqttwrap.is_connected():
+            await self.mqttwrap._mqttclient._close()
+
+    async def _timed(self, coro) -> None:
+        t0: int = time.ticks_us()
+        await coro
+        self.cpu_us += time.ticks_diff(time.ticks_us(), t0)
+
+    async def _check_msgs(self) -> None:
+        await self._timed(self.main.check_msgs())
+
+    async def _lights(self) -> None:
+        while True:
+            await asyncio.sleep_ms(random.getrandbits(20) % (LIGHT_EVERY_S * 2000))
+            if not self.mqttwrap.is_online():
+                continue
+            try:
+                await self._timed(self.main.send_light(time.ticks_ms()))
+            except Exception:
+                pass  # lost the connection in between - just like a button pressed while offline
+
+    def start(self) -> list:
+        return [
+            asyncio.create_task(self.main.make_reconnect_controller().run()),
+            asyncio.create_task(self.main.run_every(POLL_MS, self._check_msgs)),
+            asyncio.create_task(self._lights()),
+        ]
+
+
+async def _driver(sim: _Sim, drv: MQTTClient, devices: list[_Device]) -> None:
+    """ control-commands (direct + broadcast) and connection losses for the fleet """
+    cmds: tuple = ("rescanwifi", "switchap", "reboot")
+    next_broadcast: int = BROADCAST_EVERY_S * 1000
+    next_outage: int = OUTAGE_EVERY_S * 1000
+    broadcasts: int = 0
+
+    while True:
+        await asyncio.sleep_ms(1000 // COMMANDS_PER_S)
+        now: int = time.ticks_diff(time.ticks_ms(), sim.t0)
+
+        d: _Device = devices[random.getrandbits(16) % len(devices)]
+        cmd: str = cmds[random.getrandbits(8) % len(cmds)] if random.getrandbits(4) == 0 else "switchap"
+        await drv.publish(d.mqttwrap.format_with_clientid("esp32/{clientid}/control"),
+                          f"{cmd} {time.ticks_ms()}", qos=0)
+        sim.sent_commands += 1
+
+        if now >= next_broadcast:
+            next_broadcast += BROADCAST_EVERY_S * 1000
+            broadcasts += 1
+            topic: str = "esp32/all/control" if broadcasts % 2 else f"esp32/group/room{broadcasts % GROUPS}/control"
+            await drv.publish(topic, ujson.dumps({"cmd": "switchap", "arg": str(time.ticks_ms()), "window_s": 0}),
+                              qos=0)
+            sim.sent_commands += 1
+
+        if now >= next_outage:
+            next_outage += OUTAGE_EVERY_S * 1000
+            for d in devices:
+                if random.getrandbits(10) < OUTAGE_FRACTION * 1024:
+                    await d.drop()
+                    sim.outages += 1
+
+
+def _fmt(h: stats.LogHistogram) -> str:
+    d: dict = h.to_dict()
+    return f"n={d['n']:6d} p50<={d['p50']} p90<={d['p90']} p99<={d['p99']} max={d['max']}"
+
+
+async def run(host: str, port: int, n: int, duration_s: int) -> None:
+    sim: _Sim = _Sim()
+
+    t0: int = time.ticks_ms()
+    devices: list[_Device] = [_Device(sim, i, m, host, port) for i, m in enumerate(fleet_macs(n))]
+    print(f"loaded {n} virtual devices in {time.ticks_diff(time.ticks_ms(), t0)}ms")
+
+    mon: MQTTClient = MQTTClient(f"fleetsim_monitor_{time.ticks_ms()}", host, port, rx_buffer_size=4096)
+    mon.set_callback(sim.monitor_cb)
+    await mon.connect()
+    await mon.subscribe("esp32/#")
+
+    drv: MQTTClient = MQTTClient(f"fleetsim_driver_{time.ticks_ms()}", host, port)
+    await drv.connect()
+
+    sim.t0 = time.ticks_ms()
+    tasks: list = []
+    for d in devices:
+        tasks.extend(d.start())
+    tasks.append(asyncio.create_task(_driver(sim, drv, devices)))
+
+    await asyncio.sleep(duration_s)
+    for t in tasks:
+        t.cancel()
+    elapsed_s: float = time.ticks_diff(time.ticks_ms(), sim.t0) / 1000
+
+    await asyncio.sleep_ms(500)
+    for d in devices:
+        await d.drop()
+    await drv.disconnect()
+    await mon.disconnect()
+
+    routed: int = sum(sim.routed.values())
+    rx: int = sum([d.rx for d in devices])
+    tx: int = routed - sim.routed.get("control", 0) - sim.wills  # the rest was published by the devices
+    cpu_us: int = sum([d.cpu_us for d in devices])
+
+    print(f"{n} devices, {elapsed_s:.1f}s, {sim.sent_commands} commands sent, {sim.outages} connection losses, "
+          f"{max(0, sim.online - n)} reconnects")
+    print(f"broker:    {routed} msgs routed to the monitor, {routed / elapsed_s:.0f} msg/s "
+          f"(peak {max(sim.bins.values()) if sim.bins else 0} msg/s) - "
+          + " ".join([f"{k}={v}" for k, v in sorted(sim.routed.items())]))
+    print(f"light ms:   {_fmt(sim.light_ms)}")
+    print(f"command ms: {_fmt(sim.command_ms)}")
+    print(f"device:    {cpu_us / max(1, rx + tx):.0f}us cpu per message ({tx} sent, {rx} received)")
+
+
+if __name__ == "__main__":
+    _host: str = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    _port: int = int(sys.argv[2]) if len(sys.argv) > 2 else 1883
+    _n: int = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    _duration_s: int = int(sys.argv[4]) if len(sys.argv) > 4 else 60
+
+    asyncio.run(run(_host, _port, _n, _duration_s))
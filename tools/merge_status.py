@@ -0,0 +1,57 @@
+# host-side: rebuilds the full status per device from the delta-encoded status feed (see statusdelta.py)
+# and prints it as one json-line per received message
+#
+#   mosquitto_sub -h <broker> -t 'esp32/+/status' -v -F '%t %x' | python3 tools/merge_status.py
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import statusdelta  # noqa: E402
+from decode_feed import decode  # noqa: E402
+
+_mergers: dict[str, statusdelta.StatusMerger] = {}
+
+
+def merge(topic: str, payload: bytes) -> dict | None:
+    """ -> the full status of the device behind topic (None while waiting for a keyframe after a gap) """
+    doc: dict = decode(payload)
+
+    m: statusdelta.StatusMerger | None = _mergers.get(topic)
+    if m is None:
+        m = statusdelta.StatusMerger()
+        _mergers[topic] = m
+
+    state: dict | None = m.feed(doc["value"])
+    if state is None:
+        return None
+
+    doc["value"] = state
+    return doc
+
+
+def main() -> None:
+    for line in sys.stdin:
+        parts: list[str] = line.split()
+        if len(parts) != 2:
+            continue
+
+        topic, h = parts
+        try:
+            doc: dict | None = merge(topic, bytes.fromhex(h))
+        except Exception as ex:
+            print(f"cannot merge {topic}: {ex!r}", file=sys.stderr)
+            continue
+
+        if doc is None:
+            print(f"{topic}: gap in the sequence, waiting for the next keyframe", file=sys.stderr)
+            continue
+
+        print(json.dumps({"topic": topic, **doc}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# stand-in for the node-red flow behind the lightswitchfeed (cpython, asyncio): answers every request that carries
+# "rpc": {"id", "reply_to"} (see mqttwrap.rpc_call()) with {"id": .., "ok": true, "value": ..} on reply_to -
+# optionally delayed/failing, to see the round-trip histograms (status feed, "rpc") move
+#
+#   python3 tools/fakebroker.py --port 1883 &
+#   python3 tools/rpc_responder.py --port 1883 --delay-ms 50 --fail-every 10
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/bench_rpc.py 127.0.0.1 1883 100
+
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from decode_feed import decode  # noqa: E402
+from fakebroker import build_publish, encode_str, encode_varlen  # noqa: E402
+
+
+async def _read_packet(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    hdr: bytes = await reader.readexactly(1)
+    sz: int = 0
+    sh: int = 0
+    while True:
+        b: int = (await reader.readexactly(1))[0]
+        sz |= (b & 0x7F) << sh
+        if not b & 0x80:
+            break
+        sh += 7
+    return hdr[0], await reader.readexactly(sz) if sz else b""
+
+
+async def _ping(writer: asyncio.StreamWriter, every_s: int) -> None:
+    while True:
+        await asyncio.sleep(every_s)
+        writer.write(b"\xc0\x00")
+
+
+async def _answer(writer: asyncio.StreamWriter, req: dict, delay_ms: int, ok: bool) -> None:
+    if delay_ms:
+        await asyncio.sleep(delay_ms / 1000)
+    reply: dict = {"id": req["rpc"]["id"], "ok": ok, "value": req.get("value")}
+    writer.write(build_publish(req["rpc"]["reply_to"].encode(), json.dumps(reply).encode(), 0, False))
+
+
+async def run(args: argparse.Namespace) -> None:
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+
+    varhdr: bytes = b"\x00\x04MQTT\x04\x02" + struct.pack("!H", 60)
+    payload: bytes = encode_str(b"rpc_responder")
+    writer.write(b"\x10" + encode_varlen(len(varhdr) + len(payload)) + varhdr + payload)
+    op, body = await _read_packet(reader)
+    if op != 0x20 or body[1] != 0:
+        raise ConnectionError(f"CONNACK {body!r}")
+
+    sub: bytes = struct.pack("!H", 1) + encode_str(args.topic.encode()) + b"\x01"
+    writer.write(b"\x82" + encode_varlen(len(sub)) + sub)
+    print(f"answering requests on {args.topic} ({args.delay_ms=} {args.fail_every=})")
+
+    asyncio.ensure_future(_ping(writer, 30))
+    background: set = set()
+    n: int = 0
+
+    while True:
+        op, body = await _read_packet(reader)
+        if op & 0xF0 != 0x30:
+            continue
+
+        qos: int = (op >> 1) & 0x03
+        tl: int = struct.unpack("!H", body[0:2])[0]
+        pos: int = 2 + tl
+        if qos:
+            writer.write(b"\x40\x02" + body[pos:pos + 2])
+            pos += 2
+
+        if op & 0x01:
+            continue  # retained: an old request, its caller is long gone
+
+        try:
+            req: dict = decode(body[pos:])
+            req["rpc"]["id"], req["rpc"]["reply_to"]
+        except Exception:
+            continue  # no rpc - fire-and-forget publish
+
+        n += 1
+        ok: bool = not (args.fail_every and n % args.fail_every == 0)
+        t = asyncio.ensure_future(_answer(writer, req, args.delay_ms, ok))
+        background.add(t)
+        t.add_done_callback(background.discard)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="answers mqttwrap.rpc_call()-requests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--topic", default="esp32/+/trigger")
+    parser.add_argument("--delay-ms", type=int, default=0, help="answer after that long")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every n-th request with ok=false")
+
+    try:
+        asyncio.run(run(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,78 @@
+# wifi.WifiManager against the fake WLAN with simulated RSSI: the device walks away from the ap it is associated
+# with (lab/a: -55 -> -90dBm), while a second ap of the same ssid (lab/b) stays at -66dBm - then lab/a comes back.
+# expected: one roam to lab/b once the average stayed weak for roam_hold_s, no roaming back (lab/b is not weak).
+# also reports how late a 50ms-ticker next to it got (the scan blocks, the rest must not) and the link-stats
+#
+#   MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython tools/sim_roaming.py [scan_ms]
+
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+import config
+import wifi
+
+_A: bytes = b"\x02\x00\x00\x00\x00\x0a"
+_B: bytes = b"\x02\x00\x00\x00\x00\x0b"
+
+
+def _rssi_a(t_ms: int) -> int:
+    """ -55 for 2s, down to -90 at 12s, stays there until 20s, back to -50 at 24s """
+    if t_ms < 2_000:
+        return -55
+    if t_ms < 12_000:
+        return -55 - 35 * (t_ms - 2_000) // 10_000
+    if t_ms < 20_000:
+        return -90
+    return max(-90, -90 + 40 * (t_ms - 20_000) // 4_000)
+
+
+async def _ticker(lag: list) -> None:
+    while True:
+        t0: int = time.ticks_ms()
+        await asyncio.sleep_ms(50)
+        lag[0] = max(lag[0], time.ticks_diff(time.ticks_ms(), t0) - 50)
+
+
+async def sim(scan_ms: int) -> None:
+    config.apply({"wifi1": {"SSID": "lab", "password": "x", "timeout_ms": 3_000}})
+    wifi.wlan_scanlist = ["wifi1"]
+    wifi.wlan.scan_ms = scan_ms
+    wifi.wlan.assoc_ms = 300
+    wifi.wlan.scan_results = [(b"lab", _A, 1, -55, 3, False), (b"lab", _B, 11, -70, 3, False)]
+
+    m: wifi.WifiManager = wifi.WifiManager({
+        "enabled": True, "sample_ms": 250, "ema_alpha": 0.2, "roam_below_dbm": -75, "roam_margin_db": 8,
+        "roam_hold_s": 2, "roam_min_interval_s": 5,
+    })
+    wifi.manager = m
+    wifi.link = wifi.LinkStats(ring_size=32, sample_every=4, every_ms=1_000)
+
+    t0: int = time.ticks_ms()
+    m.add_listener(lambda ev, info: print(f"{time.ticks_diff(time.ticks_ms(), t0):6d}ms {ev:12s} {info}"))
+
+    await wifi.connect_wifi()
+    lag: list = [0]
+    tasks: list = [asyncio.create_task(m.run()), asyncio.create_task(_ticker(lag))]
+
+    while True:
+        t: int = time.ticks_diff(time.ticks_ms(), t0)
+        if t >= 30_000:
+            break
+        wifi.wlan.scan_results = [(b"lab", _A, 1, _rssi_a(t), 3, False), (b"lab", _B, 11, -66, 3, False)]
+        await asyncio.sleep_ms(100)
+
+    for tk in tasks:
+        tk.cancel()
+
+    print(f"associated with {'lab/b' if wifi.wlan._bssid == _B else 'lab/a'}, {m.roams} roams, "
+          f"rssi_avg {m.rssi_avg}, max ticker lag {lag[0]}ms ({scan_ms=})")
+    print(f"link stats: {wifi.link.to_dict()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(sim(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
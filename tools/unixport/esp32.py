@@ -0,0 +1,12 @@
+# fake esp32-module for running the project on the micropython unix-port (or cpython)
+
+WAKEUP_ALL_LOW = 0
+WAKEUP_ANY_HIGH = 1
+
+
+def wake_on_ext0(pin, level: int):
+    pass
+
+
+def wake_on_ext1(pins, level: int):
+    pass
@@ -0,0 +1,185 @@
+# fake machine-module for running the project on the micropython unix-port (or cpython)
+# just enough surface for main.py, boot_ssd.py, wifi.py and rotary_simple.py to import and "run"
+#
+# MICROPYPATH=tools/unixport:.:~/.micropython/lib micropython main.py
+#
+# FAKE_RTC_MEMORY=<file> keeps RTC().memory() in that file, so a "deepsleep" (= exit) + restart with
+# FAKE_RESET_CAUSE=4 behaves like a wake-up from deepsleep
+
+import os
+import sys
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+_reset_cause: int = int(os.getenv("FAKE_RESET_CAUSE") or PWRON_RESET)
+
+
+def reset_cause() -> int:
+    return _reset_cause
+
+
+def unique_id() -> bytes:
+    return b"\xaa\xbb\xcc\xdd\xee\xff"
+
+
+def reset():
+    print("machine.reset() called => exiting")
+    sys.exit(1)
+
+
+def soft_reset():
+    print("machine.soft_reset() called => exiting")
+    sys.exit(1)
+
+
+def deepsleep(ms: int = 0):
+    print(f"machine.deepsleep({ms}) called => exiting")
+    sys.exit(0)
+
+
+def lightsleep(ms: int = 0):
+    pass
+
+
+def freq(*args):
+    return 240_000_000
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    def __init__(self, pin_id: int, mode: int = -1, pull: int | None = None, value: int | None = None):
+        self.pin_id = pin_id
+        self._value = 1 if value is None else value
+        self._handler = None
+
+    def value(self, v: int | None = None):
+        if v is None:
+            return self._value
+
+        changed: bool = v != self._value
+        self._value = v
+        if changed and self._handler:
+            self._handler(self)
+
+    def irq(self, handler=None, trigger: int = 0):
+        self._handler = handler
+
+    def __repr__(self):
+        return f"Pin({self.pin_id})"
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, timer_id: int):
+        self.timer_id = timer_id
+
+    def init(self, period: int = -1, mode: int = PERIODIC, callback=None):
+        pass
+
+    def deinit(self):
+        pass
+
+
+class SoftI2C:
+    def __init__(self, scl: Pin, sda: Pin, freq: int = 400_000):
+        pass
+
+    def scan(self) -> list:
+        return []
+
+    def writeto(self, addr: int, buf, stop: bool = True):
+        return len(buf)
+
+    def writevto(self, addr: int, vector, stop: bool = True):
+        return 1
+
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+    WIDTH_12BIT = 3
+
+    def __init__(self, pin: Pin, atten: int = ATTN_0DB):
+        pass
+
+    def width(self, w: int):
+        pass
+
+    def read(self) -> int:
+        return 0
+
+    def read_u16(self) -> int:
+        return 0
+
+
+class PWM:
+    def __init__(self, pin: Pin, duty: int = 0, freq: int = 0):
+        self._duty = duty
+
+    def duty(self, d: int | None = None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+
+class UART:
+    def __init__(self, uart_id: int, **kwargs):
+        pass
+
+    def init(self, *args, **kwargs):
+        pass
+
+    def any(self) -> int:
+        return 0
+
+    def read(self, n: int = -1):
+        return None
+
+    def write(self, buf):
+        return len(buf)
+
+
+_rtc_memory: bytes = b""
+
+
+class RTC:
+    def memory(self, data=None):
+        global _rtc_memory
+
+        path: str | None = os.getenv("FAKE_RTC_MEMORY")
+        if data is None:
+            if path:
+                try:
+                    with open(path, "rb") as f:
+                        return f.read()
+                except OSError:
+                    return b""
+            return _rtc_memory
+
+        if len(data) > 2048:
+            raise ValueError("RTC memory is 2048 bytes")
+        _rtc_memory = bytes(data)
+        if path:
+            with open(path, "wb") as f:
+                f.write(_rtc_memory)
+
+    def datetime(self, dt=None):
+        if dt is None:
+            import time
+            t = time.gmtime()
+            return t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0
@@ -0,0 +1,125 @@
+# fake network-module for running the project on the micropython unix-port (or cpython)
+# a WLAN which reports the host as the connected interface. without scan_results it "associates" to any ssid,
+# with scan_results only to the ssids (and bssids) in there.
+# FAKE_SCAN_MS / FAKE_ASSOC_MS: how long scan() blocks / connect() takes until isconnected() (esp32: ~2s / ~1s),
+# FAKE_DHCP_MS: added to the association unless a static ifconfig() was set
+
+import os
+import time
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+STAT_NO_AP_FOUND = 201
+STAT_WRONG_PASSWORD = 202
+
+_DEFAULT_MAC: str = "aabbccddee00"
+
+
+def _mac_from_env() -> bytes:
+    m: str = os.getenv("FAKE_MAC") or _DEFAULT_MAC
+    # all of it: the overlays in esp32config.json are keyed by 7-byte (14 hex digits) placeholder MACs
+    m = m.replace(":", "")
+    return bytes(int(m[i:i + 2], 16) for i in range(0, len(m), 2))
+
+
+class WLAN:
+    _instances: dict = {}
+
+    def __new__(cls, interface_id: int = STA_IF):
+        # like on the device: WLAN(STA_IF) always returns the same interface object
+        if interface_id not in cls._instances:
+            o = object.__new__(cls)
+            o._init(interface_id)
+            cls._instances[interface_id] = o
+        return cls._instances[interface_id]
+
+    def __init__(self, interface_id: int = STA_IF):
+        pass
+
+    def _init(self, interface_id: int):
+        self.interface_id = interface_id
+        self._active = False
+        self._connected = False
+        self._ssid = None
+        self._config = {
+            "mac": _mac_from_env(),
+            "ssid": None,
+            "channel": 1,
+            "reconnects": -1,
+            "hostname": "unixport",
+        }
+        self._ifconfig = ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+        self.rssi = -60
+        self.scan_results: list = []  # (ssid, bssid, channel, rssi, authmode, hidden)
+        self.scan_ms: int = int(os.getenv("FAKE_SCAN_MS") or 0)
+        self.assoc_ms: int = int(os.getenv("FAKE_ASSOC_MS") or 0)
+        self.dhcp_ms: int = int(os.getenv("FAKE_DHCP_MS") or 0)
+        self._static: bool = False
+        self.scans: int = 0
+        self._connect_at: int = 0
+        self._reachable: bool = False
+        self._bssid: bytes | None = None
+
+    def active(self, a: bool | None = None):
+        if a is None:
+            return self._active
+        self._active = a
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config[args[0]]
+        self._config.update(kwargs)
+
+    def scan(self) -> list:
+        self.scans += 1
+        if self.scan_ms:
+            time.sleep_ms(self.scan_ms)
+        return self.scan_results
+
+    def connect(self, ssid=None, key=None, bssid=None):
+        self._ssid = ssid
+        self._config["ssid"] = ssid
+        self._connected = True
+        self._connect_at = time.ticks_ms()
+
+        self._bssid = None
+        self._reachable = not self.scan_results
+        for r in self.scan_results:
+            if r[0] == (ssid.encode() if isinstance(ssid, str) else ssid) and (bssid is None or r[1] == bssid):
+                self._reachable = True
+                self._bssid = r[1]
+                self._config["channel"] = r[2]
+                break
+
+    def disconnect(self):
+        self._connected = False
+
+    def _associating(self) -> bool:
+        return time.ticks_diff(time.ticks_ms(), self._connect_at) < self.assoc_ms + (0 if self._static else self.dhcp_ms)
+
+    def isconnected(self) -> bool:
+        return self._connected and self._reachable and not self._associating()
+
+    def status(self, param: str | None = None):
+        if param == "rssi":
+            # the current value of the associated ap in scan_results (a simulation may change it over time)
+            for r in self.scan_results:
+                if r[1] == self._bssid:
+                    return r[3]
+            return self.rssi
+        if not self._connected:
+            return STAT_IDLE
+        if self._associating():
+            return STAT_CONNECTING
+        return STAT_GOT_IP if self._reachable else STAT_NO_AP_FOUND
+
+    def ifconfig(self, cfg: tuple | None = None):
+        if cfg is None:
+            return self._ifconfig
+        self._static = cfg != "dhcp"
+        if self._static:
+            self._ifconfig = cfg
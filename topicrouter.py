@@ -0,0 +1,153 @@
+# subscription-router: handlers are registered for topic-filters (with +/# wildcards) and incoming messages are
+# matched level by level in a trie - on the raw bytes of the rx-buffer, nothing is decoded or sliced for that.
+# the children of a level are a short list compared in place (a dict would need a bytes-key per lookup)
+#
+#   r = TopicRouter()
+#   r.add("esp32/aabbccddeeff/control", on_control)
+#   r.add("esp32/all/+", on_broadcast)
+#   r.route(topic, msg, retained)    # -> number of handlers called
+#
+# like mqtt: "a/#" also matches "a", wildcards at the first level do not match topics starting with "$"
+
+
+def _eq(mv, start: int, end: int, b: bytes) -> bool:
+    # mv[start:end] == b without creating the slice (memoryview does not compare by content on micropython)
+    n: int = len(b)
+    if end - start != n:
+        return False
+    for i in range(n):
+        if mv[start + i] != b[i]:
+            return False
+    return True
+
+
+class _Node:
+    def __init__(self):
+        self.children: list[tuple[bytes, "_Node"]] = []
+        self.plus: _Node | None = None
+        self.hash: list = []  # handlers of "<this level>/#"
+        self.handlers: list = []  # handlers of exactly this level
+
+    def child(self, level: bytes, create: bool) -> "_Node | None":
+        if level == b"+":
+            if self.plus is None and create:
+                self.plus = _Node()
+            return self.plus
+
+        for k, c in self.children:
+            if k == level:
+                return c
+
+        if not create:
+            return None
+        c = _Node()
+        self.children.append((level, c))
+        return c
+
+    def empty(self) -> bool:
+        return not self.children and self.plus is None and not self.hash and not self.handlers
+
+
+class TopicRouter:
+    def __init__(self):
+        self._root: _Node = _Node()
+        self.filters: list[bytes] = []  # in the order they were added (e.g. to subscribe them)
+        self.routed: int = 0
+        self.unmatched: int = 0
+
+    def add(self, topic_filter: str | bytes, handler) -> None:
+        """ handler(topic, msg, retained) - topic/msg are memoryviews, only valid during the call """
+        tf: bytes = topic_filter.encode() if isinstance(topic_filter, str) else bytes(topic_filter)
+        levels: list[bytes] = tf.split(b"/")
+
+        node: _Node = self._root
+        for i, level in enumerate(levels):
+            if level == b"#":
+                if i != len(levels) - 1:
+                    raise ValueError(f"invalid topic filter {tf}")
+                node.hash.append(handler)
+                break
+            if (b"#" in level or b"+" in level) and level != b"+":
+                raise ValueError(f"invalid topic filter {tf}")
+            node = node.child(level, True)
+        else:
+            node.handlers.append(handler)
+
+        if tf not in self.filters:
+            self.filters.append(tf)
+
+    def remove(self, topic_filter: str | bytes, handler=None) -> None:
+        """ handler None: all handlers of topic_filter """
+        tf: bytes = topic_filter.encode() if isinstance(topic_filter, str) else bytes(topic_filter)
+        levels: list[bytes] = tf.split(b"/")
+
+        path: list[tuple[_Node, bytes]] = []
+        node: _Node | None = self._root
+        for level in levels:
+            if level == b"#":
+                break
+            path.append((node, level))
+            node = node.child(level, False)
+            if node is None:
+                return
+
+        hl: list = node.hash if levels[-1] == b"#" else node.handlers
+        if handler is None:
+            hl.clear()
+        elif handler in hl:
+            hl.remove(handler)
+
+        if not hl and tf in self.filters:
+            self.filters.remove(tf)
+
+        # prune the branch that is left without handlers
+        while path and node.empty():
+            parent, level = path.pop()
+            if level == b"+":
+                parent.plus = None
+            else:
+                parent.children = [(k, c) for k, c in parent.children if c is not node]
+            node = parent
+
+    def route(self, topic, msg, retained: bool = False) -> int:
+        """ -> number of handlers called """
+        n: int = self._match(self._root, topic, 0, len(topic), msg, retained)
+        if n:
+            self.routed += 1
+        else:
+            self.unmatched += 1
+        return n
+
+    def _match(self, node: _Node, topic, start: int, n: int, msg, retained: bool) -> int:
+        called: int = 0
+        wild: bool = start > 0 or n == 0 or topic[0] != 0x24  # "$SYS/..." is not matched by wildcards
+
+        if node.hash and wild:
+            for h in node.hash:
+                h(topic, msg, retained)
+            called += len(node.hash)
+
+        end: int = start
+        while end < n and topic[end] != 0x2F:
+            end += 1
+
+        for k, c in node.children:
+            if _eq(topic, start, end, k):
+                called += self._descend(c, topic, end, n, msg, retained)
+                break
+
+        if node.plus is not None and wild:
+            called += self._descend(node.plus, topic, end, n, msg, retained)
+
+        return called
+
+    def _descend(self, c: _Node, topic, end: int, n: int, msg, retained: bool) -> int:
+        if end < n:
+            return self._match(c, topic, end + 1, n, msg, retained)
+
+        # last level: the exact handlers and "<this>/#" ("a/#" matches "a")
+        for h in c.handlers:
+            h(topic, msg, retained)
+        for h in c.hash:
+            h(topic, msg, retained)
+        return len(c.handlers) + len(c.hash)
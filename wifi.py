@@ -3,8 +3,15 @@ import sys
 import io
 import network
 import config
-import machine
 import ubinascii
+import array
+import rtcstore
+import stats
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
 
 import boot_ssd
 
@@ -33,6 +40,67 @@ else:
 
 
 
+# the last scan as a fixed-size table (the strongest size bssids): a scan blocks the esp32 for ~2s, so connecting,
+# roaming and the status feed read from here and only scan when it is older than ttl_s (or on rescanwifi)
+class ScanCache:
+    def __init__(self, size: int = 16, ttl_s: int = 300, refresh_s: int = 0):
+        """ refresh_s: WifiManager.run() scans in the background when the cache is older than that (0: on demand only) """
+        self.size = size
+        self.ttl_ms: int = ttl_s * 1000
+        self.refresh_ms: int = refresh_s * 1000
+
+        self._ssid: list[bytes | None] = [None] * size
+        self._bssid: bytearray = bytearray(6 * size)
+        self._channel: bytearray = bytearray(size)
+        self._rssi: array.array = array.array("b", bytes(size))
+        self.n: int = 0
+        self.at: int | None = None  # ticks_ms of the last scan
+        self.scans: int = 0
+
+    def age_ms(self) -> int | None:
+        return None if self.at is None else time.ticks_diff(time.ticks_ms(), self.at)
+
+    def fresh(self) -> bool:
+        return self.at is not None and self.age_ms() < self.ttl_ms
+
+    def invalidate(self) -> None:
+        self.at = None
+
+    def refresh(self) -> int:
+        """ scans (blocking!) -> number of entries kept """
+        res: list = sorted(wlan.scan(), key=lambda r: -r[3])
+
+        self.n = min(len(res), self.size)
+        for i in range(self.n):
+            ssid, bssid, channel, RSSI, authmode, hidden = res[i]
+            self._ssid[i] = ssid
+            self._bssid[i * 6:i * 6 + 6] = bssid
+            self._channel[i] = channel
+            self._rssi[i] = max(-128, min(127, RSSI))
+        for i in range(self.n, self.size):
+            self._ssid[i] = None
+
+        self.at = time.ticks_ms()
+        self.scans += 1
+        return self.n
+
+    def entries(self, max_age_ms: int | None = None) -> list[tuple]:
+        """ -> [(ssid, bssid, channel, rssi)], strongest first - scans first if older than max_age_ms (None: ttl_s,
+        -1: never scan, whatever is cached)
+        """
+        age: int | None = self.age_ms()
+        if max_age_ms != -1 and (age is None or age >= (self.ttl_ms if max_age_ms is None else max_age_ms)):
+            self.refresh()
+
+        return [(self._ssid[i], bytes(self._bssid[i * 6:i * 6 + 6]), self._channel[i], self._rssi[i])
+                for i in range(self.n)]
+
+
+_sc: dict = config.data.get("wifi_scan", {})
+scan_cache: ScanCache = ScanCache(size=_sc.get("cache_size", 16), ttl_s=_sc.get("ttl_s", 300),
+                                  refresh_s=_sc.get("refresh_s", 0))
+
+
 def get_wifi_strength():
     global wlan
     try:
@@ -43,20 +111,12 @@ def get_wifi_strength():
         return None
 
 def get_wifi_scan() -> list[dict]|None:
-    global wlan
-    ret: list[dict] = []
-    try:
-        scaninfo = wlan.scan()
-        for i in scaninfo:
-            ssid, bssid, channel, RSSI, authmode, hidden = i
-            bssid_s = ubinascii.hexlify(bssid)
-
-            ret.append({"ssid": ssid, "bssid": bssid_s, "channel": channel, "rssi": RSSI})
-            logger.info(f"{ssid=} bssid={bssid_s} {channel=} {RSSI=} {authmode=} {hidden=}")
-    except Exception as ex:
+    """ from the scan-cache (never scans) - None if there was no scan yet """
+    if scan_cache.at is None:
         return None
 
-    return ret
+    return [{"ssid": ssid.decode(), "bssid": ubinascii.hexlify(bssid).decode(), "channel": channel, "rssi": RSSI}
+            for ssid, bssid, channel, RSSI in scan_cache.entries(-1)]
 
 def get_wifi_config() -> dict:
     global wlan
@@ -73,88 +133,432 @@ def get_wifi_config() -> dict:
 
     return ret
 
+def isconnected() -> bool:
+    # while roaming (see WifiManager) the link is down on purpose for a moment
+    return wlan.isconnected() or manager.state == "roaming"
+
+
+# how often a connection-attempt checks whether it got through
+_CONNECT_POLL_MS: int = 100
+
+# the last successful connection in the RTC-memory (survives deepsleep and resets, not a power-cycle):
+# "<section>\n<bssid hex>\n<channel>\n<ip>\n<subnet>\n<gateway>\n<dns>" - the next connect goes straight to that
+# bssid/channel (optionally with the old lease as static ip, no dhcp) and only scans if that fails
+_CACHE_KEY: str = "wf"
+
+_current: tuple[str, bytes | None] | None = None  # (section, bssid) of the attempt in progress
+_static_ip: bool = False
+
+connect_path: str | None = None  # how the last connect got through: "cached" / "scan"
+connect_ms: int | None = None  # ... and how long it took
+
+
+def _candidates() -> list[tuple[str, bytes | None]]:
+    """ ONE scan (from the scan-cache) for all configured networks (wlan_scanlist) -> (config-section, bssid) to try,
+    best first: higher <section>.priority (default 0) first, then the stronger RSSI - every bssid of a configured ssid is a
+    candidate of its own. configured networks the scan did not see (hidden ssid) follow in wlan_scanlist-order,
+    without a bssid
+    """
+    sections: dict = {}  # ssid (bytes) -> config-section (the first one, if two configure the same ssid)
+    for w in wlan_scanlist:
+        if w in config.data and config.data[w]["SSID"].encode() not in sections:
+            sections[config.data[w]["SSID"].encode()] = w
+
+    ranked: list[tuple] = []
+    for ssid, bssid, channel, RSSI in scan_cache.entries():
+        w: str | None = sections.get(ssid)
+        if w is None:
+            continue
+        logger.info(f"{w}:: {ssid=} bssid={ubinascii.hexlify(bssid)} {channel=} {RSSI=}")
+        ranked.append((-config.data[w].priority, -RSSI, w, bssid))
+
+    ranked.sort()
+    ret: list[tuple[str, bytes | None]] = [(r[2], r[3]) for r in ranked]
+
+    seen: list[str] = [r[2] for r in ranked]
+    for w in sections.values():
+        if w not in seen:
+            ret.append((w, None))
+
+    return ret
+
+
+def _timeout_ms(w: str) -> int:
+    """ per candidate: <section>.timeout_ms - or the older <section>.retries (seconds) """
+    return config.data[w].get("timeout_ms", config.data[w].get("retries", 10) * 1000)
+
+
+def _start_connect(w: str, bssid: bytes | None) -> None:
+    global _current
+
+    apssid = config.data[w]["SSID"]
+    logger.info(f"connecting to network {apssid} bssid={'NONE' if bssid is None else ubinascii.hexlify(bssid)}...")
+
+    if boot_ssd.ssd:
+        boot_ssd.ssd.fill(0)
+        boot_ssd.ssd.text(f"Connecting WiFi", 0, 0, 1)
+        boot_ssd.ssd.text(f"SSID: {apssid}", 0, 9, 1)
+        boot_ssd.ssd.show()
+
+    _current = (w, bssid)
+    wlan.connect(apssid, config.data[w]["password"], bssid=bssid)
+
+
+def _start_cached() -> bool:
+    """ directed connect to the cached bssid/channel (see _CACHE_KEY) -> False if there is nothing usable cached """
+    global _static_ip
+
+    if not config.data.wifi_cache.enabled:
+        return False
+
+    c: bytes | None = rtcstore.get(_CACHE_KEY)
+    if c is None:
+        return False
+
+    try:
+        w, bssid, channel, ip, subnet, gateway, dns = c.decode().split("\n")
+        if w not in config.data:
+            raise ValueError(f"no config-section {w}")
+
+        if config.data.wifi_cache.static_ip and ip:
+            # the old lease: no dhcp round-trip (the router keeps the lease for a while after we are gone)
+            wlan.ifconfig((ip, subnet, gateway, dns))
+            _static_ip = True
+    except Exception as ex:
+        logger.warning(f"invalid wifi-cache {c}: {ex!r}")
+        rtcstore.put(_CACHE_KEY, None)
+        return False
+
+    if channel:
+        try:
+            wlan.config(channel=int(channel))  # no scan over all channels before associating
+        except Exception as ex:
+            logger.debug(f"channel-hint not supported: {ex!r}")
+
+    _start_connect(w, ubinascii.unhexlify(bssid) if bssid else None)
+    return True
+
+
+def _cached_failed() -> None:
+    """ the cached network is gone (or the lease): forget it, back to dhcp and the full scan """
+    global _static_ip
+
+    logger.info("cached wifi failed -> scanning")
+    wlan.disconnect()
+    rtcstore.put(_CACHE_KEY, None)
+    if _static_ip:
+        wlan.ifconfig("dhcp")
+        _static_ip = False
+
+
+def _attempt_failed() -> bool:
+    """ the driver already gave up on the current attempt (no need to wait for the timeout) """
+    return wlan.status() in (network.STAT_NO_AP_FOUND, network.STAT_WRONG_PASSWORD)
+
+
+def _connected(path: str | None = None, t0: int = 0) -> tuple:
+    """ path: how the connect got through ("cached"/"scan", started at ticks_ms t0) - None: was connected already """
+    global connect_path, connect_ms
+
+    ret: tuple = wlan.ifconfig()
+    logger.info(f'network config: wlan.ifconfig()={ret}')  # (ip, subnet, gateway, dns)
+    logger.info(f"WIFI-Strength: wlan.status('rssi')={wlan.status('rssi')}")
+    # wlan.status()
+    # ensureWEBREpl()
+
+    if path is not None:
+        connect_path = path
+        connect_ms = time.ticks_diff(time.ticks_ms(), t0)
+        logger.info(f"wifi connected via {path} in {connect_ms}ms")
+
+        if config.data.wifi_cache.enabled and _current is not None:
+            w, bssid = _current
+            rtcstore.put(_CACHE_KEY, "\n".join(
+                [w, "" if bssid is None else ubinascii.hexlify(bssid).decode(), str(wlan.config("channel"))]
+                + list(ret)
+            ).encode())
+
+    if boot_ssd.ssd:
+        boot_ssd.ssd.text(f"Connected.", 0, 18, 1)
+        boot_ssd.ssd.show()
+
+    return ret
+
+
+def _wait_blocking(timeout_ms: int) -> bool:
+    deadline: int = time.ticks_add(time.ticks_ms(), timeout_ms)
+    while not wlan.isconnected() and not _attempt_failed() and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+        time.sleep_ms(_CONNECT_POLL_MS)
+    return wlan.isconnected()
+
+
+async def _wait(timeout_ms: int) -> bool:
+    deadline: int = time.ticks_add(time.ticks_ms(), timeout_ms)
+    while not wlan.isconnected() and not _attempt_failed() and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+        await asyncio.sleep_ms(_CONNECT_POLL_MS)
+    return wlan.isconnected()
+
+
 def ensure_wifi() -> tuple|None:
     # global data
     global wlan, wlan_scanlist
 
-    ret: tuple | None = None if not wlan.isconnected else wlan.ifconfig()
+    ret: tuple | None = None if not wlan.isconnected() else wlan.ifconfig()
+    t0: int = time.ticks_ms()
 
-    while not wlan.isconnected():
-        for w in wlan_scanlist:
-            if wlan.isconnected():
-                break
+    if not wlan.isconnected() and _start_cached():
+        if _wait_blocking(config.data.wifi_cache.timeout_ms):
+            return _connected("cached", t0)
+        _cached_failed()
 
-            if w not in config.data:
+    while not wlan.isconnected():
+        for w, bssid in _candidates():
+            timeout_ms: int = _timeout_ms(w)
+            if timeout_ms <= 0:
                 continue
 
-            _bssid = None
-            _bestrssi = None
-            scaninfo = wlan.scan()
-            for i in scaninfo:
-                ssid, bssid, channel, RSSI, authmode, hidden = i
-                if ssid.decode('utf-8') == config.data[w]["SSID"]:
-                    if _bestrssi:
-                        if _bestrssi < RSSI:
-                            logger.info(f"BEST ONE SO FAR:: {ssid=} bssid={ubinascii.hexlify(bssid)} {channel=} {RSSI=} {authmode=} {hidden=}")
-                            _bestrssi = RSSI
-                            _bssid = bssid
-                    else:
-                        logger.info(f"INITIAL:: {ssid=} bssid={ubinascii.hexlify(bssid)} channel={channel} RSSI={RSSI} authmode={authmode} hidden={hidden}")
-                        _bestrssi = RSSI
-                        _bssid = bssid
-
-            if _bssid is None:
-                logger.info(
-                    f'connecting to network {config.data[w]["SSID"]} bssid=NONE...')  # or just scan and connect to best ?!
-            else:
-                logger.info(
-                    f'connecting to network {config.data[w]["SSID"]} bssid={ubinascii.hexlify(_bssid)}...')  # or just scan and connect to best ?!
-
-            apssid = config.data[w]["SSID"]
-
-            if boot_ssd.ssd:
-                boot_ssd.ssd.fill(0)
-                boot_ssd.ssd.text(f"Connecting WiFi", 0, 0, 1)
-                boot_ssd.ssd.text(f"SSID: {apssid}", 0, 9, 1)
-                boot_ssd.ssd.show()
-
-            wlan.connect(apssid, config.data[w]["password"], bssid=_bssid)
-            for _ in range(config.data[w]["retries"]):
-                if wlan.isconnected():
-                    ret = wlan.ifconfig()
-                    logger.info(f'network config: wlan.ifconfig()={ret}')  # (ip, subnet, gateway, dns)
-                    logger.info(f"WIFI-Strength: wlan.status('rssi')={wlan.status('rssi')}")
-                    # wlan.status()
-                    # ensureWEBREpl()
-
-                    if boot_ssd.ssd:
-                        boot_ssd.ssd.text(f"Connected.", 0, 18, 1)
-                        boot_ssd.ssd.show()
-
-                    break
-                else:
-                    time.sleep(1)
-            else:
-                logger.info("disonnecting WIFI")
-                wlan.disconnect()
+            _start_connect(w, bssid)
+            if _wait_blocking(timeout_ms):
+                ret = _connected("scan", t0)
+                break
 
-    return ret
+            logger.info("disonnecting WIFI")
+            wlan.disconnect()
+        else:
+            scan_cache.invalidate()  # nothing worked with what was cached - the next round scans again
 
-def ensure_wifi_catch_reset(reset_if_wifi_fails: bool = True) -> tuple:
-    try:
-        return ensure_wifi()
-    except Exception as ex:
-        _timestring = time.getisotimenow()
+    return ret
 
-        _out = io.StringIO()
-        sys.print_exception(ex)
-        sys.print_exception(ex, _out)
 
-        logger.error(_out.getvalue())
+async def connect_wifi() -> tuple:
+    """ the cached network (see _CACHE_KEY) - or one round through the ranked candidates (see _candidates()) without
+    blocking the event-loop while waiting - raises OSError if none worked (the reconnect-controller does the
+    retrying, see reconnect.py)
+    """
+    if wlan.isconnected():
+        return _connected()
+
+    t0: int = time.ticks_ms()
+
+    if _start_cached():
+        if await _wait(config.data.wifi_cache.timeout_ms):
+            return _connected("cached", t0)
+        _cached_failed()
+
+    for w, bssid in _candidates():
+        timeout_ms: int = _timeout_ms(w)
+        if timeout_ms <= 0:
+            continue
+
+        _start_connect(w, bssid)
+        if await _wait(timeout_ms):
+            return _connected("scan", t0)
+
+        logger.info("disonnecting WIFI")
+        wlan.disconnect()
+
+    scan_cache.invalidate()
+    raise OSError("no wifi")
+
+# link-quality history with a hard memory cap (fed by WifiManager.sample(), so it costs no extra wlan-calls):
+# a ring of RSSI samples (array "b", the minimum of every sample_every samples - dips are what explains an outage),
+# disconnects per reason (wlan.status() when the link was found down), log2-histograms of the wifi-reconnect
+# durations and the mqtt ping round-trips
+class LinkStats:
+    def __init__(self, ring_size: int = 120, sample_every: int = 5, every_ms: int = 10_000, max_reasons: int = 8):
+        """ every_ms: time between two ring-entries (for the status feed) """
+        self.rssi: array.array = array.array("b", bytes(ring_size))
+        self.sample_every = sample_every
+        self.every_ms = every_ms
+        self.max_reasons = max_reasons
+
+        self.samples: int = 0  # ring-entries written so far (the ring holds the last ring_size of them)
+        self._reported: int = 0
+        self._acc: int = 0
+        self._min: int = 127
+
+        self.disconnects: dict[str, int] = {}
+        self.reconnect_ms: stats.LogHistogram = stats.LogHistogram()
+        self.ping_ms: stats.LogHistogram = stats.LogHistogram()
+
+    def add_rssi(self, rssi: int) -> None:
+        if rssi < self._min:
+            self._min = rssi
+        self._acc += 1
+        if self._acc < self.sample_every:
+            return
+
+        self.rssi[self.samples % len(self.rssi)] = self._min if self._min >= -128 else -128
+        self.samples += 1
+        self._acc = 0
+        self._min = 127
+
+    def add_disconnect(self, reason: int | str) -> None:
+        k: str = str(reason)
+        if k not in self.disconnects and len(self.disconnects) >= self.max_reasons:
+            k = "other"
+        self.disconnects[k] = self.disconnects.get(k, 0) + 1
+
+    def to_dict(self) -> dict:
+        """ for the status feed - "rssi": the ring-entries since the previous call (oldest first) """
+        first: int = max(self._reported, self.samples - len(self.rssi))
+        new: list[int] = [self.rssi[i % len(self.rssi)] for i in range(first, self.samples)]
+        self._reported = self.samples
+
+        return {
+            "every_ms": self.every_ms,
+            "rssi": new,
+            "disconnects": self.disconnects,
+            "reconnect_ms": self.reconnect_ms.to_dict(),
+            "ping_ms": self.ping_ms.to_dict(),
+        }
+
+
+class WifiManager:
+    """ background-task (run()) next to the reconnect-controller: connection-state and events, a moving average of
+    the RSSI and roaming - when the average stays below roam_below_dbm for roam_hold_s, a scan looks for another
+    bssid of the same ssid that is at least roam_margin_db stronger and reconnects directly to it
+    (at most every roam_min_interval_s - the scan blocks for ~2s on the esp32)
+    """
+    def __init__(self, cfg: dict):
+        self.roaming_enabled: bool = cfg.get("enabled", False)
+        self.sample_ms: int = cfg.get("sample_ms", 2_000)
+        self.alpha: float = cfg.get("ema_alpha", 0.2)
+        self.roam_below_dbm: int = cfg.get("roam_below_dbm", -75)
+        self.roam_margin_db: int = cfg.get("roam_margin_db", 8)
+        self.roam_hold_ms: int = cfg.get("roam_hold_s", 30) * 1000
+        self.roam_min_interval_ms: int = cfg.get("roam_min_interval_s", 300) * 1000
+
+        self.state: str = "down"  # "down", "up" or "roaming"
+        self.rssi_avg: float | None = None
+        self.roams: int = 0
+
+        self._weak_since: int | None = None
+        self._last_roam: int | None = None
+        self._down_at: int | None = None
+        self._listeners: list = []
+
+    def add_listener(self, f) -> None:
+        """ f(event: str, info: dict) - events: "up", "down", "weak", "roaming", "roamed", "roam_failed" """
+        self._listeners.append(f)
+
+    def _emit(self, event: str, info: dict) -> None:
+        logger.info(f"wifi {event} {info}")
+        for f in self._listeners:
+            try:
+                f(event, info)
+            except Exception as ex:
+                logger.error(f"wifi-listener {f}: {ex!r}")
+
+    def sample(self) -> bool:
+        """ state + RSSI average -> True if it is time to look for a better bssid """
+        if wlan.isconnected():
+            if self.state == "down":
+                self.state = "up"
+                if self._down_at is not None:
+                    link.reconnect_ms.add(time.ticks_diff(time.ticks_ms(), self._down_at))
+                    self._down_at = None
+                self._emit("up", {"ssid": wlan.config("ssid")})
+        else:
+            if self.state == "up":
+                self.state = "down"
+                self.rssi_avg = None
+                self._weak_since = None
+                self._down_at = time.ticks_ms()
+                reason: int = wlan.status()
+                link.add_disconnect(reason)
+                self._emit("down", {"status": reason})
+            return False
+
+        rssi: int = wlan.status("rssi")
+        link.add_rssi(rssi)
+        self.rssi_avg = rssi if self.rssi_avg is None else self.rssi_avg + self.alpha * (rssi - self.rssi_avg)
+
+        if self.rssi_avg >= self.roam_below_dbm:
+            self._weak_since = None
+            return False
+
+        now: int = time.ticks_ms()
+        if self._weak_since is None:
+            self._weak_since = now
+            self._emit("weak", {"rssi_avg": round(self.rssi_avg)})
+
+        return (
+            self.roaming_enabled
+            and time.ticks_diff(now, self._weak_since) >= self.roam_hold_ms
+            and (self._last_roam is None or time.ticks_diff(now, self._last_roam) >= self.roam_min_interval_ms)
+        )
+
+    async def roam(self) -> bool:
+        """ directed reconnect to the strongest other bssid of the current ssid, if it is roam_margin_db better """
+        self._last_roam = time.ticks_ms()
+        if _current is None:
+            return False
+
+        w, bssid = _current
+        apssid: bytes = config.data[w]["SSID"].encode()
+        best: tuple | None = None
+        # the current RSSI of the others is needed here: always a fresh scan
+        for ssid, b, channel, RSSI in scan_cache.entries(0):
+            if ssid == apssid and b != bssid and (best is None or RSSI > best[1]):
+                best = (b, RSSI)
+
+        if best is None or best[1] < self.rssi_avg + self.roam_margin_db:
+            logger.info(f"no better bssid for {apssid} than {round(self.rssi_avg)}dBm")
+            return False
+
+        info: dict = {"from": None if bssid is None else ubinascii.hexlify(bssid).decode(),
+                      "to": ubinascii.hexlify(best[0]).decode(), "rssi_avg": round(self.rssi_avg), "rssi": best[1]}
+        # wifi.isconnected() stays True meanwhile, the reconnect-controller must not start a connect of its own
+        self.state = "roaming"
+        self._emit("roaming", info)
+
+        t0: int = time.ticks_ms()
+        wlan.disconnect()
+        _start_connect(w, best[0])
+        ok: bool = await _wait(_timeout_ms(w))
+
+        self.rssi_avg = None
+        self._weak_since = None
+        if ok:
+            self.state = "up"
+            self.roams += 1
+            _connected("roam", t0)
+            self._emit("roamed", info)
+        else:
+            # the reconnect-controller takes it from here
+            self.state = "down"
+            self._down_at = t0
+            link.add_disconnect("roam")
+            wlan.disconnect()
+            self._emit("roam_failed", info)
+        return ok
+
+    async def run(self) -> None:
+        while True:
+            try:
+                if self.sample():
+                    await self.roam()
+                elif self.state == "up" and scan_cache.refresh_ms:
+                    age: int | None = scan_cache.age_ms()
+                    if age is None or age >= scan_cache.refresh_ms:
+                        scan_cache.refresh()
+            except Exception as ex:
+                _out = io.StringIO()
+                sys.print_exception(ex)
+                sys.print_exception(ex, _out)
+
+                logger.error(_out.getvalue())
+
+            await asyncio.sleep_ms(self.sample_ms)
+
+
+manager: WifiManager = WifiManager(config.data.get("wifi_roaming", {}))
+
+_lc: dict = config.data.get("link_stats", {})
+link: LinkStats = LinkStats(ring_size=_lc.get("ring_size", 120), sample_every=_lc.get("sample_every", 5),
+                            every_ms=_lc.get("sample_every", 5) * manager.sample_ms)
 
-        if reset_if_wifi_fails:
-            logger.info("RESETTING...")
-            machine.reset()
 
 def start_web_repl():
     import webrepl